@@ -0,0 +1,728 @@
+"""Ingestion throughput benchmark.
+
+Runs each stage of the pipeline on its own and end to end over fixtures
+scaled from Data/Modified Data, and reports rows/sec, per-stage time and RSS
+growth as JSON so runs can be compared across commits:
+
+    python benchmark_ingestion.py --scale 4 --output bench.json
+    python benchmark_ingestion.py --sink db --metrics spo2,hrv
+
+Stages:
+    parse       SyntheticFitbitAdapter.get_data over a whole file (json.load)
+    filter      get_data for every day through the configured read path
+    flatten     process_metrics turning day records into record batches
+    insert      DBOperations.insert_records of the flattened batches
+    end_to_end  process_metrics with a BatchInserter, as ingestions.py runs it
+"""
+
+import os
+import sys
+import json
+import math
+import random
+import shutil
+import logging
+import argparse
+import platform
+import resource
+import tempfile
+import threading
+import subprocess
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+# Importing ingestions configures logging and resolves DATA_DIR
+import ingestions
+import db_operations
+from db_operations import DBOperations, BatchInserter
+from models import HealthMetricFactory
+from source_adapter import SyntheticFitbitAdapter, ParsedFileCache
+
+METRICS = [
+    "heart_rate",
+    "spo2",
+    "hrv",
+    "breathing_rate",
+    "active_zone_minutes",
+    "activity",
+]
+STAGES = ["parse", "filter", "flatten", "insert", "end_to_end"]
+TABLES = [
+    "heart_rate",
+    "heart_rate_zones",
+    "spo2",
+    "hrv",
+    "breathing_rate",
+    "active_zone_minutes",
+    "activity",
+]
+
+# First day of generated fixtures for metrics without a source file
+FIXTURE_START = datetime(2024, 1, 1)
+FIXTURE_BASE_DAYS = 30
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of the whole process so far"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def current_rss_mb() -> Optional[float]:
+    """Current resident set size, or None where /proc is not available"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+class RssSampler:
+    """Highest RSS while the block runs, sampled from a background thread.
+
+    ru_maxrss only ever grows, so after the first stage it no longer shows
+    what a stage itself needed. growth_mb is the stage's peak over the RSS
+    it started with, and is None where current RSS cannot be read.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.start = None
+        self.peak = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        rss = current_rss_mb()
+        if rss is not None and (self.peak is None or rss > self.peak):
+            self.peak = rss
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self):
+        self.start = current_rss_mb()
+        self.peak = self.start
+        if self.start is not None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._sample()
+        return False
+
+    @property
+    def growth_mb(self) -> Optional[float]:
+        if self.start is None:
+            return None
+        return self.peak - self.start
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL,
+            text=True,
+        ).strip()
+    except Exception:
+        return None
+
+
+# ---------------------------------------------------------------------------
+# Fixtures
+
+
+def generate_day(metric_type: str, day: datetime, rng: random.Random) -> Dict:
+    """One synthetic day record in the layout of the modified data files"""
+    date = day.strftime("%Y-%m-%d")
+    if metric_type == "heart_rate":
+        dataset = [
+            {
+                "time": f"{m // 60:02d}:{m % 60:02d}:00",
+                "value": int(65 + 15 * math.sin(m / 229) + rng.randint(-5, 5)),
+            }
+            for m in range(1440)
+        ]
+        zones = [
+            {"name": name, "min": low, "max": high, "minutes": rng.randint(0, 600),
+             "caloriesOut": round(rng.uniform(0, 1500), 2)}
+            for name, low, high in (
+                ("Out of Range", 30, 98),
+                ("Fat Burn", 98, 137),
+                ("Cardio", 137, 167),
+                ("Peak", 167, 220),
+            )
+        ]
+        return {
+            "heart_rate_day": [
+                {
+                    "activities-heart": [
+                        {
+                            "dateTime": date,
+                            "value": {
+                                "heartRateZones": zones,
+                                "restingHeartRate": rng.randint(55, 75),
+                            },
+                        }
+                    ],
+                    "activities-heart-intraday": {"dataset": dataset},
+                }
+            ]
+        }
+    if metric_type == "hrv":
+        # One reading a minute over a night's sleep
+        start = day + timedelta(minutes=rng.randint(0, 90), seconds=56)
+        minutes = [
+            {
+                "minute": (start + timedelta(minutes=m)).strftime(
+                    "%Y-%m-%dT%H:%M:%S.000"
+                ),
+                "value": {
+                    "rmssd": round(rng.uniform(20, 90), 3),
+                    "coverage": round(rng.uniform(0.8, 1.0), 3),
+                    "hf": round(rng.uniform(100, 1500), 3),
+                    "lf": round(rng.uniform(100, 1500), 3),
+                },
+            }
+            for m in range(420)
+        ]
+        return {"hrv": [{"minutes": minutes}]}
+    if metric_type == "active_zone_minutes":
+        minutes = []
+        for m in range(1440):
+            value = {"activeZoneMinutes": 0}
+            if rng.random() < 0.2:
+                zone = rng.choice(
+                    [
+                        "fatBurnActiveZoneMinutes",
+                        "cardioActiveZoneMinutes",
+                        "peakActiveZoneMinutes",
+                    ]
+                )
+                value = {zone: 1, "activeZoneMinutes": 1}
+            minutes.append({"minute": f"{m // 60:02d}:{m % 60:02d}:00", "value": value})
+        return {
+            "activities-active-zone-minutes-intraday": [
+                {"dateTime": date, "minutes": minutes}
+            ]
+        }
+    raise ValueError(f"No generator for {metric_type}")
+
+
+def build_fixtures(
+    source_dir: str,
+    fixtures_dir: str,
+    metrics: List[str],
+    users: List[str],
+    scale: int,
+    seed: int,
+) -> Dict[str, int]:
+    """Write scaled data files for every metric and user; returns days per metric.
+
+    Files present in source_dir are repeated scale times with their dates
+    shifted past the previous copy; metrics without a file there (heart rate,
+    HRV and AZM are kept out of the repository) are generated.
+    """
+    adapter = SyntheticFitbitAdapter(source_dir)
+    target = SyntheticFitbitAdapter(fixtures_dir)
+    rng = random.Random(seed)
+    days = {}
+
+    for metric_type in metrics:
+        source_path = adapter.get_file_path(metric_type, "1")
+        if os.path.exists(source_path):
+            with open(source_path) as f:
+                base = json.load(f)
+            dated = [(adapter._get_record_date(metric_type, r), r) for r in base]
+            dated = [(d, r) for d, r in dated if d]
+            first = min(datetime.strptime(d, "%Y-%m-%d") for d, _ in dated)
+            last = max(datetime.strptime(d, "%Y-%m-%d") for d, _ in dated)
+            span = (last - first).days + 1
+            texts = [(d, json.dumps(r)) for d, r in dated]
+            origin = "file"
+        else:
+            span = FIXTURE_BASE_DAYS
+            texts = [
+                (
+                    (FIXTURE_START + timedelta(days=i)).strftime("%Y-%m-%d"),
+                    json.dumps(
+                        generate_day(
+                            metric_type, FIXTURE_START + timedelta(days=i), rng
+                        )
+                    ),
+                )
+                for i in range(span)
+            ]
+            origin = "generated"
+
+        for user_id in users:
+            path = target.get_file_path(metric_type, user_id)
+            with open(path, "w") as f:
+                f.write("[\n")
+                written = 0
+                for copy in range(scale):
+                    for date, text in texts:
+                        shifted = (
+                            datetime.strptime(date, "%Y-%m-%d")
+                            + timedelta(days=copy * span)
+                        ).strftime("%Y-%m-%d")
+                        if written:
+                            f.write(",\n")
+                        # Day records only carry their own date (and the
+                        # following one for readings past midnight)
+                        next_date = (
+                            datetime.strptime(date, "%Y-%m-%d") + timedelta(days=1)
+                        ).strftime("%Y-%m-%d")
+                        next_shifted = (
+                            datetime.strptime(shifted, "%Y-%m-%d") + timedelta(days=1)
+                        ).strftime("%Y-%m-%d")
+                        f.write(
+                            text.replace(next_date, "\0")
+                            .replace(date, shifted)
+                            .replace("\0", next_shifted)
+                        )
+                        written += 1
+                f.write("\n]\n")
+        days[metric_type] = span * scale
+        logging.getLogger("Benchmark").info(
+            f"{metric_type}: {span * scale} days per user ({origin})"
+        )
+    return days
+
+
+# ---------------------------------------------------------------------------
+# Sinks
+
+
+class FakeCursor:
+    """Accepts statements and COPY streams without a database"""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        self.connection.statements += 1
+
+    def copy_expert(self, query, buffer):
+        self.connection.copied_bytes += len(buffer.read())
+
+    def fetchone(self):
+        # The merge query's (inserted, updated): every staged row is new
+        return (self.connection.staged_rows, 0)
+
+    def fetchall(self):
+        return []
+
+
+class FakeConnection:
+    closed = 0
+
+    def __init__(self):
+        self.statements = 0
+        self.copied_bytes = 0
+        self.staged_rows = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeDBOperations(DBOperations):
+    """DBOperations whose connection discards everything it is sent.
+
+    Every batch takes the COPY path, so the fake sink still measures grouping
+    and CSV formatting; execute_values needs a real connection to render.
+    """
+
+    def __init__(self, merge_mode="append"):
+        super().__init__(None, None, None, None, None, merge_mode=merge_mode)
+
+    def connect(self):
+        self.conn = FakeConnection()
+        return True
+
+    def ensure_users_and_devices(self, user_id, device_id=None):
+        pass
+
+    def _copy_rows(self, cursor, table, batches):
+        self.conn.staged_rows = sum(len(batch) for batch in batches)
+        super()._copy_rows(cursor, table, batches)
+
+
+def create_db(args):
+    if args.sink == "fake":
+        db_operations.COPY_THRESHOLD = 0
+        db = FakeDBOperations(merge_mode=args.merge)
+    else:
+        db = DBOperations(
+            ingestions.DB_HOST,
+            ingestions.DB_PORT,
+            ingestions.DB_NAME,
+            ingestions.DB_USER,
+            ingestions.DB_PASSWORD,
+            merge_mode=args.merge,
+        )
+    if not db.connect():
+        raise SystemExit("Could not connect to the database")
+    return db
+
+
+def cleanup_db(db, users: List[str]):
+    """Remove the benchmark users' rows from a real database"""
+    if isinstance(db, FakeDBOperations):
+        return
+    user_ids = [int(u) for u in users]
+    with db.conn.cursor() as cursor:
+        for table in TABLES:
+            cursor.execute(f"DELETE FROM {table} WHERE user_id = ANY(%s)", (user_ids,))
+        cursor.execute("DELETE FROM devices WHERE user_id = ANY(%s)", (user_ids,))
+        cursor.execute("DELETE FROM users WHERE user_id = ANY(%s)", (user_ids,))
+    db.conn.commit()
+
+
+# ---------------------------------------------------------------------------
+# Stages
+
+
+class PreloadedAdapter:
+    """Hands process_metrics data that was parsed beforehand"""
+
+    def __init__(self, data):
+        self.data = data
+
+    def get_data(self, metric_type, start_date, end_date, user_id="1"):
+        return self.data[(metric_type, user_id)]
+
+
+class CollectingSink:
+    """Stands in for BatchInserter.add and keeps the batches for the insert stage"""
+
+    def __init__(self):
+        self.batches = []
+
+    def add(self, batches):
+        self.batches.extend(batches)
+        return sum(len(batch) for batch in batches)
+
+
+def create_adapter(args, fixtures_dir):
+    return SyntheticFitbitAdapter(
+        fixtures_dir,
+        streaming=args.streaming,
+        use_index=args.date_index,
+        cache=(
+            ParsedFileCache(max_bytes=args.parse_cache_mb * 1024 * 1024)
+            if args.parse_cache_mb > 0
+            else None
+        ),
+    )
+
+
+def timed(func, repeats):
+    """Best wall time of repeats runs and the result of the last one"""
+    best = None
+    result = None
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def stage_result(seconds, rows, rss: RssSampler, **extra):
+    growth = rss.growth_mb
+    return {
+        "seconds": round(seconds, 6),
+        "rows": rows,
+        "rows_per_sec": round(rows / seconds, 1) if seconds > 0 else None,
+        "rss_growth_mb": round(growth, 1) if growth is not None else None,
+        "process_peak_rss_mb": round(peak_rss_mb(), 1),
+        **extra,
+    }
+
+
+def run_metric(args, metric_type, fixtures_dir, days, users, stages):
+    results = {}
+    first_day = FIXTURE_START
+    last_day = first_day + timedelta(days=days - 1)
+    factory = HealthMetricFactory()
+    parsed = {}
+    sink = CollectingSink()
+
+    if "parse" in stages or {"flatten", "insert"} & set(stages):
+        reader = SyntheticFitbitAdapter(fixtures_dir)
+
+        def parse():
+            for user_id in users:
+                parsed[(metric_type, user_id)] = reader.get_data(
+                    metric_type, None, None, user_id
+                )
+            return sum(len(records) for records in parsed.values())
+
+        with RssSampler() as rss:
+            seconds, rows = timed(parse, args.repeats)
+        if "parse" in stages:
+            results["parse"] = stage_result(seconds, rows, rss)
+
+    if "filter" in stages:
+
+        def filter_days():
+            adapter = create_adapter(args, fixtures_dir)
+            found = 0
+            for user_id in users:
+                for offset in range(days):
+                    day = first_day + timedelta(days=offset)
+                    found += len(adapter.get_data(metric_type, day, day, user_id))
+            return found
+
+        with RssSampler() as rss:
+            seconds, rows = timed(filter_days, args.repeats)
+        results["filter"] = stage_result(seconds, rows, rss, days=days * len(users))
+
+    if {"flatten", "insert"} & set(stages):
+        adapter = PreloadedAdapter(parsed)
+        fake_db = FakeDBOperations()
+
+        def flatten():
+            sink.batches = []
+            for user_id in users:
+                ingestions.process_metrics(
+                    adapter, factory, fake_db, metric_type,
+                    first_day, last_day, user_id, sink,
+                )
+            return sum(len(batch) for batch in sink.batches)
+
+        with RssSampler() as rss:
+            seconds, rows = timed(flatten, args.repeats)
+        if "flatten" in stages:
+            results["flatten"] = stage_result(seconds, rows, rss)
+
+    if "insert" in stages:
+        db = create_db(args)
+        for user_id in users:
+            db.ensure_users_and_devices(int(user_id), f"fitbit-device-{user_id}")
+
+        timings = []
+        rows = 0
+        with RssSampler() as rss:
+            for _ in range(args.repeats):
+                started = time.perf_counter()
+                rows = db.insert_records(sink.batches)
+                timings.append(time.perf_counter() - started)
+                cleanup_rows(db, metric_type, users)
+        extra = {}
+        if isinstance(db.conn, FakeConnection):
+            extra["copied_bytes"] = db.conn.copied_bytes // args.repeats
+        results["insert"] = stage_result(min(timings), rows, rss, **extra)
+        db.close()
+
+    if "end_to_end" in stages:
+        db = create_db(args)
+        timings = []
+        rows = 0
+        with RssSampler() as rss:
+            for _ in range(args.repeats):
+                adapter = create_adapter(args, fixtures_dir)
+                started = time.perf_counter()
+                rows = 0
+                for user_id in users:
+                    batcher = BatchInserter(db)
+                    ingestions.process_metrics(
+                        adapter, factory, db, metric_type,
+                        first_day, last_day, user_id, batcher,
+                    )
+                    batcher.checkpoint()
+                    rows += batcher.total_inserted
+                timings.append(time.perf_counter() - started)
+                cleanup_rows(db, metric_type, users)
+        results["end_to_end"] = stage_result(min(timings), rows, rss)
+        db.close()
+
+    sink.batches = []
+    parsed.clear()
+    return results
+
+
+def cleanup_rows(db, metric_type, users):
+    """Delete what a stage wrote for one metric so repeats start from empty"""
+    if isinstance(db, FakeDBOperations):
+        return
+    tables = {
+        "heart_rate": ["heart_rate", "heart_rate_zones"],
+    }.get(metric_type, [metric_type])
+    user_ids = [int(u) for u in users]
+    with db.conn.cursor() as cursor:
+        for table in tables:
+            cursor.execute(f"DELETE FROM {table} WHERE user_id = ANY(%s)", (user_ids,))
+    db.conn.commit()
+
+
+def summarize(results: Dict[str, Dict[str, Dict]]) -> Dict[str, Dict]:
+    """Totals per stage across metrics"""
+    totals = {}
+    for stage in STAGES:
+        entries = [r[stage] for r in results.values() if stage in r]
+        if not entries:
+            continue
+        seconds = sum(e["seconds"] for e in entries)
+        rows = sum(e["rows"] for e in entries)
+        totals[stage] = {
+            "seconds": round(seconds, 6),
+            "rows": rows,
+            "rows_per_sec": round(rows / seconds, 1) if seconds > 0 else None,
+        }
+    return totals
+
+
+def print_table(results, totals):
+    out = sys.stderr
+    print(f"\n{'Metric':<22} {'Stage':<12} {'Seconds':>10} {'Rows':>10} {'Rows/s':>12} {'RSS growth':>12}", file=out)
+    print("-" * 80, file=out)
+    for metric_type, stages in results.items():
+        for stage, r in stages.items():
+            growth = (
+                f"{r['rss_growth_mb']:.1f}MB" if r["rss_growth_mb"] is not None else "n/a"
+            )
+            print(
+                f"{metric_type:<22} {stage:<12} {r['seconds']:>10.3f} {r['rows']:>10} "
+                f"{r['rows_per_sec'] or 0:>12.0f} {growth:>12}",
+                file=out,
+            )
+    print("-" * 80, file=out)
+    for stage, r in totals.items():
+        print(
+            f"{'total':<22} {stage:<12} {r['seconds']:>10.3f} {r['rows']:>10} "
+            f"{r['rows_per_sec'] or 0:>12.0f}",
+            file=out,
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ingestion pipeline")
+    parser.add_argument(
+        "--source-dir", default=ingestions.DATA_DIR, help="Data files to scale"
+    )
+    parser.add_argument(
+        "--fixtures-dir", help="Where to write fixtures (default: a temporary directory)"
+    )
+    parser.add_argument(
+        "--scale", type=int, default=1, help="Copies of the source days per file"
+    )
+    parser.add_argument("--users", type=int, default=1, help="Users per metric")
+    parser.add_argument(
+        "--first-user-id",
+        type=int,
+        default=9001,
+        help="User id of the first benchmark user (kept clear of real users)",
+    )
+    parser.add_argument("--metrics", default=",".join(METRICS))
+    parser.add_argument("--stages", default=",".join(STAGES))
+    parser.add_argument("--sink", choices=["fake", "db"], default="fake")
+    parser.add_argument(
+        "--merge", choices=db_operations.MERGE_MODES, default="append"
+    )
+    parser.add_argument("--repeats", type=int, default=3, help="Best of N runs")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument(
+        "--streaming", action=argparse.BooleanOptionalAction, default=ingestions.STREAM_READS
+    )
+    parser.add_argument(
+        "--date-index", action=argparse.BooleanOptionalAction, default=ingestions.DATE_INDEX
+    )
+    parser.add_argument("--parse-cache-mb", type=int, default=ingestions.PARSE_CACHE_MB)
+    parser.add_argument(
+        "--log-level", default="WARNING", help="Pipeline log level during the run"
+    )
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(args.log_level.upper())
+    metrics = [m for m in args.metrics.split(",") if m]
+    stages = [s for s in args.stages.split(",") if s]
+    unknown = set(metrics) - set(METRICS) | set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"Unknown metrics/stages: {', '.join(sorted(unknown))}")
+    users = [str(args.first_user_id + i) for i in range(args.users)]
+
+    fixtures_dir = args.fixtures_dir or tempfile.mkdtemp(prefix="ingest-bench-")
+    os.makedirs(fixtures_dir, exist_ok=True)
+    try:
+        started = time.perf_counter()
+        days = build_fixtures(
+            args.source_dir, fixtures_dir, metrics, users, args.scale, args.seed
+        )
+        fixture_seconds = time.perf_counter() - started
+
+        results = {}
+        for metric_type in metrics:
+            results[metric_type] = run_metric(
+                args, metric_type, fixtures_dir, days[metric_type], users, stages
+            )
+    finally:
+        if not args.fixtures_dir:
+            shutil.rmtree(fixtures_dir, ignore_errors=True)
+
+    if args.sink == "db":
+        db = create_db(args)
+        cleanup_db(db, users)
+        db.close()
+
+    totals = summarize(results)
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "config": {
+            "scale": args.scale,
+            "users": args.users,
+            "sink": args.sink,
+            "merge": args.merge,
+            "repeats": args.repeats,
+            "streaming": args.streaming,
+            "date_index": args.date_index,
+            "parse_cache_mb": args.parse_cache_mb,
+            "days": days,
+            "fixture_seconds": round(fixture_seconds, 3),
+        },
+        "results": results,
+        "totals": totals,
+        "process_peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+    print_table(results, totals)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+        print(f"\nReport written to {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
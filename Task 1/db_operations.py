@@ -1,3 +1,4 @@
+import io
 import os
 import logging
 import psycopg2
@@ -5,49 +6,51 @@ from psycopg2.extras import execute_values
 from typing import Dict, List, Optional, Any
 from datetime import datetime, timezone
 
+from models import RecordBatch
+from metrics import metrics
+
 logger = logging.getLogger("DBOperations")
 
+# Batches at least this large are loaded with COPY instead of INSERT
+COPY_THRESHOLD = int(os.environ.get("COPY_THRESHOLD", "500"))
 
-def convert_to_utc(timestamp_input) -> datetime:
-    """Convert timestamp to UTC datetime (timezone-naive for database storage)"""
-    try:
-        # Handle different input types
-        if isinstance(timestamp_input, str):
-            # Parse string timestamp
-            if "T" in timestamp_input:
-                # ISO format: "2024-01-01T00:00:00" or "2024-01-01T00:00:00.000"
-                if "." in timestamp_input:
-                    dt = datetime.fromisoformat(timestamp_input.replace(".000", ""))
-                else:
-                    dt = datetime.fromisoformat(timestamp_input)
-            else:
-                # Date only format: "2024-01-01"
-                dt = datetime.strptime(timestamp_input, "%Y-%m-%d")
-        elif isinstance(timestamp_input, datetime):
-            dt = timestamp_input
-        else:
-            logger.error(f"Unsupported timestamp type: {type(timestamp_input)}")
-            return None
+# Pending rows/bytes at which BatchInserter writes a transaction
+BATCH_MAX_ROWS = int(os.environ.get("BATCH_MAX_ROWS", "50000"))
+BATCH_MAX_BYTES = int(os.environ.get("BATCH_MAX_BYTES", str(32 * 1024 * 1024)))
 
-        # If timezone-naive, assume it's UTC (since synthetic data is UTC)
-        if dt.tzinfo is None:
-            return dt
+# How rows are written: "append" inserts every row as is, "skip" and "update"
+# merge on the natural key so re-ingesting a day does not duplicate it
+MERGE_MODES = ("append", "skip", "update")
+INGEST_MERGE_MODE = os.environ.get("INGEST_MERGE_MODE", "append")
+
+# Natural key identifying a reading; tables not listed use DEFAULT_MERGE_KEYS
+DEFAULT_MERGE_KEYS = ["user_id", "device_id", "timestamp"]
+MERGE_KEYS = {
+    "heart_rate_zones": ["user_id", "device_id", "timestamp", "zone_name"],
+}
 
-        # Convert to UTC and remove timezone info for storage
-        return dt.astimezone(timezone.utc).replace(tzinfo=None)
-    except Exception as e:
-        logger.error(f"Error converting timestamp {timestamp_input} to UTC: {e}")
-        return None
+
+def _user_label(batches):
+    """User label of a table's batches for metrics ("mixed" across users)"""
+    users = {batch.user_id for batch in batches}
+    return str(users.pop()) if len(users) == 1 else "mixed"
 
 
 # Database operations class for interacting with TimescaleDB
 class DBOperations:
-    def __init__(self, host, port, dbname, user, password):
+    def __init__(
+        self, host, port, dbname, user, password, merge_mode=INGEST_MERGE_MODE
+    ):
+        if merge_mode not in MERGE_MODES:
+            raise ValueError(
+                f"Unknown merge mode {merge_mode!r}, expected one of {MERGE_MODES}"
+            )
         self.host = host
         self.port = port
         self.dbname = dbname
         self.user = user
         self.password = password
+        self.merge_mode = merge_mode
         self.conn = None
 
     def connect(self):
@@ -88,63 +91,206 @@ class DBOperations:
             self.conn.rollback()
             return None
 
-    def insert_records(self, records):
-        """Insert records into appropriate tables based on the 'table' field in each record"""
+    def insert_records(self, records, commit=True):
+        """Insert records into their tables.
+
+        records may mix RecordBatch objects and flat dicts carrying a 'table'
+        field; dicts are converted to batches first.
+        """
         if not records:
             return 0
 
-        # Group records by table
-        grouped_records = {}
-        for record in records:
-            table = record.pop("table", None)
-            if not table:
-                logger.error(f"Record is missing 'table' field: {record}")
-                continue
-
-            # Convert timestamp to UTC if present
-            if "timestamp" in record and record["timestamp"]:
-                timestamp = record["timestamp"]
-                if isinstance(timestamp, str):
-                    timestamp = convert_to_utc(timestamp)
-                elif timestamp.tzinfo is not None:
-                    timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
-                record["timestamp"] = timestamp
-
-            if table not in grouped_records:
-                grouped_records[table] = []
-            grouped_records[table].append(record)
-
         # Insert records for each table
         total_inserted = 0
-        for table, table_records in grouped_records.items():
-            inserted = self._insert_to_table(table, table_records)
+        for (table, _), batches in self.group_batches(records).items():
+            user = _user_label(batches)
+            with metrics.timer("insert", table, user):
+                inserted = self._insert_to_table(table, batches, commit=commit)
+            if commit:
+                metrics.inc("ingest_rows_inserted_total", inserted, metric=table, user=user)
             total_inserted += inserted
 
         return total_inserted
 
-    def _insert_to_table(self, table, records):
-        """Insert records to the specified table"""
-        if not records:
+    def group_batches(self, records):
+        """Group records into RecordBatches keyed by (table, column names)"""
+        batches = [r for r in records if isinstance(r, RecordBatch)]
+        flat_records = [r for r in records if not isinstance(r, RecordBatch)]
+        if flat_records:
+            batches += RecordBatch.from_records(flat_records)
+
+        grouped_batches = {}
+        for batch in batches:
+            if len(batch):
+                key = (batch.table, tuple(batch.column_names))
+                grouped_batches.setdefault(key, []).append(batch)
+        return grouped_batches
+
+    def _insert_to_table(self, table, batches, commit=True):
+        """Insert batches sharing the same columns into the specified table.
+
+        With commit=False the insert joins the caller's transaction and errors
+        are raised instead of being rolled back here.
+        """
+        rows = sum(len(batch) for batch in batches)
+        if not rows:
             return 0
 
+        if self.merge_mode != "append":
+            return self._merge_to_table(table, batches, commit=commit)
+
+        # Large batches go through COPY, small ones are not worth the setup
+        if rows >= COPY_THRESHOLD:
+            return self._copy_to_table(table, batches, commit=commit)
+
         try:
             with self.conn.cursor() as cursor:
-                # Dynamically generate the query based on the first record's keys
-                columns = list(records[0].keys())
-                placeholders = ", ".join([f"%({col})s" for col in columns])
+                columns = batches[0].column_names
                 query = f"""
                 INSERT INTO {table} ({", ".join(columns)})
                 VALUES %s
                 """
+                execute_values(
+                    cursor, query, [row for batch in batches for row in batch.rows()]
+                )
+                if commit:
+                    self.conn.commit()
+                logger.debug(f"Inserted {rows} records into {table}")
+                return rows
+        except Exception as e:
+            if not commit:
+                raise
+            logger.error(f"Error inserting into {table}: {e}")
+            self.conn.rollback()
+            return 0
 
-                template = f"({placeholders})"
-                execute_values(cursor, query, records, template)
-                inserted = len(records)
-                self.conn.commit()
-                logger.debug(f"Inserted {inserted} records into {table}")
+    def _copy_rows(self, cursor, table, batches):
+        """Stream batches into table with COPY FROM STDIN in CSV format"""
+        buffer = io.StringIO()
+        for batch in batches:
+            batch.write_csv(buffer)
+        buffer.seek(0)
+        cursor.copy_expert(
+            f"COPY {table} ({', '.join(batches[0].column_names)}) "
+            f"FROM STDIN WITH (FORMAT csv)",
+            buffer,
+        )
+
+    def _copy_to_table(self, table, batches, commit=True):
+        """Bulk load batches into the specified table with COPY FROM STDIN"""
+        try:
+            with self.conn.cursor() as cursor:
+                self._copy_rows(cursor, table, batches)
+                inserted = sum(len(batch) for batch in batches)
+                if commit:
+                    self.conn.commit()
+                logger.debug(f"Copied {inserted} records into {table}")
                 return inserted
         except Exception as e:
-            logger.error(f"Error inserting into {table}: {e}")
+            if not commit:
+                raise
+            logger.error(f"Error copying into {table}: {e}")
+            self.conn.rollback()
+            return 0
+
+    def _merge_to_table(self, table, batches, commit=True):
+        """Load batches into a staging table and merge them on the natural key.
+
+        The batch is COPYed into a temporary staging table, de-duplicated on
+        the key and merged with one statement: rows whose key already exists
+        are skipped ("skip") or overwritten ("update"), the rest are inserted.
+        """
+        keys = MERGE_KEYS.get(table.lower(), DEFAULT_MERGE_KEYS)
+        columns = batches[0].column_names
+        rows = sum(len(batch) for batch in batches)
+        missing = [key for key in keys if key not in columns]
+        if missing:
+            logger.error(f"Cannot merge into {table}: records lack {missing}")
+            if not commit:
+                raise ValueError(f"{table} records lack merge key columns {missing}")
+            return 0
+
+        staging = f"staging_{table.lower()}"
+        column_list = ", ".join(columns)
+        key_list = ", ".join(keys)
+        # user_id and timestamp are never NULL and hit IDX_<TABLE>_USER_TIMESTAMP;
+        # the remaining key columns may be NULL and are compared NULL-safe
+        match = " AND ".join(
+            f"t.{key} = b.{key}"
+            if key in ("user_id", "timestamp")
+            else f"t.{key} IS NOT DISTINCT FROM b.{key}"
+            for key in keys
+        )
+        # The batch's time span lets TimescaleDB exclude chunks at plan time
+        spans = [batch.time_span() for batch in batches]
+        span = (min(start for start, _ in spans), max(end for _, end in spans))
+        updates = [col for col in columns if col not in keys]
+
+        batch_cte = f"""batch AS (
+                SELECT DISTINCT ON ({key_list}) {column_list}
+                FROM {staging}
+                ORDER BY {key_list}
+            )"""
+        if self.merge_mode == "update" and updates:
+            query = f"""
+            WITH {batch_cte},
+            updated AS (
+                UPDATE {table} t
+                SET {", ".join(f"{col} = b.{col}" for col in updates)}
+                FROM batch b
+                WHERE {match} AND t.timestamp BETWEEN %s AND %s
+                RETURNING {", ".join(f"t.{key}" for key in keys)}
+            ),
+            inserted AS (
+                INSERT INTO {table} ({column_list})
+                SELECT {column_list} FROM batch b
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM updated t WHERE {match}
+                )
+                RETURNING 1
+            )
+            SELECT
+                (SELECT COUNT(*) FROM inserted),
+                (SELECT COUNT(*) FROM batch) - (SELECT COUNT(*) FROM inserted)
+            """
+        else:
+            query = f"""
+            WITH {batch_cte},
+            inserted AS (
+                INSERT INTO {table} ({column_list})
+                SELECT {column_list} FROM batch b
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM {table} t
+                    WHERE {match} AND t.timestamp BETWEEN %s AND %s
+                )
+                RETURNING 1
+            )
+            SELECT (SELECT COUNT(*) FROM inserted), 0
+            """
+
+        try:
+            with self.conn.cursor() as cursor:
+                # A session-local staging table, created once and emptied on commit
+                cursor.execute(
+                    f"CREATE TEMP TABLE IF NOT EXISTS {staging} ON COMMIT DELETE ROWS "
+                    f"AS SELECT * FROM {table} WITH NO DATA"
+                )
+                cursor.execute(f"TRUNCATE {staging}")
+                self._copy_rows(cursor, staging, batches)
+                cursor.execute(query, span)
+                inserted, updated = cursor.fetchone()
+                if commit:
+                    self.conn.commit()
+                logger.debug(
+                    f"Merged {rows} records into {table}: "
+                    f"{inserted} inserted, {updated} updated, "
+                    f"{rows - inserted - updated} skipped"
+                )
+                return inserted + updated
+        except Exception as e:
+            if not commit:
+                raise
+            logger.error(f"Error merging into {table}: {e}")
             self.conn.rollback()
             return 0
 
@@ -199,3 +345,83 @@ class DBOperations:
             ON CONFLICT (device_id) DO NOTHING;
             """
             self.execute_query(device_query, (device_id, user_id, "Fitbit", "Charge 6"))
+
+
+class BatchInserter:
+    """Accumulates record batches per table and writes them in large transactions.
+
+    Rows are held until BATCH_MAX_ROWS rows or BATCH_MAX_BYTES of column
+    data are pending, then every table is written in a single transaction.
+    Callers flush (or checkpoint) once more at the end of a run.
+    """
+
+    def __init__(self, db, max_rows=BATCH_MAX_ROWS, max_bytes=BATCH_MAX_BYTES):
+        self.db = db
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.pending = {}
+        self.pending_rows = 0
+        self.pending_bytes = 0
+        self.total_inserted = 0
+        self.flushes = 0
+        self._failed_since_checkpoint = False
+
+    def add(self, records):
+        """Queue records for insertion, flushing if a threshold is reached"""
+        if not records:
+            return 0
+
+        queued = 0
+        for key, batches in self.db.group_batches(records).items():
+            self.pending.setdefault(key, []).extend(batches)
+            for batch in batches:
+                self.pending_rows += len(batch)
+                self.pending_bytes += batch.nbytes
+                queued += len(batch)
+
+        if self.pending_rows >= self.max_rows or self.pending_bytes >= self.max_bytes:
+            self.flush()
+
+        return queued
+
+    def flush(self):
+        """Write all pending rows in one transaction and return the rows inserted"""
+        if not self.pending:
+            return 0
+
+        rows = self.pending_rows
+        try:
+            inserted = 0
+            written = []
+            for (table, _), batches in self.pending.items():
+                user = _user_label(batches)
+                with metrics.timer("insert", table, user):
+                    count = self.db._insert_to_table(table, batches, commit=False)
+                written.append((table, user, count))
+                inserted += count
+            self.db.conn.commit()
+            self.flushes += 1
+            for table, user, count in written:
+                metrics.inc("ingest_rows_inserted_total", count, metric=table, user=user)
+            logger.debug(
+                f"Flushed {inserted} records across {len(self.pending)} tables"
+            )
+        except Exception as e:
+            logger.error(f"Error flushing batch of {rows} records, rolled back: {e}")
+            self.db.conn.rollback()
+            self._failed_since_checkpoint = True
+            inserted = 0
+        finally:
+            self.pending = {}
+            self.pending_rows = 0
+            self.pending_bytes = 0
+
+        self.total_inserted += inserted
+        return inserted
+
+    def checkpoint(self):
+        """Flush pending rows and report whether every flush since the last checkpoint succeeded"""
+        self.flush()
+        succeeded = not self._failed_since_checkpoint
+        self._failed_since_checkpoint = False
+        return succeeded
@@ -5,15 +5,25 @@ import sys
 from datetime import datetime, timedelta, timezone
 import time
 import json
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from typing import Dict, List, Optional
 
-from source_adapter import SourceAdapterFactory
+from source_adapter import SourceAdapterFactory, ParsedFileCache
 from models import HealthMetricFactory
-from db_operations import DBOperations
+from timeutils import convert_to_utc
+from metrics import metrics, METRICS_PORT
+from db_operations import (
+    DBOperations,
+    BatchInserter,
+    INGEST_MERGE_MODE,
+    MERGE_MODES,
+)
+
+# Log level of the pipeline (--debug switches to DEBUG)
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
 
-# Configure more detailed logging
 logging.basicConfig(
-    level=logging.DEBUG,
+    level=LOG_LEVEL,
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
     handlers=[
         logging.FileHandler("ingestion_debug.log"),
@@ -49,6 +59,15 @@ print(f"Using data directory: {DATA_DIR}")
 TIMESTAMP_FILE = os.environ.get("TIMESTAMP_FILE", "last_run_timestamp.txt")
 TEST_MODE = os.environ.get("TEST_MODE", "false").lower() == "true"
 TEST_INTERVAL = int(os.environ.get("TEST_INTERVAL", "300"))  # 5 minutes in seconds
+# Read data files incrementally instead of loading each file whole per call
+STREAM_READS = os.environ.get("STREAM_READS", "true").lower() == "true"
+# Seek directly to a day's record through a per-file date index sidecar
+DATE_INDEX = os.environ.get("DATE_INDEX", "true").lower() == "true"
+INDEX_DIR = os.environ.get("INDEX_DIR")  # Defaults to the data directory
+# Memory ceiling of the parsed file cache in MB of source JSON (0 disables it)
+PARSE_CACHE_MB = int(os.environ.get("PARSE_CACHE_MB", "256"))
+# Number of worker processes for (user, metric) units (1 = sequential)
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", "1"))
 
 
 def initialize_database(db_conn):
@@ -82,43 +101,12 @@ def initialize_database(db_conn):
         return False
 
 
-# Add UTC conversion utilities
-def convert_to_utc(timestamp_input) -> datetime:
-    """Convert timestamp to UTC datetime (timezone-naive for database storage)"""
-    try:
-        # Handle different input types
-        if isinstance(timestamp_input, str):
-            # Parse string timestamp
-            if "T" in timestamp_input:
-                # ISO format: "2024-01-01T00:00:00" or "2024-01-01T00:00:00.000"
-                if "." in timestamp_input:
-                    dt = datetime.fromisoformat(timestamp_input.replace(".000", ""))
-                else:
-                    dt = datetime.fromisoformat(timestamp_input)
-            else:
-                # Date only format: "2024-01-01"
-                dt = datetime.strptime(timestamp_input, "%Y-%m-%d")
-        elif isinstance(timestamp_input, datetime):
-            dt = timestamp_input
-        else:
-            logger.error(f"Unsupported timestamp type: {type(timestamp_input)}")
-            return None
-
-        # If timezone-naive, assume it's UTC (since synthetic data is UTC)
-        if dt.tzinfo is None:
-            # Return as timezone-naive UTC for database storage
-            return dt
-
-        # Convert to UTC and remove timezone info for storage
-        return dt.astimezone(timezone.utc).replace(tzinfo=None)
-    except Exception as e:
-        logger.error(f"Error converting timestamp {timestamp_input} to UTC: {e}")
-        return None
-
-
 # Add debugging function
 def debug_data(msg, data, truncate=True):
     """Log data for debugging purposes with option to truncate for readability"""
+    # Serializing the payload is the expensive part; skip it unless it is logged
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
     if isinstance(data, list) and truncate and len(data) > 3:
         data_str = json.dumps(data[:3]) + f"... ({len(data)} items total)"
     elif isinstance(data, dict) and truncate and len(data) > 10:
@@ -215,6 +203,22 @@ def write_timestamp(metric_type: str, timestamp: datetime, user_id: str = "1"):
         db.close()
 
 
+def commit_and_write_timestamps(batcher, completed, user_id: str = "1") -> bool:
+    """Flush batched rows, then advance timestamps for the (metric_type, timestamp) pairs they cover."""
+    if not batcher.checkpoint():
+        logger.error(
+            f"Failed to commit batched records for user {user_id}; not advancing timestamps for {[m for m, _ in completed]}"
+        )
+        return False
+
+    for metric_type, timestamp in completed:
+        write_timestamp(metric_type, timestamp, user_id)
+        logger.info(
+            f"Updated {metric_type} timestamp to {timestamp.date()} for user {user_id}"
+        )
+    return True
+
+
 def process_metrics(
     adapter,
     metric_factory,
@@ -223,14 +227,21 @@ def process_metrics(
     start_date: datetime,
     end_date: datetime,
     user_id: str = "1",
+    batcher: Optional[BatchInserter] = None,
 ):
-    """Process metrics for a specific type and date range, using flat records."""
+    """Process metrics for a specific type and date range, using record batches.
+
+    When a batcher is given, rows are queued on it rather than committed per
+    record; the caller is responsible for flushing it.
+    """
     logger.info(
         f"Processing {metric_type} metrics from {start_date} to {end_date} for user {user_id}"
     )
 
     # Get raw data from adapter
-    raw_data = adapter.get_data(metric_type, start_date, end_date, user_id)
+    with metrics.timer("read", metric_type, user_id):
+        raw_data = adapter.get_data(metric_type, start_date, end_date, user_id)
+    metrics.inc("ingest_records_read_total", len(raw_data), metric=metric_type, user=user_id)
 
     # Debug raw data
     debug_data(f"Raw {metric_type} data for user {user_id}", raw_data)
@@ -260,6 +271,24 @@ def process_metrics(
 
     factory_metric_type = metric_type_mapping.get(metric_type, metric_type)
 
+    write_records = batcher.add if batcher is not None else db.insert_records
+
+    def flatten(data):
+        """Column-wise record batches for one day record"""
+        with metrics.timer("flatten", metric_type, user_id):
+            metric = metric_factory.create_metric(
+                factory_metric_type, int(user_id), device_id
+            )
+            metric.set_data(data)
+            batches = metric.get_record_batches()
+        metrics.inc(
+            "ingest_rows_flattened_total",
+            sum(len(batch) for batch in batches),
+            metric=metric_type,
+            user=user_id,
+        )
+        return batches
+
     try:
         # Process each data point based on metric type
         if metric_type == "heart_rate":
@@ -268,15 +297,9 @@ def process_metrics(
                 heart_day = item.get("heart_rate_day", [])
                 for day_data in heart_day:
                     try:
-                        metric = metric_factory.create_metric(
-                            factory_metric_type, int(user_id), device_id
-                        )
-                        metric.set_data(day_data)
-
-                        # Get flattened records for this day
-                        flat_records = metric.get_flat_records()
-                        if flat_records:
-                            inserted = db.insert_records(flat_records)
+                        batches = flatten(day_data)
+                        if batches:
+                            inserted = write_records(batches)
                             total_records += inserted
                             logger.debug(
                                 f"Inserted {inserted} flattened records for heart rate"
@@ -293,15 +316,9 @@ def process_metrics(
                 azm_list = item.get("activities-active-zone-minutes-intraday", [])
                 for azm_data in azm_list:
                     try:
-                        metric = metric_factory.create_metric(
-                            factory_metric_type, int(user_id), device_id
-                        )
-                        metric.set_data(azm_data)
-
-                        # Get flattened records
-                        flat_records = metric.get_flat_records()
-                        if flat_records:
-                            inserted = db.insert_records(flat_records)
+                        batches = flatten(azm_data)
+                        if batches:
+                            inserted = write_records(batches)
                             total_records += inserted
                             logger.debug(
                                 f"Inserted {inserted} flattened records for AZM"
@@ -318,15 +335,9 @@ def process_metrics(
                 br_list = item.get("br", [])
                 for br_data in br_list:
                     try:
-                        metric = metric_factory.create_metric(
-                            factory_metric_type, int(user_id), device_id
-                        )
-                        metric.set_data(br_data)
-
-                        # Get flattened records
-                        flat_records = metric.get_flat_records()
-                        if flat_records:
-                            inserted = db.insert_records(flat_records)
+                        batches = flatten(br_data)
+                        if batches:
+                            inserted = write_records(batches)
                             total_records += inserted
                             logger.debug(
                                 f"Inserted {inserted} flattened records for breathing rate"
@@ -343,15 +354,9 @@ def process_metrics(
                 hrv_list = item.get("hrv", [])
                 for hrv_data in hrv_list:
                     try:
-                        metric = metric_factory.create_metric(
-                            factory_metric_type, int(user_id), device_id
-                        )
-                        metric.set_data(hrv_data)
-
-                        # Get flattened records
-                        flat_records = metric.get_flat_records()
-                        if flat_records:
-                            inserted = db.insert_records(flat_records)
+                        batches = flatten(hrv_data)
+                        if batches:
+                            inserted = write_records(batches)
                             total_records += inserted
                             logger.debug(
                                 f"Inserted {inserted} flattened records for HRV"
@@ -366,15 +371,9 @@ def process_metrics(
             # SpO2 and Activity have similar structure
             for item in raw_data:
                 try:
-                    metric = metric_factory.create_metric(
-                        factory_metric_type, int(user_id), device_id
-                    )
-                    metric.set_data(item)
-
-                    # Get flattened records
-                    flat_records = metric.get_flat_records()
-                    if flat_records:
-                        inserted = db.insert_records(flat_records)
+                    batches = flatten(item)
+                    if batches:
+                        inserted = write_records(batches)
                         total_records += inserted
                         logger.debug(
                             f"Inserted {inserted} flattened records for {metric_type}"
@@ -396,6 +395,115 @@ def process_metrics(
         logger.error(traceback.format_exc())
 
 
+def create_adapter():
+    """Create the source adapter configured from the environment."""
+    return SourceAdapterFactory.create_adapter(
+        "synthetic",
+        data_dir=DATA_DIR,
+        streaming=STREAM_READS,
+        use_index=DATE_INDEX,
+        index_dir=INDEX_DIR,
+        cache=(
+            ParsedFileCache(max_bytes=PARSE_CACHE_MB * 1024 * 1024)
+            if PARSE_CACHE_MB > 0
+            else None
+        ),
+    )
+
+
+# Per-process state of ingestion workers, set up by init_worker
+_worker_adapter = None
+_worker_db = None
+
+
+def init_worker(merge_mode: str = INGEST_MERGE_MODE):
+    """Give each worker process its own adapter and database connection."""
+    global _worker_adapter, _worker_db
+    _worker_adapter = create_adapter()
+    _worker_db = DBOperations(
+        DB_HOST, DB_PORT, DB_NAME, DB_USER, DB_PASSWORD, merge_mode=merge_mode
+    )
+    _worker_db.connect()
+
+
+def run_ingestion_unit(
+    user_id: str,
+    metric_type: str,
+    start_date: datetime,
+    end_date: datetime,
+    next_timestamp: datetime,
+) -> Dict:
+    """Ingest one (user, metric) unit inside a worker process and commit it."""
+    result = {
+        "user_id": user_id,
+        "metric_type": metric_type,
+        "next_timestamp": next_timestamp,
+        "success": False,
+        "inserted": 0,
+    }
+
+    if _worker_db.conn is None or _worker_db.conn.closed:
+        if not _worker_db.connect():
+            logger.error(f"Worker could not connect for {metric_type} user {user_id}")
+            return result
+
+    batcher = BatchInserter(_worker_db)
+    try:
+        process_metrics(
+            _worker_adapter,
+            HealthMetricFactory(),
+            _worker_db,
+            metric_type,
+            start_date,
+            end_date,
+            user_id,
+            batcher,
+        )
+        result["success"] = batcher.checkpoint()
+        result["inserted"] = batcher.total_inserted
+    except Exception as e:
+        logger.error(f"Worker failed on {metric_type} for user {user_id}: {e}")
+        import traceback
+
+        logger.error(traceback.format_exc())
+    # Hand this unit's metrics to the parent, which merges them into the run's
+    result["metrics"] = metrics.drain()
+    return result
+
+
+def run_units_in_pool(pool: ProcessPoolExecutor, units: List[tuple]) -> List[Dict]:
+    """Fan (user, metric) units out to the pool and advance timestamps as each commits.
+
+    Each unit is (user_id, metric_type, start_date, end_date, next_timestamp).
+    last_processed_dates is only updated for units whose rows were committed.
+    """
+    futures = {pool.submit(run_ingestion_unit, *unit): unit for unit in units}
+    results = []
+    for future in as_completed(futures):
+        user_id, metric_type = futures[future][:2]
+        try:
+            result = future.result()
+        except Exception as e:
+            logger.error(f"Worker crashed on {metric_type} for user {user_id}: {e}")
+            result = {"user_id": user_id, "metric_type": metric_type, "success": False}
+        metrics.merge(result.get("metrics"))
+
+        if result["success"]:
+            write_timestamp(metric_type, result["next_timestamp"], user_id)
+            logger.info(
+                f"Committed {result['inserted']} {metric_type} records for user {user_id}, timestamp now {result['next_timestamp'].date()}"
+            )
+        else:
+            logger.error(
+                f"{metric_type} for user {user_id} did not commit; timestamp not advanced"
+            )
+        results.append(result)
+
+    failed = sum(1 for r in results if not r["success"])
+    logger.info(f"Worker pool finished {len(results)} units ({failed} failed)")
+    return results
+
+
 def main():
     print(f"Current working directory: {os.getcwd()}")
     print(f"Data directory: {DATA_DIR}")
@@ -443,6 +551,18 @@ def main():
         action="store_true",
         help="Clear all stored data and start fresh from 2024-01-01",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=INGEST_WORKERS,
+        help="Number of worker processes for (user, metric) units (1 = sequential)",
+    )
+    parser.add_argument(
+        "--merge",
+        choices=MERGE_MODES,
+        default=INGEST_MERGE_MODE,
+        help="append every row, or merge on (user, device, timestamp) and skip/update existing rows",
+    )
 
     args = parser.parse_args()
 
@@ -460,16 +580,24 @@ def main():
         except Exception as e:
             logger.error(f"Failed to fix file mappings: {e}")
 
+    if METRICS_PORT:
+        metrics.start_http_server(METRICS_PORT)
+
     # Initialize components
-    adapter = SourceAdapterFactory.create_adapter("synthetic", data_dir=DATA_DIR)
+    adapter = create_adapter()
     metric_factory = HealthMetricFactory()
-    db = DBOperations(DB_HOST, DB_PORT, DB_NAME, DB_USER, DB_PASSWORD)
+    db = DBOperations(
+        DB_HOST, DB_PORT, DB_NAME, DB_USER, DB_PASSWORD, merge_mode=args.merge
+    )
 
     # Connect to database
     if not db.connect():
         logger.error("Failed to connect to database. Exiting.")
         return
 
+    # Accumulate rows across days and metrics into a few large transactions
+    batcher = BatchInserter(db)
+
     # Initialize database schema if needed
     if not initialize_database(db):
         logger.warning("Database schema initialization had issues, but continuing...")
@@ -586,6 +714,15 @@ def main():
 
     logger.info(f"Processing data for users with available data: {available_data}")
 
+    pool = None
+    if args.workers > 1:
+        logger.info(f"Using a pool of {args.workers} ingestion workers")
+        pool = ProcessPoolExecutor(
+            max_workers=args.workers,
+            initializer=init_worker,
+            initargs=(args.merge,),
+        )
+
     try:
         # Handle test mode - process one day at a time with 2 minute intervals
         if args.test_mode:
@@ -600,29 +737,45 @@ def main():
                     f"-- Test run for date: {current_date.strftime('%Y-%m-%d')} --"
                 )
 
-                for user_id in user_ids:
-                    if not available_data[user_id]:
-                        continue
+                if pool is not None:
+                    next_day = current_date + timedelta(days=1)
+                    run_units_in_pool(
+                        pool,
+                        [
+                            (user_id, metric_type, current_date, current_date, next_day)
+                            for user_id in user_ids
+                            for metric_type in available_data[user_id]
+                        ],
+                    )
+                else:
+                    for user_id in user_ids:
+                        if not available_data[user_id]:
+                            continue
 
-                    for metric_type in available_data[user_id]:
-                        logger.info(
-                            f"Processing {metric_type} for User {user_id} on {current_date.date()}"
-                        )
+                        next_day = current_date + timedelta(days=1)
+                        completed = []
+                        for metric_type in available_data[user_id]:
+                            logger.info(
+                                f"Processing {metric_type} for User {user_id} on {current_date.date()}"
+                            )
 
-                        # Process metrics for the current date
-                        process_metrics(
-                            adapter,
-                            metric_factory,
-                            db,
-                            metric_type,
-                            current_date,
-                            current_date,
-                            user_id,
-                        )
+                            # Process metrics for the current date
+                            process_metrics(
+                                adapter,
+                                metric_factory,
+                                db,
+                                metric_type,
+                                current_date,
+                                current_date,
+                                user_id,
+                                batcher,
+                            )
+                            completed.append((metric_type, next_day))
 
-                        # Update timestamp for next run
-                        next_day = current_date + timedelta(days=1)
-                        write_timestamp(metric_type, next_day, user_id)
+                        # Commit the day's rows, then update timestamps for next run
+                        commit_and_write_timestamps(batcher, completed, user_id)
+
+                metrics.export()
 
                 # Move to the next day
                 current_date += timedelta(days=1)
@@ -644,45 +797,68 @@ def main():
             logger.info("Running in catch-up mode - importing data up to 2024-01-30")
             end_date = datetime(2024, 1, 30)
 
-            for user_id in user_ids:
-                if not available_data[user_id]:
-                    continue
+            if pool is not None:
+                units = []
+                for user_id in user_ids:
+                    for metric_type in available_data[user_id]:
+                        start_date = read_last_timestamp(metric_type, user_id)
+                        if start_date >= end_date:
+                            logger.info(
+                                f"Skipping {metric_type} for user {user_id} - already up to date"
+                            )
+                            continue
+                        units.append(
+                            (
+                                user_id,
+                                metric_type,
+                                start_date,
+                                end_date,
+                                end_date + timedelta(days=1),
+                            )
+                        )
+                run_units_in_pool(pool, units)
+            else:
+                for user_id in user_ids:
+                    if not available_data[user_id]:
+                        continue
 
-                logger.info(f"==== Catching up data for User {user_id} ====")
+                    logger.info(f"==== Catching up data for User {user_id} ====")
 
-                for metric_type in available_data[user_id]:
-                    # Get the last processed date
-                    start_date = read_last_timestamp(metric_type, user_id)
+                    completed = []
+                    for metric_type in available_data[user_id]:
+                        # Get the last processed date
+                        start_date = read_last_timestamp(metric_type, user_id)
+
+                        # If the start date is already past the end date, skip
+                        if start_date >= end_date:
+                            logger.info(
+                                f"Skipping {metric_type} for user {user_id} - already up to date"
+                            )
+                            continue
 
-                    # If the start date is already past the end date, skip
-                    if start_date >= end_date:
                         logger.info(
-                            f"Skipping {metric_type} for user {user_id} - already up to date"
+                            f"Catching up {metric_type} for user {user_id} from {start_date} to {end_date}"
                         )
-                        continue
 
-                    logger.info(
-                        f"Catching up {metric_type} for user {user_id} from {start_date} to {end_date}"
-                    )
+                        # Process data for the entire range
+                        process_metrics(
+                            adapter,
+                            metric_factory,
+                            db,
+                            metric_type,
+                            start_date,
+                            end_date,
+                            user_id,
+                            batcher,
+                        )
 
-                    # Process data for the entire range
-                    process_metrics(
-                        adapter,
-                        metric_factory,
-                        db,
-                        metric_type,
-                        start_date,
-                        end_date,
-                        user_id,
-                    )
+                        # Timestamp moves to the day after end_date once committed
+                        completed.append((metric_type, end_date + timedelta(days=1)))
+                        logger.info(
+                            f"Completed catching up {metric_type} data for user {user_id}"
+                        )
 
-                    # Update timestamp to the day after end_date
-                    next_day = end_date + timedelta(days=1)
-                    write_timestamp(metric_type, next_day, user_id)
-                    logger.info(f"Updated timestamp to {next_day.date()} for next run")
-                    logger.info(
-                        f"Completed catching up {metric_type} data for user {user_id}"
-                    )
+                    commit_and_write_timestamps(batcher, completed, user_id)
 
             logger.info("Catch-up mode complete.")
             # Exit after catch-up mode completes - no need to continue to regular processing
@@ -690,6 +866,23 @@ def main():
             return
 
         # Normal processing mode - process one day at a time
+        elif pool is not None:
+            # Process one day per (user, metric) unit in the worker pool
+            units = []
+            for user_id in user_ids:
+                for metric_type in available_data[user_id]:
+                    target_date = read_last_timestamp(metric_type, user_id)
+                    units.append(
+                        (
+                            user_id,
+                            metric_type,
+                            target_date,
+                            target_date,
+                            target_date + timedelta(days=1),
+                        )
+                    )
+            run_units_in_pool(pool, units)
+
         else:
             # Process each user and metric type
             for user_id in user_ids:
@@ -699,6 +892,7 @@ def main():
 
                 logger.info(f"==== Processing data for User {user_id} ====")
 
+                completed = []
                 for metric_type in available_data[user_id]:
                     logger.info(f"-- Processing {metric_type} for User {user_id} --")
 
@@ -719,17 +913,18 @@ def main():
                         target_date,
                         target_date,
                         user_id,
+                        batcher,
                     )
 
-                    # Update timestamp to next day
-                    next_day = target_date + timedelta(days=1)
-                    write_timestamp(metric_type, next_day, user_id)
-                    logger.info(f"Updated timestamp to {next_day.date()} for next run")
+                    # Timestamp moves to the next day once committed
+                    completed.append((metric_type, target_date + timedelta(days=1)))
 
                     logger.info(
                         f"Completed processing {metric_type} data for user {user_id}"
                     )
 
+                commit_and_write_timestamps(batcher, completed, user_id)
+
     except KeyboardInterrupt:
         logger.info("Ingestion interrupted by user")
     except Exception as e:
@@ -738,6 +933,11 @@ def main():
 
         traceback.print_exc()
     finally:
+        if pool is not None:
+            pool.shutdown()
+        if adapter.cache_stats() is not None:
+            logger.info(f"Parsed file cache stats: {adapter.cache_stats()}")
+        metrics.export(final=True)
         db.close()
 
 
@@ -0,0 +1,261 @@
+import os
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+logger = logging.getLogger("Metrics")
+
+# Prometheus text file written after each run, e.g. for node_exporter's
+# textfile collector (unset: not written)
+METRICS_FILE = os.environ.get("METRICS_FILE")
+# Port of the /metrics HTTP endpoint (0 disables it)
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "0"))
+# JSON summary written at the end of each run (unset: only logged)
+METRICS_SUMMARY_FILE = os.environ.get("METRICS_SUMMARY_FILE")
+
+COUNTERS = {
+    "ingest_records_read_total": "Day records returned by the source adapter",
+    "ingest_bytes_parsed_total": "Bytes of source JSON decoded",
+    "ingest_rows_flattened_total": "Rows produced by flattening day records",
+    "ingest_rows_inserted_total": "Rows committed to the database",
+}
+HISTOGRAMS = {
+    "ingest_stage_seconds": "Latency of an ingestion stage",
+}
+# Upper bounds of the latency histogram buckets in seconds
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0)
+
+
+def _labels_key(labels: Dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: tuple, extra: str = "") -> str:
+    parts = [f'{k}="{v}"' for k, v in key]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class IngestMetrics:
+    """Counters and latency histograms of the ingestion pipeline.
+
+    Series are labelled by metric (or table) and user. Updates are a dict
+    lookup under a lock, so instrumenting per day or per batch is cheap.
+    Worker processes drain() their values into their result and the parent
+    merge()s them, so the parent's registry covers the whole run.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            # (name, labels key) -> value
+            self.counters: Dict[tuple, float] = {}
+            # (name, labels key) -> [bucket counts..., sum, count, max]
+            self.histograms: Dict[tuple, list] = {}
+            self.started = time.time()
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, _labels_key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, _labels_key(labels))
+        with self._lock:
+            state = self.histograms.get(key)
+            if state is None:
+                state = self.histograms[key] = [0] * len(LATENCY_BUCKETS) + [0.0, 0, 0.0]
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-3] += value
+            state[-2] += 1
+            state[-1] = max(state[-1], value)
+
+    @contextmanager
+    def timer(self, stage: str, metric: str, user):
+        """Observe the time spent in the block as ingest_stage_seconds"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(
+                "ingest_stage_seconds",
+                time.perf_counter() - started,
+                stage=stage,
+                metric=metric,
+                user=user,
+            )
+
+    def snapshot(self) -> Dict:
+        """Picklable copy of every series"""
+        with self._lock:
+            return {
+                "counters": [[n, list(k), v] for (n, k), v in self.counters.items()],
+                "histograms": [
+                    [n, list(k), list(s)] for (n, k), s in self.histograms.items()
+                ],
+            }
+
+    def drain(self) -> Dict:
+        """Snapshot and reset, e.g. at the end of a worker's unit"""
+        snapshot = self.snapshot()
+        self.reset()
+        return snapshot
+
+    def merge(self, snapshot: Optional[Dict]):
+        """Add a snapshot taken in another process"""
+        if not snapshot:
+            return
+        with self._lock:
+            for name, key, value in snapshot["counters"]:
+                key = (name, tuple(map(tuple, key)))
+                self.counters[key] = self.counters.get(key, 0) + value
+            for name, key, state in snapshot["histograms"]:
+                key = (name, tuple(map(tuple, key)))
+                current = self.histograms.get(key)
+                if current is None:
+                    self.histograms[key] = list(state)
+                    continue
+                for i in range(len(state) - 1):
+                    current[i] += state[i]
+                current[-1] = max(current[-1], state[-1])
+
+    def to_prometheus(self) -> str:
+        """All series in the Prometheus text exposition format"""
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((k, list(s)) for k, s in self.histograms.items())
+
+        lines = []
+        for name, help_text in COUNTERS.items():
+            series = [(key, value) for (n, key), value in counters if n == name]
+            if not series:
+                continue
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+            for key, value in series:
+                value = int(value) if float(value).is_integer() else value
+                lines.append(f"{name}{_format_labels(key)} {value}")
+
+        for name, help_text in HISTOGRAMS.items():
+            series = [(key, state) for (n, key), state in histograms if n == name]
+            if not series:
+                continue
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+            for key, state in series:
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS, state):
+                    cumulative += count
+                    le = 'le="%g"' % bound
+                    lines.append(f"{name}_bucket{_format_labels(key, le)} {cumulative}")
+                le = 'le="+Inf"'
+                lines.append(f"{name}_bucket{_format_labels(key, le)} {state[-2]}")
+                lines.append(f"{name}_sum{_format_labels(key)} {state[-3]:.6f}")
+                lines.append(f"{name}_count{_format_labels(key)} {state[-2]}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> Dict:
+        """Totals per (metric, user) and per stage, for the end-of-run report"""
+        with self._lock:
+            counters = dict(self.counters)
+            histograms = {k: list(s) for k, s in self.histograms.items()}
+
+        series: Dict[str, Dict] = {}
+        totals: Dict[str, float] = {}
+        for (name, key), value in sorted(counters.items()):
+            labels = dict(key)
+            short = name[len("ingest_"):-len("_total")]
+            entry = series.setdefault(
+                f"{labels.get('metric')}/user{labels.get('user')}", {"stages": {}}
+            )
+            entry[short] = entry.get(short, 0) + value
+            totals[short] = totals.get(short, 0) + value
+
+        stages: Dict[str, Dict] = {}
+        for (name, key), state in sorted(histograms.items()):
+            labels = dict(key)
+            entry = series.setdefault(
+                f"{labels.get('metric')}/user{labels.get('user')}", {"stages": {}}
+            )
+            entry["stages"][labels["stage"]] = {
+                "count": state[-2],
+                "seconds": round(state[-3], 6),
+                "max_seconds": round(state[-1], 6),
+            }
+            total = stages.setdefault(labels["stage"], {"count": 0, "seconds": 0.0})
+            total["count"] += state[-2]
+            total["seconds"] = round(total["seconds"] + state[-3], 6)
+
+        elapsed = time.time() - self.started
+        return {
+            "elapsed_seconds": round(elapsed, 3),
+            "totals": totals,
+            "rows_inserted_per_sec": (
+                round(totals.get("rows_inserted", 0) / elapsed, 1) if elapsed > 0 else None
+            ),
+            "stages": stages,
+            "series": series,
+        }
+
+    def write_textfile(self, path: str):
+        """Write the Prometheus text atomically so scrapers never see half a file"""
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                f.write(self.to_prometheus())
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.error(f"Could not write metrics file {path}: {e}")
+
+    def start_http_server(self, port: int) -> ThreadingHTTPServer:
+        """Serve /metrics from a daemon thread"""
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.to_prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        logger.info(f"Serving Prometheus metrics on port {port}")
+        return server
+
+    def export(self, final: bool = False):
+        """Write METRICS_FILE, and at the end of a run log and save the summary"""
+        if METRICS_FILE:
+            self.write_textfile(METRICS_FILE)
+        if final:
+            summary = self.summary()
+            logger.info(f"Ingestion metrics summary: {json.dumps(summary)}")
+            if METRICS_SUMMARY_FILE:
+                try:
+                    with open(METRICS_SUMMARY_FILE, "w") as f:
+                        json.dump(summary, f, indent=2)
+                except OSError as e:
+                    logger.error(
+                        f"Could not write metrics summary {METRICS_SUMMARY_FILE}: {e}"
+                    )
+
+
+# Registry of this process
+metrics = IngestMetrics()
@@ -1,40 +1,185 @@
 import logging
+import math
 from datetime import datetime, timezone
 from typing import Dict, List, Optional, Any
 
+import numpy as np
+
+from timeutils import convert_to_utc, day_timestamps, iso_timestamps, source_to_utc
+
 logger = logging.getLogger("Models")
 
 
-def convert_to_utc(timestamp_input) -> datetime:
-    """Convert timestamp to UTC datetime (timezone-naive for database storage)"""
-    try:
-        # Handle different input types
-        if isinstance(timestamp_input, str):
-            # Parse string timestamp
-            if "T" in timestamp_input:
-                # ISO format: "2024-01-01T00:00:00" or "2024-01-01T00:00:00.000"
-                if "." in timestamp_input:
-                    dt = datetime.fromisoformat(timestamp_input.replace(".000", ""))
-                else:
-                    dt = datetime.fromisoformat(timestamp_input)
+class RecordBatch:
+    """Rows of one table for one user and device, stored column-wise.
+
+    user_id and device_id are scalars shared by every row, timestamp is a
+    datetime64 array and every other column a NumPy array. Nullable columns
+    are masked arrays whose masked entries are written as NULL.
+    """
+
+    def __init__(
+        self,
+        table: str,
+        user_id: int,
+        device_id: Optional[str],
+        timestamp,
+        columns: Dict[str, np.ndarray],
+    ):
+        self.table = table
+        self.user_id = user_id
+        self.device_id = device_id
+        self.timestamp = np.asarray(timestamp, dtype="datetime64[us]")
+        self.columns = columns
+        for name, values in columns.items():
+            if len(values) != len(self.timestamp):
+                raise ValueError(
+                    f"Column {name} has {len(values)} values for {len(self.timestamp)} timestamps"
+                )
+
+    def __len__(self):
+        return len(self.timestamp)
+
+    @property
+    def column_names(self) -> List[str]:
+        return ["user_id", "device_id", "timestamp"] + list(self.columns)
+
+    @property
+    def nbytes(self) -> int:
+        return self.timestamp.nbytes + sum(c.nbytes for c in self.columns.values())
+
+    @staticmethod
+    def column(values: List[Any], dtype=None) -> np.ndarray:
+        """Build a column from Python values, masking None.
+
+        Fractional values in an integer column are rounded half away from
+        zero, as PostgreSQL does when inserting them into an integer column,
+        instead of being truncated by the cast. NaN is masked like None.
+        """
+        if dtype is not None and np.dtype(dtype).kind in "iu":
+            values = [
+                _round_half_away(v) if isinstance(v, float) else v for v in values
+            ]
+        elif dtype is None:
+            present = [v for v in values if v is not None]
+            if all(isinstance(v, (bool, int)) for v in present):
+                dtype = np.int64
+            elif all(isinstance(v, (bool, int, float)) for v in present):
+                dtype = np.float64
             else:
-                # Date only format: "2024-01-01"
-                dt = datetime.strptime(timestamp_input, "%Y-%m-%d")
-        elif isinstance(timestamp_input, datetime):
-            dt = timestamp_input
-        else:
-            logger.error(f"Unsupported timestamp type: {type(timestamp_input)}")
-            return None
+                dtype = object
+
+        mask = [v is None for v in values]
+        if not any(mask):
+            return np.array(values, dtype=dtype)
+        fill = "" if dtype is object else 0
+        return np.ma.array(
+            [fill if v is None else v for v in values], mask=mask, dtype=dtype
+        )
+
+    @classmethod
+    def from_records(cls, records: List[Dict[str, Any]]) -> List["RecordBatch"]:
+        """Group flat dict records into batches per (table, user_id, device_id)"""
+        grouped = {}
+        for record in records:
+            table = record.get("table")
+            if not table:
+                logger.error(f"Record is missing 'table' field: {record}")
+                continue
+            timestamp = record.get("timestamp")
+            if isinstance(timestamp, str):
+                timestamp = convert_to_utc(timestamp)
+            elif isinstance(timestamp, datetime) and timestamp.tzinfo is not None:
+                timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+            if timestamp is None:
+                logger.error(f"Record has no usable timestamp: {record}")
+                continue
+            key = (table, record.get("user_id"), record.get("device_id"))
+            grouped.setdefault(key, []).append((timestamp, record))
+
+        batches = []
+        for (table, user_id, device_id), rows in grouped.items():
+            names = [
+                name
+                for name in rows[0][1]
+                if name not in ("table", "user_id", "device_id", "timestamp")
+            ]
+            batches.append(
+                cls(
+                    table,
+                    user_id,
+                    device_id,
+                    [timestamp for timestamp, _ in rows],
+                    {
+                        name: cls.column([record.get(name) for _, record in rows])
+                        for name in names
+                    },
+                )
+            )
+        return batches
+
+    def time_span(self):
+        """(earliest, latest) timestamp as datetimes"""
+        return self.timestamp.min().astype(datetime), self.timestamp.max().astype(datetime)
+
+    def rows(self) -> List[tuple]:
+        """Row tuples in column_names order, with None for NULL"""
+        columns = [values.tolist() for values in self.columns.values()]
+        return [
+            (self.user_id, self.device_id, timestamp, *values)
+            for timestamp, *values in zip(self.timestamp.tolist(), *columns)
+        ]
+
+    def to_records(self) -> List[Dict[str, Any]]:
+        """Flat dict records, as returned by HealthMetric.get_flat_records"""
+        names = ["table"] + self.column_names
+        return [dict(zip(names, (self.table,) + row)) for row in self.rows()]
+
+    def write_csv(self, buffer):
+        """Append the rows to buffer as CSV for COPY FROM STDIN"""
+        if not len(self):
+            return
+        prefix = f"{_csv_field(self.user_id)},{_csv_field(self.device_id)},"
+        # Whole seconds unless a reading carries a fraction
+        fractional = (self.timestamp.astype(np.int64) % 1_000_000).any()
+        timestamps = np.datetime_as_string(
+            self.timestamp, unit="us" if fractional else "s"
+        )
+        lines = np.char.add(prefix, timestamps)
+        for values in self.columns.values():
+            lines = np.char.add(np.char.add(lines, ","), _csv_column(values))
+        buffer.write("\n".join(lines.tolist()))
+        buffer.write("\n")
 
-        # If timezone-naive, assume it's UTC (since synthetic data is UTC)
-        if dt.tzinfo is None:
-            return dt
 
-        # Convert to UTC and remove timezone info for storage
-        return dt.astimezone(timezone.utc).replace(tzinfo=None)
-    except Exception as e:
-        logger.error(f"Error converting timestamp {timestamp_input} to UTC: {e}")
+def _round_half_away(value: float) -> Optional[int]:
+    if math.isnan(value):
         return None
+    return int(math.copysign(math.floor(abs(value) + 0.5), value))
+
+
+def _csv_field(value) -> str:
+    """Format one value as a CSV field; None becomes NULL, "" an empty string"""
+    if value is None:
+        return ""
+    text = str(value)
+    # COPY reads an unquoted empty field as NULL, so "" must be quoted
+    if not text or any(c in text for c in ',"\r\n'):
+        return '"' + text.replace('"', '""') + '"'
+    return text
+
+
+def _csv_column(values: np.ndarray) -> np.ndarray:
+    """Format a column as CSV fields, leaving masked entries empty (NULL)"""
+    mask = np.ma.getmaskarray(values)
+    data = np.ma.getdata(values)
+    if data.dtype == object or data.dtype.kind in "US":
+        fields = np.array([_csv_field(v) for v in data.tolist()], dtype=object)
+        fields[mask] = ""
+        return fields.astype(str)
+    fields = data.astype(str)
+    fields[mask] = ""
+    return fields
 
 
 class HealthMetric:
@@ -46,14 +191,35 @@ class HealthMetric:
 
     def set_timestamp(self, timestamp):
         """Set timestamp, ensuring it's converted to UTC"""
-        self.timestamp = convert_to_utc(timestamp)
+        self.timestamp = source_to_utc(timestamp)
 
     def get_flat_records(self):
         """Return list of flattened records for database insertion"""
         raise NotImplementedError("Subclasses must implement get_flat_records")
 
+    def get_record_batches(self) -> List[RecordBatch]:
+        """Return the records as column-wise batches, one per table"""
+        return RecordBatch.from_records(self.get_flat_records())
 
-class HeartRateMetric(HealthMetric):
+
+class BatchedHealthMetric(HealthMetric):
+    """Metrics with one row per minute build their batches column-wise directly"""
+
+    def get_flat_records(self):
+        return [
+            record for batch in self.get_record_batches() for record in batch.to_records()
+        ]
+
+    def get_record_batches(self) -> List[RecordBatch]:
+        raise NotImplementedError("Subclasses must implement get_record_batches")
+
+    def _batch(self, table, timestamps, columns) -> List[RecordBatch]:
+        if len(timestamps) == 0:
+            return []
+        return [RecordBatch(table, self.user_id, self.device_id, timestamps, columns)]
+
+
+class HeartRateMetric(BatchedHealthMetric):
     def __init__(self, user_id, device_id=None):
         super().__init__("heart_rate", user_id, device_id)
         self.value = None
@@ -66,7 +232,7 @@ class HeartRateMetric(HealthMetric):
         if "activities-heart" in data:
             heart_data = data["activities-heart"][0]
             self.date = heart_data["dateTime"]
-            self.timestamp = convert_to_utc(self.date)
+            self.timestamp = source_to_utc(self.date)
 
             if "value" in heart_data and isinstance(heart_data["value"], dict):
                 if "restingHeartRate" in heart_data["value"]:
@@ -81,77 +247,63 @@ class HeartRateMetric(HealthMetric):
         ):
             self.intraday = data["activities-heart-intraday"]["dataset"]
 
-    def get_flat_records(self):
-        """Return flattened records for database insertion"""
-        records = []
-
-        # Process heart rate intraday data
-        for entry in self.intraday:
-            try:
-                time_str = entry["time"]
-                value = entry["value"]
-
-                # Create timestamp by combining date and time, then convert to UTC
-                if self.date:
-                    timestamp_str = f"{self.date}T{time_str}"
-                    timestamp = convert_to_utc(timestamp_str)
-
-                    if timestamp:
-                        records.append(
-                            {
-                                "table": "heart_rate",
-                                "user_id": self.user_id,
-                                "device_id": self.device_id,
-                                "timestamp": timestamp,
-                                "value": value,
-                                "resting_heart_rate": self.resting_heart_rate,
-                            }
-                        )
-            except (KeyError, ValueError) as e:
-                logger.error(f"Error processing heart rate intraday data: {e}")
+    def get_record_batches(self):
+        """Return the intraday readings and the day's zones as batches"""
+        # Process heart rate intraday data; the day is parsed once for all times
+        entries = [e for e in self.intraday if "time" in e and "value" in e]
+        if len(entries) < len(self.intraday):
+            logger.error(
+                f"Skipped {len(self.intraday) - len(entries)} heart rate intraday "
+                f"entries without time or value"
+            )
+        timestamps = np.array([], dtype="datetime64[us]")
+        values = []
+        if self.date and entries:
+            timestamps = day_timestamps(self.date, [e["time"] for e in entries])
+            keep = ~np.isnat(timestamps)
+            timestamps = timestamps[keep]
+            values = [e["value"] for e, k in zip(entries, keep) if k]
 
         # If no intraday data but we have a date, create at least one record
-        if not records and self.date:
-            utc_timestamp = convert_to_utc(self.date)
+        if len(timestamps) == 0 and self.date:
+            utc_timestamp = source_to_utc(self.date)
             if utc_timestamp:
-                records.append(
-                    {
-                        "table": "heart_rate",
-                        "user_id": self.user_id,
-                        "device_id": self.device_id,
-                        "timestamp": utc_timestamp,
-                        "value": None,
-                        "resting_heart_rate": self.resting_heart_rate,
-                    }
-                )
+                timestamps = [utc_timestamp]
+                values = [None]
+
+        batches = self._batch(
+            "heart_rate",
+            timestamps,
+            {
+                "value": RecordBatch.column(values, np.int64),
+                "resting_heart_rate": RecordBatch.column(
+                    [self.resting_heart_rate] * len(timestamps), np.int64
+                ),
+            },
+        )
 
-        # Process heart rate zones
-        for zone in self.zones:
-            try:
-                utc_timestamp = (
-                    convert_to_utc(self.date) if self.date else self.timestamp
-                )
-                if utc_timestamp:
-                    records.append(
-                        {
-                            "table": "heart_rate_zones",
-                            "user_id": self.user_id,
-                            "device_id": self.device_id,
-                            "timestamp": utc_timestamp,
-                            "zone_name": zone.get("name"),
-                            "min_hr": zone.get("min"),
-                            "max_hr": zone.get("max"),
-                            "minutes": zone.get("minutes"),
-                            "calories_out": zone.get("caloriesOut"),
-                        }
-                    )
-            except (KeyError, ValueError) as e:
-                logger.error(f"Error processing heart rate zone: {e}")
-
-        return records
-
-
-class SpO2Metric(HealthMetric):
+        # Process heart rate zones, all stamped with the day
+        utc_timestamp = source_to_utc(self.date) if self.date else self.timestamp
+        zones = self.zones if utc_timestamp else []
+        batches += self._batch(
+            "heart_rate_zones",
+            [utc_timestamp] * len(zones),
+            {
+                "zone_name": RecordBatch.column([z.get("name") for z in zones], object),
+                "min_hr": RecordBatch.column([z.get("min") for z in zones], np.int64),
+                "max_hr": RecordBatch.column([z.get("max") for z in zones], np.int64),
+                "minutes": RecordBatch.column(
+                    [z.get("minutes") for z in zones], np.int64
+                ),
+                "calories_out": RecordBatch.column(
+                    [z.get("caloriesOut") for z in zones], np.float64
+                ),
+            },
+        )
+        return batches
+
+
+class SpO2Metric(BatchedHealthMetric):
     def __init__(self, user_id, device_id=None):
         super().__init__("spo2", user_id, device_id)
         self.date = None
@@ -163,31 +315,23 @@ class SpO2Metric(HealthMetric):
         if "minutes" in data:
             self.minutes = data["minutes"]
 
-    def get_flat_records(self):
-        records = []
-
-        for minute_data in self.minutes:
-            try:
-                timestamp = convert_to_utc(minute_data["minute"])
-                value = minute_data["value"]
-
-                if timestamp:
-                    records.append(
-                        {
-                            "table": "spo2",
-                            "user_id": self.user_id,
-                            "device_id": self.device_id,
-                            "timestamp": timestamp,
-                            "value": value,
-                        }
-                    )
-            except (KeyError, ValueError) as e:
-                logger.error(f"Error processing SpO2 minute data: {e}")
-
-        return records
-
-
-class HRVMetric(HealthMetric):
+    def get_record_batches(self):
+        entries = [m for m in self.minutes if "minute" in m and "value" in m]
+        if len(entries) < len(self.minutes):
+            logger.error(
+                f"Skipped {len(self.minutes) - len(entries)} SpO2 minutes without minute or value"
+            )
+        timestamps = iso_timestamps([m["minute"] for m in entries])
+        keep = ~np.isnat(timestamps)
+        values = [m["value"] for m, k in zip(entries, keep) if k]
+        timestamps = timestamps[keep]
+
+        return self._batch(
+            "spo2", timestamps, {"value": RecordBatch.column(values, np.float64)}
+        )
+
+
+class HRVMetric(BatchedHealthMetric):
     def __init__(self, user_id, device_id=None):
         super().__init__("hrv", user_id, device_id)
         self.minutes = []
@@ -196,31 +340,29 @@ class HRVMetric(HealthMetric):
         if "minutes" in data:
             self.minutes = data["minutes"]
 
-    def get_flat_records(self):
-        records = []
-
-        for minute_data in self.minutes:
-            try:
-                timestamp = convert_to_utc(minute_data["minute"])
-                value = minute_data.get("value", {})
-
-                if timestamp:
-                    records.append(
-                        {
-                            "table": "hrv",
-                            "user_id": self.user_id,
-                            "device_id": self.device_id,
-                            "timestamp": timestamp,
-                            "rmssd": value.get("rmssd"),
-                            "coverage": value.get("coverage"),
-                            "hf": value.get("hf"),
-                            "lf": value.get("lf"),
-                        }
-                    )
-            except (KeyError, ValueError) as e:
-                logger.error(f"Error processing HRV minute data: {e}")
-
-        return records
+    def get_record_batches(self):
+        entries = [m for m in self.minutes if "minute" in m]
+        if len(entries) < len(self.minutes):
+            logger.error(
+                f"Skipped {len(self.minutes) - len(entries)} HRV minutes without minute"
+            )
+        timestamps = iso_timestamps([m["minute"] for m in entries])
+        keep = ~np.isnat(timestamps)
+        timestamps = timestamps[keep]
+        values = [m.get("value") or {} for m, k in zip(entries, keep) if k]
+        columns = {
+            name: [value.get(name) for value in values]
+            for name in ("rmssd", "coverage", "hf", "lf")
+        }
+
+        return self._batch(
+            "hrv",
+            timestamps,
+            {
+                name: RecordBatch.column(values, np.float64)
+                for name, values in columns.items()
+            },
+        )
 
 
 class BreathingRateMetric(HealthMetric):
@@ -235,7 +377,7 @@ class BreathingRateMetric(HealthMetric):
     def set_data(self, data):
         if "dateTime" in data:
             self.date = data["dateTime"]
-            self.timestamp = convert_to_utc(data["dateTime"])
+            self.timestamp = source_to_utc(data["dateTime"])
         if "value" in data:
             value = data["value"]
             if (
@@ -278,7 +420,7 @@ class BreathingRateMetric(HealthMetric):
         )
 
 
-class ActiveZoneMinutesMetric(HealthMetric):
+class ActiveZoneMinutesMetric(BatchedHealthMetric):
     def __init__(self, user_id, device_id=None):
         super().__init__("active_zone_minutes", user_id, device_id)
         self.date = None
@@ -290,41 +432,46 @@ class ActiveZoneMinutesMetric(HealthMetric):
         if "minutes" in data:
             self.minutes = data["minutes"]
 
-    def get_flat_records(self):
-        records = []
-
-        for minute_data in self.minutes:
-            try:
-                minute_str = minute_data["minute"]
-                # Handle different time formats
-                if "T" in minute_str:
-                    timestamp = convert_to_utc(minute_str)
-                else:
-                    # Assuming format like "08:30:00" with date from self.date
-                    timestamp_str = f"{self.date}T{minute_str}"
-                    timestamp = convert_to_utc(timestamp_str)
-
-                value = minute_data.get("value", {})
-
-                if timestamp:
-                    records.append(
-                        {
-                            "table": "active_zone_minutes",
-                            "user_id": self.user_id,
-                            "device_id": self.device_id,
-                            "timestamp": timestamp,
-                            "fat_burn_minutes": value.get(
-                                "fatBurnActiveZoneMinutes", 0
-                            ),
-                            "cardio_minutes": value.get("cardioActiveZoneMinutes", 0),
-                            "peak_minutes": value.get("peakActiveZoneMinutes", 0),
-                            "active_zone_minutes": value.get("activeZoneMinutes", 0),
-                        }
-                    )
-            except (KeyError, ValueError) as e:
-                logger.error(f"Error processing AZM minute data: {e}")
-
-        return records
+    def get_record_batches(self):
+        # Table column -> key in the source "value" object
+        sources = {
+            "fat_burn_minutes": "fatBurnActiveZoneMinutes",
+            "cardio_minutes": "cardioActiveZoneMinutes",
+            "peak_minutes": "peakActiveZoneMinutes",
+            "active_zone_minutes": "activeZoneMinutes",
+        }
+        entries = [m for m in self.minutes if "minute" in m]
+        if len(entries) < len(self.minutes):
+            logger.error(
+                f"Skipped {len(self.minutes) - len(entries)} AZM minutes without minute"
+            )
+        minute_strs = [m["minute"] for m in entries]
+        # Handle different time formats: full ISO timestamps, or times like
+        # "08:30:00" on self.date
+        if all("T" in minute_str for minute_str in minute_strs):
+            timestamps = iso_timestamps(minute_strs)
+        elif self.date and not any("T" in minute_str for minute_str in minute_strs):
+            timestamps = day_timestamps(self.date, minute_strs)
+        else:
+            timestamps = iso_timestamps(
+                [m if "T" in m else f"{self.date}T{m}" for m in minute_strs]
+            )
+        keep = ~np.isnat(timestamps)
+        timestamps = timestamps[keep]
+        values = [m.get("value") or {} for m, k in zip(entries, keep) if k]
+        columns = {
+            name: [value.get(key, 0) for value in values]
+            for name, key in sources.items()
+        }
+
+        return self._batch(
+            "active_zone_minutes",
+            timestamps,
+            {
+                name: RecordBatch.column(values, np.int64)
+                for name, values in columns.items()
+            },
+        )
 
 
 class ActivityMetric(HealthMetric):
@@ -336,7 +483,7 @@ class ActivityMetric(HealthMetric):
     def set_data(self, data):
         if "dateTime" in data:
             self.date = data["dateTime"]
-            self.timestamp = convert_to_utc(data["dateTime"])
+            self.timestamp = source_to_utc(data["dateTime"])
         if "value" in data:
             self.value = data["value"]
 
@@ -1,11 +1,188 @@
 import os
+import re
 import json
 import logging
+from collections import OrderedDict
 from datetime import datetime
-from typing import Dict, List, Optional, Any
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterator, List, Optional, Tuple, Any
+
+from metrics import metrics
 
 logger = logging.getLogger("SourceAdapter")
 
+# Size of each read when streaming a data file
+STREAM_CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+# Sidecar file mapping each day to the byte span of its record in a data file
+DATE_INDEX_SUFFIX = ".dateidx.json"
+DATE_INDEX_VERSION = 1
+
+# Default budget of the parsed-file cache, in bytes of source JSON
+DEFAULT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+
+def _byte_length(text: str) -> int:
+    """Length of text once encoded as UTF-8."""
+    return len(text) if text.isascii() else len(text.encode("utf-8"))
+
+
+def _iter_json_array_spans(
+    file_path: str, chunk_size: int = STREAM_CHUNK_SIZE
+) -> Iterator[Tuple[Any, int, int]]:
+    """Yield (element, byte offset, byte length) for a top-level JSON array.
+
+    Only the element currently being decoded (plus one read chunk) is held in
+    memory, so the cost of a read is bounded by the records consumed rather
+    than by the size of the file.
+    """
+    decoder = json.JSONDecoder()
+    # newline="" keeps character positions aligned with the bytes on disk
+    with open(file_path, "r", encoding="utf-8", newline="") as f:
+        buffer = f.read(chunk_size)
+        # Bytes of the file that precede buffer[0]
+        buffer_offset = 0
+        pos = _WHITESPACE.match(buffer, 0).end()
+        if pos >= len(buffer) or buffer[pos] != "[":
+            raise ValueError(f"{file_path} does not contain a top-level JSON array")
+        pos += 1
+
+        while True:
+            pos = _WHITESPACE.match(buffer, pos).end()
+            if pos >= len(buffer):
+                more = f.read(chunk_size)
+                if not more:
+                    raise ValueError(f"Unexpected end of JSON array in {file_path}")
+                buffer_offset += _byte_length(buffer[:pos])
+                buffer = buffer[pos:] + more
+                pos = 0
+                continue
+
+            char = buffer[pos]
+            if char == "]":
+                return
+            if char == ",":
+                pos += 1
+                continue
+
+            try:
+                element, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # Element spans past the buffer - grow it geometrically so a
+                # large record is not re-decoded once per chunk
+                more = f.read(max(chunk_size, len(buffer) - pos))
+                if not more:
+                    raise
+                buffer_offset += _byte_length(buffer[:pos])
+                buffer = buffer[pos:] + more
+                pos = 0
+                continue
+
+            offset = buffer_offset + _byte_length(buffer[:pos])
+            yield element, offset, _byte_length(buffer[pos:end])
+            pos = end
+
+            # Drop the consumed prefix so the buffer does not grow with the file
+            if pos > chunk_size:
+                buffer_offset += _byte_length(buffer[:pos])
+                buffer = buffer[pos:]
+                pos = 0
+
+
+def _iter_json_array(file_path: str, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[Any]:
+    """Yield the elements of a top-level JSON array one at a time."""
+    for element, _, _ in _iter_json_array_spans(file_path, chunk_size):
+        yield element
+
+
+class ParsedFileCache:
+    """LRU cache of parsed data files, bucketed by record date.
+
+    Entries are keyed by file path and remember the file's mtime and size, so
+    a changed file is re-parsed on its next lookup. The memory ceiling is
+    measured in bytes of the cached source files; the least recently used
+    files are evicted once it is exceeded.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        # file path -> (file key, date buckets, sorted dates, cost in bytes)
+        self._entries: "OrderedDict[str, Tuple]" = OrderedDict()
+
+    def get(
+        self, file_path: str, file_key: List[int]
+    ) -> Optional[Tuple[Dict[str, List[Dict]], List[str]]]:
+        """Return the date buckets of a file, or None if absent or stale."""
+        entry = self._entries.get(file_path)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        if entry[0] != file_key:
+            self._remove(file_path)
+            self.invalidations += 1
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(file_path)
+        self.hits += 1
+        return entry[1], entry[2]
+
+    def put(
+        self,
+        file_path: str,
+        file_key: List[int],
+        buckets: Dict[str, List[Dict]],
+        cost: int,
+    ):
+        """Store the date buckets of a file, evicting old entries as needed."""
+        if file_path in self._entries:
+            self._remove(file_path)
+        if cost > self.max_bytes:
+            logger.debug(f"Not caching {file_path}: {cost} bytes exceeds cache size")
+            return
+
+        while self._entries and self.current_bytes + cost > self.max_bytes:
+            evicted_path = next(iter(self._entries))
+            self._remove(evicted_path)
+            self.evictions += 1
+            logger.debug(f"Evicted {evicted_path} from parsed file cache")
+
+        self._entries[file_path] = (file_key, buckets, sorted(buckets), cost)
+        self.current_bytes += cost
+
+    def fits(self, size: int) -> bool:
+        """Whether a file of this many bytes can be cached at all."""
+        return size <= self.max_bytes
+
+    def clear(self):
+        """Drop all cached files."""
+        self._entries.clear()
+        self.current_bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss counters and current usage."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "entries": len(self._entries),
+            "current_bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+    def _remove(self, file_path: str):
+        entry = self._entries.pop(file_path)
+        self.current_bytes -= entry[3]
+
 
 class SourceAdapter:
     """Base class for source data adapters"""
@@ -28,11 +205,29 @@ class SourceAdapter:
 class SyntheticFitbitAdapter(SourceAdapter):
     """Adapter for synthetic Fitbit data stored in JSON files"""
 
-    def __init__(self, data_dir: str):
+    def __init__(
+        self,
+        data_dir: str,
+        streaming: bool = False,
+        use_index: bool = False,
+        index_dir: Optional[str] = None,
+        cache: Optional[ParsedFileCache] = None,
+    ):
         """Initialize adapter with path to data directory."""
         self.data_dir = data_dir
         # Flag to indicate flat record processing
         self.flat_records = False
+        # Read files incrementally instead of loading them whole
+        self.streaming = streaming
+        # Seek straight to a day's record using a persistent date index
+        self.use_index = use_index
+        self.index_dir = index_dir or data_dir
+        # file path -> (index, sorted dates) for indexes already loaded
+        self._date_indexes: Dict[str, Tuple[Dict, List[str]]] = {}
+        # Parsed, date-bucketed file contents shared across get_data calls
+        self.cache = cache
+        # Bytes of JSON decoded so far, reported per get_data call
+        self._bytes_parsed = 0
         logger.info(f"Using data directory: {data_dir}")
         logger.info(
             f"Initialized SyntheticFitbitAdapter with data directory: {data_dir}"
@@ -74,16 +269,56 @@ class SyntheticFitbitAdapter(SourceAdapter):
         end_date: datetime,
         user_id: str = "1",
     ) -> List[Dict]:
-        """Get synthetic data for a specific metric type and date range."""
+        """Get synthetic data for a specific metric type and date range.
+
+        Read paths are tried in order: the parsed file cache for files that
+        fit its budget, then the date index, then streaming, then loading the
+        whole file. Files larger than the cache budget therefore still use
+        the index or the streaming reader when the cache is enabled.
+        """
         file_path = self.get_file_path(metric_type, user_id)
 
         if not os.path.exists(file_path):
             logger.warning(f"Data file not found: {file_path}")
             return []
 
+        bytes_before = self._bytes_parsed
         try:
+            if (
+                self.cache is not None
+                and start_date
+                and end_date
+                and self.cache.fits(os.path.getsize(file_path))
+            ):
+                records = self._read_cached_records(
+                    metric_type, file_path, start_date, end_date
+                )
+                logger.info(
+                    f"Read {len(records)} cached records for {metric_type} between {start_date.date()} and {end_date.date()}"
+                )
+                return records
+
+            if self.use_index and start_date and end_date:
+                records = self._read_indexed_records(
+                    metric_type, file_path, start_date, end_date
+                )
+                logger.info(
+                    f"Read {len(records)} indexed records for {metric_type} between {start_date.date()} and {end_date.date()}"
+                )
+                return records
+
+            if self.streaming:
+                records = list(
+                    self.iter_data(metric_type, start_date, end_date, user_id)
+                )
+                logger.info(
+                    f"Streamed {len(records)} records for {metric_type} from {file_path}"
+                )
+                return records
+
             with open(file_path, "r") as f:
                 all_data = json.load(f)
+            self._bytes_parsed += os.path.getsize(file_path)
 
             # Filter data based on date if needed
             if start_date and end_date:
@@ -104,6 +339,195 @@ class SyntheticFitbitAdapter(SourceAdapter):
 
             logger.error(traceback.format_exc())
             return []
+        finally:
+            metrics.inc(
+                "ingest_bytes_parsed_total",
+                self._bytes_parsed - bytes_before,
+                metric=metric_type,
+                user=user_id,
+            )
+
+    def iter_data(
+        self,
+        metric_type: str,
+        start_date: Optional[datetime],
+        end_date: Optional[datetime],
+        user_id: str = "1",
+    ) -> Iterator[Dict]:
+        """Yield day records between start_date and end_date one at a time.
+
+        The data files are written in date order, so reading stops at the
+        first record past end_date instead of decoding the rest of the file.
+        """
+        file_path = self.get_file_path(metric_type, user_id)
+
+        if not os.path.exists(file_path):
+            logger.warning(f"Data file not found: {file_path}")
+            return
+
+        start_date_str = start_date.strftime("%Y-%m-%d") if start_date else None
+        end_date_str = end_date.strftime("%Y-%m-%d") if end_date else None
+
+        for record, _, length in _iter_json_array_spans(file_path):
+            self._bytes_parsed += length
+            if start_date_str is None or end_date_str is None:
+                yield record
+                continue
+
+            record_date = self._get_record_date(metric_type, record)
+            if not record_date:
+                continue
+            if record_date > end_date_str:
+                break
+            if record_date >= start_date_str:
+                yield record
+
+    def _read_cached_records(
+        self,
+        metric_type: str,
+        file_path: str,
+        start_date: datetime,
+        end_date: datetime,
+    ) -> List[Dict]:
+        """Get records between start_date and end_date from the parsed file cache.
+
+        Records are shared between calls and must not be modified by callers.
+        """
+        stat = os.stat(file_path)
+        file_key = [stat.st_mtime_ns, stat.st_size]
+
+        cached = self.cache.get(file_path, file_key)
+        if cached is None:
+            buckets: Dict[str, List[Dict]] = {}
+            for record in _iter_json_array(file_path):
+                record_date = self._get_record_date(metric_type, record)
+                if record_date:
+                    buckets.setdefault(record_date, []).append(record)
+            self.cache.put(file_path, file_key, buckets, stat.st_size)
+            self._bytes_parsed += stat.st_size
+            cached = (buckets, sorted(buckets))
+
+        buckets, sorted_dates = cached
+        start_date_str = start_date.strftime("%Y-%m-%d")
+        end_date_str = end_date.strftime("%Y-%m-%d")
+
+        if start_date_str == end_date_str:
+            return list(buckets.get(start_date_str, []))
+
+        lo = bisect_left(sorted_dates, start_date_str)
+        hi = bisect_right(sorted_dates, end_date_str)
+        return [record for date_str in sorted_dates[lo:hi] for record in buckets[date_str]]
+
+    def cache_stats(self) -> Optional[Dict[str, int]]:
+        """Return parsed file cache counters, or None when caching is disabled."""
+        return self.cache.stats() if self.cache is not None else None
+
+    def get_index_path(self, file_path: str) -> str:
+        """Get the path of the date index sidecar for a data file."""
+        return os.path.join(
+            self.index_dir, os.path.basename(file_path) + DATE_INDEX_SUFFIX
+        )
+
+    def get_date_index(self, metric_type: str, file_path: str) -> Tuple[Dict, List[str]]:
+        """Return the date index of a data file, building it if missing or stale.
+
+        The index maps each YYYY-MM-DD date to the byte spans of its records
+        and is keyed on the file's mtime and size, so any change to the data
+        file triggers a rebuild.
+        """
+        stat = os.stat(file_path)
+        file_key = [stat.st_mtime_ns, stat.st_size]
+
+        cached = self._date_indexes.get(file_path)
+        if cached and cached[0]["file_key"] == file_key:
+            return cached
+
+        index_path = self.get_index_path(file_path)
+        index = self._load_date_index(index_path, file_key)
+        if index is None:
+            index = self._build_date_index(metric_type, file_path, file_key)
+            self._save_date_index(index_path, index)
+
+        cached = (index, sorted(index["dates"]))
+        self._date_indexes[file_path] = cached
+        return cached
+
+    def _load_date_index(self, index_path: str, file_key: List[int]) -> Optional[Dict]:
+        """Load a date index sidecar if it exists and matches the data file."""
+        if not os.path.exists(index_path):
+            return None
+
+        try:
+            with open(index_path, "r") as f:
+                index = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable date index {index_path}: {e}")
+            return None
+
+        if (
+            index.get("version") != DATE_INDEX_VERSION
+            or index.get("file_key") != file_key
+        ):
+            logger.info(f"Date index {index_path} is stale, rebuilding")
+            return None
+        return index
+
+    def _build_date_index(
+        self, metric_type: str, file_path: str, file_key: List[int]
+    ) -> Dict:
+        """Scan a data file once and record the byte span of each day."""
+        dates: Dict[str, List[List[int]]] = {}
+        for record, offset, length in _iter_json_array_spans(file_path):
+            record_date = self._get_record_date(metric_type, record)
+            if record_date:
+                dates.setdefault(record_date, []).append([offset, length])
+        self._bytes_parsed += file_key[1]
+
+        logger.info(f"Built date index for {file_path} with {len(dates)} dates")
+        return {
+            "version": DATE_INDEX_VERSION,
+            "file_key": file_key,
+            "metric_type": metric_type,
+            "dates": dates,
+        }
+
+    def _save_date_index(self, index_path: str, index: Dict):
+        """Persist a date index next to the data, keeping it in memory on failure."""
+        tmp_path = f"{index_path}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(index, f)
+            os.replace(tmp_path, index_path)
+        except OSError as e:
+            logger.warning(f"Could not write date index {index_path}: {e}")
+
+    def _read_indexed_records(
+        self,
+        metric_type: str,
+        file_path: str,
+        start_date: datetime,
+        end_date: datetime,
+    ) -> List[Dict]:
+        """Read only the records between start_date and end_date using the index."""
+        index, sorted_dates = self.get_date_index(metric_type, file_path)
+        start_date_str = start_date.strftime("%Y-%m-%d")
+        end_date_str = end_date.strftime("%Y-%m-%d")
+
+        if start_date_str == end_date_str:
+            dates = [start_date_str] if start_date_str in index["dates"] else []
+        else:
+            lo = bisect_left(sorted_dates, start_date_str)
+            hi = bisect_right(sorted_dates, end_date_str)
+            dates = sorted_dates[lo:hi]
+
+        records = []
+        with open(file_path, "rb") as f:
+            for date_str in dates:
+                for offset, length in index["dates"][date_str]:
+                    f.seek(offset)
+                    records.append(json.loads(f.read(length)))
+                    self._bytes_parsed += length
+        return records
 
     def _filter_data_by_date(
         self,
@@ -120,50 +544,7 @@ class SyntheticFitbitAdapter(SourceAdapter):
         filtered_data = []
 
         for record in data:
-            record_date = None
-
-            # Extract date based on metric type and structure
-            if metric_type == "activity" or metric_type == "spo2":
-                # Activity and SPO2 have dateTime directly in the record
-                if "dateTime" in record:
-                    record_date = record["dateTime"].split("T")[
-                        0
-                    ]  # Extract date part only
-
-            elif metric_type == "heart_rate" or metric_type == "hr":
-                # Heart rate has nested structure
-                if "heart_rate_day" in record and record["heart_rate_day"]:
-                    heart_data = record["heart_rate_day"][0]
-                    if (
-                        "activities-heart" in heart_data
-                        and heart_data["activities-heart"]
-                    ):
-                        activities_heart = heart_data["activities-heart"][0]
-                        if "dateTime" in activities_heart:
-                            record_date = activities_heart["dateTime"].split("T")[0]
-
-            elif metric_type == "hrv":
-                # HRV has minutes data with timestamps
-                if "hrv" in record and record["hrv"]:
-                    hrv_data = record["hrv"][0]
-                    if "minutes" in hrv_data and hrv_data["minutes"]:
-                        first_minute = hrv_data["minutes"][0]
-                        if "minute" in first_minute:
-                            record_date = first_minute["minute"].split("T")[0]
-
-            elif metric_type == "breathing_rate" or metric_type == "br":
-                # Breathing rate has nested data
-                if "br" in record and record["br"]:
-                    br_data = record["br"][0]
-                    if "dateTime" in br_data:
-                        record_date = br_data["dateTime"].split("T")[0]
-
-            elif metric_type == "active_zone_minutes" or metric_type == "azm":
-                # AZM has nested data
-                if "activities-active-zone-minutes-intraday" in record:
-                    azm_data = record["activities-active-zone-minutes-intraday"]
-                    if azm_data and "dateTime" in azm_data[0]:
-                        record_date = azm_data[0]["dateTime"].split("T")[0]
+            record_date = self._get_record_date(metric_type, record)
 
             # If we found a date and it matches the range, include it
             if record_date and start_date_str <= record_date <= end_date_str:
@@ -174,6 +555,48 @@ class SyntheticFitbitAdapter(SourceAdapter):
         )
         return filtered_data
 
+    def _get_record_date(self, metric_type: str, record: Dict) -> Optional[str]:
+        """Return the YYYY-MM-DD date of a day record based on metric type."""
+        # Extract date based on metric type and structure
+        if metric_type == "activity" or metric_type == "spo2":
+            # Activity and SPO2 have dateTime directly in the record
+            if "dateTime" in record:
+                return record["dateTime"].split("T")[0]  # Extract date part only
+
+        elif metric_type == "heart_rate" or metric_type == "hr":
+            # Heart rate has nested structure
+            if "heart_rate_day" in record and record["heart_rate_day"]:
+                heart_data = record["heart_rate_day"][0]
+                if "activities-heart" in heart_data and heart_data["activities-heart"]:
+                    activities_heart = heart_data["activities-heart"][0]
+                    if "dateTime" in activities_heart:
+                        return activities_heart["dateTime"].split("T")[0]
+
+        elif metric_type == "hrv":
+            # HRV has minutes data with timestamps
+            if "hrv" in record and record["hrv"]:
+                hrv_data = record["hrv"][0]
+                if "minutes" in hrv_data and hrv_data["minutes"]:
+                    first_minute = hrv_data["minutes"][0]
+                    if "minute" in first_minute:
+                        return first_minute["minute"].split("T")[0]
+
+        elif metric_type == "breathing_rate" or metric_type == "br":
+            # Breathing rate has nested data
+            if "br" in record and record["br"]:
+                br_data = record["br"][0]
+                if "dateTime" in br_data:
+                    return br_data["dateTime"].split("T")[0]
+
+        elif metric_type == "active_zone_minutes" or metric_type == "azm":
+            # AZM has nested data
+            if "activities-active-zone-minutes-intraday" in record:
+                azm_data = record["activities-active-zone-minutes-intraday"]
+                if azm_data and "dateTime" in azm_data[0]:
+                    return azm_data[0]["dateTime"].split("T")[0]
+
+        return None
+
     def _extract_date_from_record(
         self, record: Dict, metric_type: str
     ) -> Optional[datetime]:
@@ -434,11 +857,23 @@ class SourceAdapterFactory:
         """Create and return a source adapter of the specified type."""
         if adapter_type == "synthetic":
             data_dir = kwargs.get("data_dir", ".")
-            return SyntheticFitbitAdapter(data_dir)
+            return SyntheticFitbitAdapter(
+                data_dir,
+                streaming=kwargs.get("streaming", False),
+                use_index=kwargs.get("use_index", False),
+                index_dir=kwargs.get("index_dir"),
+                cache=kwargs.get("cache"),
+            )
         elif adapter_type == "synthetic_flat":
             # Same adapter but with a flag indicating flat record processing
             data_dir = kwargs.get("data_dir", ".")
-            adapter = SyntheticFitbitAdapter(data_dir)
+            adapter = SyntheticFitbitAdapter(
+                data_dir,
+                streaming=kwargs.get("streaming", False),
+                use_index=kwargs.get("use_index", False),
+                index_dir=kwargs.get("index_dir"),
+                cache=kwargs.get("cache"),
+            )
             adapter.flat_records = True
             return adapter
         else:
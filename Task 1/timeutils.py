@@ -0,0 +1,274 @@
+import os
+import sys
+import time
+import logging
+from datetime import datetime, timezone, tzinfo
+from typing import Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger("TimeUtils")
+
+# Timezone policy: everything is stored as timezone-naive UTC.
+#   - Source timestamps without an offset (intraday "HH:MM:SS", ISO minutes,
+#     dates) are local times in SOURCE_TIMEZONE; the synthetic data is UTC.
+#   - Source timestamps with an offset ("Z", "+02:00") are converted by it.
+#   - Timestamps the pipeline produced itself (timestamp files, datetimes
+#     handed around in code) are already naive UTC and are left as they are.
+SOURCE_TIMEZONE = os.environ.get("SOURCE_TIMEZONE", "UTC")
+
+
+def get_source_timezone() -> tzinfo:
+    """tzinfo for SOURCE_TIMEZONE"""
+    if SOURCE_TIMEZONE.upper() in ("UTC", "Z"):
+        return timezone.utc
+    from zoneinfo import ZoneInfo
+
+    return ZoneInfo(SOURCE_TIMEZONE)
+
+
+def convert_to_utc(timestamp_input, tz: Optional[tzinfo] = None) -> datetime:
+    """Convert timestamp to UTC datetime (timezone-naive for database storage).
+
+    Naive input is taken to be in tz, which defaults to UTC; pass
+    get_source_timezone() for timestamps read from source data.
+    """
+    try:
+        # Handle different input types
+        if isinstance(timestamp_input, str):
+            # Parse string timestamp
+            if "T" in timestamp_input:
+                # ISO format: "2024-01-01T00:00:00" or "2024-01-01T00:00:00.000"
+                dt = datetime.fromisoformat(timestamp_input.replace("Z", "+00:00"))
+            else:
+                # Date only format: "2024-01-01"
+                dt = datetime.strptime(timestamp_input, "%Y-%m-%d")
+        elif isinstance(timestamp_input, datetime):
+            dt = timestamp_input
+        else:
+            logger.error(f"Unsupported timestamp type: {type(timestamp_input)}")
+            return None
+
+        if dt.tzinfo is None:
+            if tz is None or tz is timezone.utc:
+                return dt
+            dt = dt.replace(tzinfo=tz)
+
+        # Convert to UTC and remove timezone info for storage
+        return dt.astimezone(timezone.utc).replace(tzinfo=None)
+    except Exception as e:
+        logger.error(f"Error converting timestamp {timestamp_input} to UTC: {e}")
+        return None
+
+
+def source_to_utc(timestamp_input) -> datetime:
+    """convert_to_utc for a timestamp read from source data"""
+    return convert_to_utc(timestamp_input, get_source_timezone())
+
+
+def _local_to_utc(local: np.ndarray, tz: tzinfo) -> np.ndarray:
+    """Shift naive local datetime64 values to UTC.
+
+    A single offset is subtracted when it is the same at both ends of the
+    range (no DST change inside); otherwise each value is converted on its own.
+    """
+    if tz is timezone.utc or len(local) == 0:
+        return local
+    valid = local[~np.isnat(local)]
+    if len(valid) == 0:
+        return local
+
+    def offset(value):
+        naive = value.astype("datetime64[us]").astype(datetime)
+        return naive.replace(tzinfo=tz).utcoffset()
+
+    first, last = offset(valid.min()), offset(valid.max())
+    if first == last:
+        return local - np.timedelta64(int(first.total_seconds()), "s")
+    return np.array(
+        [
+            np.datetime64("NaT")
+            if np.isnat(value)
+            else convert_to_utc(value.astype("datetime64[us]").astype(datetime), tz)
+            for value in local
+        ],
+        dtype=local.dtype,
+    )
+
+
+def _per_row(strings: Sequence[str], tz: Optional[tzinfo]) -> np.ndarray:
+    """Per-row fallback: convert_to_utc on each string, NaT where it fails"""
+    converted = [convert_to_utc(s, tz) for s in strings]
+    return np.array(
+        [np.datetime64("NaT") if c is None else c for c in converted],
+        dtype="datetime64[us]",
+    )
+
+
+def _fixed_width_codes(strings: Sequence[str], width: int) -> Optional[np.ndarray]:
+    """Character codes of equal-width ASCII strings as an (n, width) array.
+
+    None when any string has another width or is not ASCII.
+    """
+    if set(map(len, strings)) != {width}:
+        return None
+    try:
+        raw = "".join(strings).encode("ascii")
+    except UnicodeEncodeError:
+        return None
+    return np.frombuffer(raw, dtype=np.uint8).reshape(-1, width)
+
+
+def _digits(codes: np.ndarray, columns: Sequence[int]):
+    """Digit values at the given columns and whether every one is a digit"""
+    digits = codes[:, columns].astype(np.int64) - ord("0")
+    return digits, ((digits >= 0) & (digits <= 9)).all(axis=1)
+
+
+def _is(codes: np.ndarray, columns: Sequence[int], char: str) -> np.ndarray:
+    return (codes[:, columns] == ord(char)).all(axis=1)
+
+
+def _clock(codes: np.ndarray, start: int):
+    """Seconds since midnight of "HH:MM:SS" at column start, and validity"""
+    digits, valid = _digits(codes, [start + c for c in (0, 1, 3, 4, 6, 7)])
+    hms = digits.reshape(-1, 3, 2) @ np.array([10, 1])
+    valid &= _is(codes, [start + 2, start + 5], ":")
+    valid &= (hms < np.array([24, 60, 60])).all(axis=1)
+    return hms @ np.array([3600, 60, 1]), valid
+
+
+def day_timestamps(
+    date: str, times: Sequence[str], tz: Optional[tzinfo] = None
+) -> np.ndarray:
+    """Timestamps for "HH:MM:SS" times on one "YYYY-MM-DD" day.
+
+    The day is parsed once and the times are turned into second offsets in
+    bulk. Returns naive UTC datetime64[us] values, NaT where a time is invalid.
+    """
+    tz = tz or get_source_timezone()
+    if len(times) == 0:
+        return np.array([], dtype="datetime64[us]")
+    try:
+        base = np.datetime64(date, "D").astype("datetime64[us]")
+    except ValueError:
+        logger.error(f"Invalid date {date!r} for intraday times")
+        return np.full(len(times), np.datetime64("NaT"), dtype="datetime64[us]")
+
+    codes = _fixed_width_codes(times, 8)
+    if codes is None:
+        # Not uniformly "HH:MM:SS" (e.g. fractions or ISO strings)
+        return _per_row([f"{date}T{t}" for t in times], tz)
+
+    offsets, valid = _clock(codes, 0)
+    if not valid.all():
+        logger.error(f"{int((~valid).sum())} invalid intraday times on {date}")
+
+    result = base + offsets.astype("timedelta64[s]")
+    result[~valid] = np.datetime64("NaT")
+    return _local_to_utc(result, tz)
+
+
+# Widths of the ISO layouts parsed in bulk -> digits of the fraction
+ISO_WIDTHS = {19: 0, 23: 3, 26: 6}
+
+
+def iso_timestamps(
+    strings: Sequence[str], tz: Optional[tzinfo] = None
+) -> np.ndarray:
+    """Parse "YYYY-MM-DDTHH:MM:SS[.fff[fff]]" timestamps in bulk.
+
+    When every string falls on the same day the date is parsed once. Returns
+    naive UTC datetime64[us] values. Other layouts (including strings with
+    an offset) fall back to per-row conversion; invalid entries become NaT.
+    """
+    tz = tz or get_source_timezone()
+    if len(strings) == 0:
+        return np.array([], dtype="datetime64[us]")
+
+    width = len(strings[0])
+    codes = _fixed_width_codes(strings, width) if width in ISO_WIDTHS else None
+    if codes is None:
+        return _per_row(strings, tz)
+
+    offsets, valid = _clock(codes, 11)
+    micros = offsets * 1_000_000
+    fraction_digits = ISO_WIDTHS[width]
+    if fraction_digits:
+        fraction, fraction_ok = _digits(codes, range(20, 20 + fraction_digits))
+        weights = 10 ** np.arange(5, 5 - fraction_digits, -1)
+        micros += fraction @ weights
+        valid &= fraction_ok & _is(codes, [19], ".")
+    valid &= _is(codes, [4, 7], "-") & _is(codes, [10], "T")
+
+    if (codes[:, :10] == codes[0, :10]).all():
+        # Readings of a single day: parse the date once
+        try:
+            dates = np.datetime64(strings[0][:10], "D")
+        except ValueError:
+            valid[:] = False
+    else:
+        ymd, date_ok = _digits(codes, [0, 1, 2, 3, 5, 6, 8, 9])
+        year = ymd[:, :4] @ np.array([1000, 100, 10, 1])
+        month = ymd[:, 4:6] @ np.array([10, 1])
+        day = ymd[:, 6:] @ np.array([10, 1])
+        months = ((year - 1970) * 12 + month - 1).astype("datetime64[M]")
+        dates = months.astype("datetime64[D]") + (day - 1).astype("timedelta64[D]")
+        # Day 31 of a 30-day month would roll into the next month
+        valid &= date_ok & (month >= 1) & (month <= 12) & (day >= 1)
+        valid &= dates.astype("datetime64[M]") == months
+
+    if not valid.all():
+        return _per_row(strings, tz)
+
+    result = np.asarray(dates, dtype="datetime64[us]") + micros.astype(
+        "timedelta64[us]"
+    )
+    return _local_to_utc(result, tz)
+
+
+def benchmark(days: int = 30, repeats: int = 3):
+    """Compare the per-row path with day_timestamps/iso_timestamps"""
+    date = "2024-01-01"
+    per_second = [
+        f"{s // 3600:02d}:{s // 60 % 60:02d}:{s % 60:02d}" for s in range(86400)
+    ]
+    per_minute_iso = [
+        f"{date}T{m // 60:02d}:{m % 60:02d}:00.000" for m in range(1440)
+    ]
+
+    def best_of(func):
+        timings = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - started)
+        return min(timings)
+
+    cases = [
+        (
+            "HH:MM:SS, 1 day of seconds",
+            len(per_second),
+            lambda: [convert_to_utc(f"{date}T{t}") for t in per_second],
+            lambda: day_timestamps(date, per_second),
+        ),
+        (
+            f"ISO minutes, {days} days",
+            len(per_minute_iso) * days,
+            lambda: [convert_to_utc(s) for _ in range(days) for s in per_minute_iso],
+            lambda: [iso_timestamps(per_minute_iso) for _ in range(days)],
+        ),
+    ]
+
+    print(f"{'Case':<30} {'Rows':>8} {'Per-row':>12} {'Vectorized':>12} {'Speedup':>8}")
+    for name, rows, per_row, vectorized in cases:
+        slow = best_of(per_row)
+        fast = best_of(vectorized)
+        print(
+            f"{name:<30} {rows:>8} {slow * 1000:>10.1f}ms {fast * 1000:>10.1f}ms "
+            f"{slow / fast:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    benchmark(*(int(arg) for arg in sys.argv[1:2]))
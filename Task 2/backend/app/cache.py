@@ -0,0 +1,199 @@
+import os
+import time
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from functools import wraps
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from app.db import async_db_connection
+
+logger = logging.getLogger("app")
+
+RESPONSE_CACHE_ENABLED = (
+    os.environ.get("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+)
+# Seconds a cached response stays valid even without an ingestion update
+RESPONSE_CACHE_TTL = float(os.environ.get("RESPONSE_CACHE_TTL", "300"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+# Minimum seconds between polls of last_processed_dates for ingestion updates
+RESPONSE_CACHE_POLL_INTERVAL = float(
+    os.environ.get("RESPONSE_CACHE_POLL_INTERVAL", "5")
+)
+
+
+class CacheBackend:
+    """Interface for response cache storage.
+
+    Keys are (endpoint, user_id, start, end) tuples. Implementations must
+    handle expiry themselves; get returns (found, value).
+    """
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        raise NotImplementedError("Cache backends must implement get")
+
+    def set(self, key: Hashable, value: Any, ttl: float):
+        raise NotImplementedError("Cache backends must implement set")
+
+    def invalidate(self, match: Callable[[Hashable], bool]) -> int:
+        """Drop every entry whose key satisfies match and return how many were dropped"""
+        raise NotImplementedError("Cache backends must implement invalidate")
+
+    def clear(self):
+        raise NotImplementedError("Cache backends must implement clear")
+
+    def stats(self) -> Dict[str, int]:
+        return {}
+
+
+class InMemoryCache(CacheBackend):
+    """Per-process LRU cache with a TTL on every entry"""
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return False, None
+
+        expires_at, value = entry
+        if time.monotonic() >= expires_at:
+            del self._entries[key]
+            self.misses += 1
+            return False, None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return True, value
+
+    def set(self, key, value, ttl):
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, match):
+        stale = [key for key in self._entries if match(key)]
+        for key in stale:
+            del self._entries[key]
+        self.invalidations += len(stale)
+        return len(stale)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+        }
+
+
+class ResponseCache:
+    """Caches controller results and drops them when ingestion moves on.
+
+    Ingestion bumps last_processed_dates.updated_at after committing a
+    (metric_type, user_id); the table is polled at most once every
+    RESPONSE_CACHE_POLL_INTERVAL seconds and cached responses for any changed
+    pair are invalidated.
+    """
+
+    def __init__(
+        self,
+        backend: CacheBackend,
+        ttl: float = RESPONSE_CACHE_TTL,
+        poll_interval: float = RESPONSE_CACHE_POLL_INTERVAL,
+        enabled: bool = RESPONSE_CACHE_ENABLED,
+    ):
+        self.backend = backend
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self.enabled = enabled
+        self._endpoint_metrics: Dict[str, str] = {}
+        self._versions: Dict[Tuple[str, int], datetime] = {}
+        self._last_poll = float("-inf")
+
+    def invalidate(self, metric_type: str, user_id: Optional[int] = None) -> int:
+        """Drop cached responses for a metric, optionally only for one user"""
+        endpoints = {
+            endpoint
+            for endpoint, metric in self._endpoint_metrics.items()
+            if metric == metric_type
+        }
+        return self.backend.invalidate(
+            lambda key: key[0] in endpoints and (user_id is None or key[1] == user_id)
+        )
+
+    async def poll_ingestion_updates(self, force: bool = False):
+        """Invalidate entries for (metric_type, user_id) pairs ingested since the last poll"""
+        now = time.monotonic()
+        if not force and now - self._last_poll < self.poll_interval:
+            return
+        self._last_poll = now
+
+        try:
+            async with async_db_connection() as conn:
+                async with conn.cursor() as cursor:
+                    await cursor.execute(
+                        "SELECT metric_type, user_id, updated_at FROM last_processed_dates"
+                    )
+                    rows = await cursor.fetchall()
+        except Exception as e:
+            # Without the poll only the TTL bounds staleness
+            logger.error(f"Could not poll last_processed_dates for the cache: {e}")
+            return
+
+        for metric_type, user_id, updated_at in rows:
+            previous = self._versions.get((metric_type, user_id))
+            self._versions[(metric_type, user_id)] = updated_at
+            if previous is not None and previous != updated_at:
+                dropped = self.invalidate(metric_type, user_id)
+                logger.info(
+                    f"Ingestion updated {metric_type} for user {user_id}, dropped {dropped} cached responses"
+                )
+
+    def cached(self, metric_type: str):
+        """Decorate an async controller taking (user_id, start_date, end_date)"""
+
+        def decorator(func):
+            endpoint = func.__name__
+            self._endpoint_metrics[endpoint] = metric_type
+
+            @wraps(func)
+            async def wrapper(user_id: int, start_date: datetime, end_date: datetime):
+                if not self.enabled:
+                    return await func(user_id, start_date, end_date)
+
+                await self.poll_ingestion_updates()
+                key = (endpoint, user_id, start_date.isoformat(), end_date.isoformat())
+                found, value = self.backend.get(key)
+                if found:
+                    return list(value)
+
+                value = await func(user_id, start_date, end_date)
+                # Controllers return [] on database errors, so empty results are not kept
+                if value:
+                    self.backend.set(key, list(value), self.ttl)
+                return value
+
+            return wrapper
+
+        return decorator
+
+    def stats(self) -> Dict[str, int]:
+        return self.backend.stats()
+
+
+response_cache = ResponseCache(InMemoryCache())
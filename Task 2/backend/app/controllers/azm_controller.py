@@ -1,16 +1,40 @@
 from datetime import datetime, timedelta
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import logging
 
+import psycopg
+
+from app.cache import response_cache
 from app.config.timezone import GMT6
-from app.db import get_db_connection
-from psycopg2.extras import RealDictCursor
+from app.db import get_async_db_connection, release_async_db_connection
+from app.utils.columnar import Columns, fetch_columns
+from app.utils.date_parser import whole_utc_days
+from app.utils.pagination import PageRequest, fetch_page
+from app.utils.streaming import RowBatches, open_row_stream
+from psycopg.rows import dict_row
 
 logger = logging.getLogger("app")
 
 
-def get_all_azm_data(
-    user_id: int, start_date: datetime, end_date: datetime
+# Raw rows in the requested range, read by get_all_* and stream_all_*
+ALL_AZM_QUERY = """
+SELECT 
+    timestamp,
+    fat_burn_minutes, 
+    cardio_minutes, 
+    peak_minutes, 
+    active_zone_minutes 
+FROM active_zone_minutes
+WHERE user_id = %s AND timestamp BETWEEN %s AND %s
+ORDER BY timestamp
+"""
+
+
+async def get_all_azm_data(
+    user_id: int,
+    start_date: datetime,
+    end_date: datetime,
+    fallback_limit: int = 100,
 ) -> List[Dict[str, Any]]:
     if start_date.tzinfo is None:
         start_date = GMT6.localize(start_date)
@@ -21,29 +45,14 @@ def get_all_azm_data(
     cursor = None
 
     try:
-        conn = get_db_connection()
+        conn = await get_async_db_connection()
         cursor = None
 
-        # Set timezone for this connection
-        with conn.cursor() as tz_cursor:
-            tz_cursor.execute("SET TIME ZONE 'UTC'")
-
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        cursor = conn.cursor(row_factory=dict_row)
 
         # Try to get data for requested period
-        query = """
-        SELECT 
-            timestamp,
-            fat_burn_minutes, 
-            cardio_minutes, 
-            peak_minutes, 
-            active_zone_minutes 
-        FROM active_zone_minutes
-        WHERE user_id = %s AND timestamp BETWEEN %s AND %s
-        ORDER BY timestamp
-        """
-        cursor.execute(query, (user_id, start_date, end_date))
-        results = cursor.fetchall()
+        await cursor.execute(ALL_AZM_QUERY, (user_id, start_date, end_date))
+        results = await cursor.fetchall()
 
         # Fallback mechanism starts here
         if not results:
@@ -60,15 +69,15 @@ def get_all_azm_data(
             FROM active_zone_minutes
             WHERE user_id = %s AND timestamp <= %s
             ORDER BY timestamp DESC
-            LIMIT 100
+            LIMIT %s
             """
-            cursor.execute(fallback_query, (user_id, end_date))
-            results = cursor.fetchall()
+            await cursor.execute(fallback_query, (user_id, end_date, fallback_limit))
+            results = await cursor.fetchall()
 
             if not results:
                 user_check_query = "SELECT user_id FROM USERS WHERE user_id = %s"
-                cursor.execute(user_check_query, (user_id,))
-                user_exists = cursor.fetchone()
+                await cursor.execute(user_check_query, (user_id,))
+                user_exists = await cursor.fetchone()
 
                 if not user_exists:
                     raise ValueError(f"User {user_id} does not exist")
@@ -85,12 +94,70 @@ def get_all_azm_data(
         return []
     finally:
         if cursor:
-            cursor.close()
+            await cursor.close()
         if conn:
-            conn.close()
+            await release_async_db_connection(conn)
+
+
+async def get_all_azm_page(
+    user_id: int, start_date: datetime, end_date: datetime, page: PageRequest
+) -> Optional[Dict[str, Any]]:
+    """One keyset page of get_all_azm_data; None if the range is empty"""
+    if start_date.tzinfo is None:
+        start_date = GMT6.localize(start_date)
+    if end_date.tzinfo is None:
+        end_date = GMT6.localize(end_date)
+
+    return await fetch_page(
+        "active_zone_minutes",
+        [
+            "timestamp",
+            "fat_burn_minutes",
+            "cardio_minutes",
+            "peak_minutes",
+            "active_zone_minutes",
+        ],
+        user_id,
+        start_date,
+        end_date,
+        page,
+    )
+
+
+async def stream_all_azm_data(
+    user_id: int, start_date: datetime, end_date: datetime
+) -> Optional[RowBatches]:
+    """Rows of get_all_azm_data in batches from a server-side cursor.
+
+    Returns None when the range is empty so the caller can fall back to
+    get_all_azm_data.
+    """
+    if start_date.tzinfo is None:
+        start_date = GMT6.localize(start_date)
+    if end_date.tzinfo is None:
+        end_date = GMT6.localize(end_date)
+
+    return await open_row_stream(ALL_AZM_QUERY, (user_id, start_date, end_date))
+
+
+async def get_all_azm_columns(
+    user_id: int, start_date: datetime, end_date: datetime
+) -> Optional[Columns]:
+    """Rows of get_all_azm_data as one list per column, timestamps in epoch ms.
+
+    Returns None when the range is empty so the caller can fall back to
+    get_all_azm_data.
+    """
+    if start_date.tzinfo is None:
+        start_date = GMT6.localize(start_date)
+    if end_date.tzinfo is None:
+        end_date = GMT6.localize(end_date)
+
+    return await fetch_columns(ALL_AZM_QUERY, (user_id, start_date, end_date))
 
 
-def get_daily_avg_azm_data(
+@response_cache.cached("active_zone_minutes")
+async def get_daily_avg_azm_data(
     user_id: int, start_date: datetime, end_date: datetime
 ) -> List[Dict[str, Any]]:
     if start_date.tzinfo is None:
@@ -102,14 +169,10 @@ def get_daily_avg_azm_data(
     cursor = None
 
     try:
-        conn = get_db_connection()
+        conn = await get_async_db_connection()
         cursor = None
 
-        # Set timezone for this connection
-        with conn.cursor() as tz_cursor:
-            tz_cursor.execute("SET TIME ZONE 'UTC'")
-
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        cursor = conn.cursor(row_factory=dict_row)
 
         # Try to get data for requested period
         query = """
@@ -124,8 +187,73 @@ def get_daily_avg_azm_data(
         GROUP BY day
         ORDER BY day
         """
-        cursor.execute(query, (user_id, start_date, end_date))
-        results = cursor.fetchall()
+        # Whole UTC days from the Task 3 daily rollup, edge days from raw rows;
+        # sum/count keeps the average exact
+        rollup_query = """
+        SELECT
+            bucket AT TIME ZONE '+06:00' AS day,
+            SUM(fat_burn_minutes_sum) / NULLIF(SUM(fat_burn_minutes_count), 0) AS avg_fat_burn_minutes,
+            SUM(cardio_minutes_sum) / NULLIF(SUM(cardio_minutes_count), 0) AS avg_cardio_minutes,
+            SUM(peak_minutes_sum) / NULLIF(SUM(peak_minutes_count), 0) AS avg_peak_minutes,
+            SUM(active_zone_minutes_sum) / NULLIF(SUM(active_zone_minutes_count), 0) AS avg_active_zone_minutes
+        FROM (
+            SELECT
+                bucket,
+                fat_burn_minutes_sum,
+                fat_burn_minutes_count,
+                cardio_minutes_sum,
+                cardio_minutes_count,
+                peak_minutes_sum,
+                peak_minutes_count,
+                active_zone_minutes_sum,
+                active_zone_minutes_count
+            FROM active_zone_minutes_1d
+            WHERE user_id = %(user_id)s
+              AND bucket >= %(first_day)s AND bucket < %(last_day)s
+            UNION ALL
+            -- Partial days at the edges of the range come from raw rows
+            SELECT
+                date_trunc('day', timestamp),
+                SUM(fat_burn_minutes),
+                COUNT(fat_burn_minutes),
+                SUM(cardio_minutes),
+                COUNT(cardio_minutes),
+                SUM(peak_minutes),
+                COUNT(peak_minutes),
+                SUM(active_zone_minutes),
+                COUNT(active_zone_minutes)
+            FROM active_zone_minutes
+            WHERE user_id = %(user_id)s
+              AND (
+                (timestamp >= %(start)s AND timestamp < %(first_day)s)
+                OR (timestamp >= %(last_day)s AND timestamp <= %(end)s)
+              )
+            GROUP BY 1
+        ) days
+        GROUP BY bucket
+        ORDER BY bucket
+        """
+        results = []
+        whole_days = whole_utc_days(start_date, end_date)
+        try:
+            if whole_days:
+                await cursor.execute(
+                    rollup_query,
+                    {
+                        "user_id": user_id,
+                        "start": start_date,
+                        "end": end_date,
+                        "first_day": whole_days[0],
+                        "last_day": whole_days[1],
+                    },
+                )
+                results = await cursor.fetchall()
+        except psycopg.Error as e:
+            logger.warning(f"active_zone_minutes_1d rollup unavailable, using raw AZM data: {e}")
+
+        if not results:
+            await cursor.execute(query, (user_id, start_date, end_date))
+            results = await cursor.fetchall()
 
         # Fallback mechanism starts here
         if not results:
@@ -135,13 +263,13 @@ def get_daily_avg_azm_data(
             extended_start = start_date - timedelta(days=7)
             extended_end = end_date + timedelta(days=7)
 
-            cursor.execute(query, (user_id, extended_start, extended_end))
-            results = cursor.fetchall()
+            await cursor.execute(query, (user_id, extended_start, extended_end))
+            results = await cursor.fetchall()
 
             if not results:
                 user_check_query = "SELECT user_id FROM USERS WHERE user_id = %s"
-                cursor.execute(user_check_query, (user_id,))
-                user_exists = cursor.fetchone()
+                await cursor.execute(user_check_query, (user_id,))
+                user_exists = await cursor.fetchone()
 
                 if not user_exists:
                     raise ValueError(f"User {user_id} does not exist")
@@ -158,6 +286,6 @@ def get_daily_avg_azm_data(
         return []
     finally:
         if cursor:
-            cursor.close()
+            await cursor.close()
         if conn:
-            conn.close()
+            await release_async_db_connection(conn)
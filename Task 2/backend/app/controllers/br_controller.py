@@ -1,16 +1,20 @@
 from datetime import datetime, timedelta
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import logging
 
 from app.config.timezone import GMT6
-from app.db import get_db_connection
-from psycopg2.extras import RealDictCursor
+from app.db import get_async_db_connection, release_async_db_connection
+from app.utils.pagination import PageRequest, fetch_page
+from psycopg.rows import dict_row
 
 logger = logging.getLogger("app")
 
 
-def get_all_breathing_rate_data(
-    user_id: int, start_date: datetime, end_date: datetime
+async def get_all_breathing_rate_data(
+    user_id: int,
+    start_date: datetime,
+    end_date: datetime,
+    fallback_limit: int = 100,
 ) -> List[Dict[str, Any]]:
     if start_date.tzinfo is None:
         start_date = GMT6.localize(start_date)
@@ -21,14 +25,10 @@ def get_all_breathing_rate_data(
     cursor = None
 
     try:
-        conn = get_db_connection()
+        conn = await get_async_db_connection()
         cursor = None
 
-        # Set timezone for this connection
-        with conn.cursor() as tz_cursor:
-            tz_cursor.execute("SET TIME ZONE 'UTC'")
-
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        cursor = conn.cursor(row_factory=dict_row)
 
         # Try to get data for requested period
         query = """
@@ -42,8 +42,8 @@ def get_all_breathing_rate_data(
         WHERE user_id = %s AND timestamp BETWEEN %s AND %s
         ORDER BY timestamp
         """
-        cursor.execute(query, (user_id, start_date, end_date))
-        results = cursor.fetchall()
+        await cursor.execute(query, (user_id, start_date, end_date))
+        results = await cursor.fetchall()
 
         # Fallback mechanism starts here
         if not results:
@@ -60,15 +60,15 @@ def get_all_breathing_rate_data(
             FROM breathing_rate
             WHERE user_id = %s AND timestamp <= %s
             ORDER BY timestamp DESC
-            LIMIT 100
+            LIMIT %s
             """
-            cursor.execute(fallback_query, (user_id, end_date))
-            results = cursor.fetchall()
+            await cursor.execute(fallback_query, (user_id, end_date, fallback_limit))
+            results = await cursor.fetchall()
 
             if not results:
                 user_check_query = "SELECT user_id FROM USERS WHERE user_id = %s"
-                cursor.execute(user_check_query, (user_id,))
-                user_exists = cursor.fetchone()
+                await cursor.execute(user_check_query, (user_id,))
+                user_exists = await cursor.fetchone()
 
                 if not user_exists:
                     raise ValueError(f"User {user_id} does not exist")
@@ -85,6 +85,31 @@ def get_all_breathing_rate_data(
         return []
     finally:
         if cursor:
-            cursor.close()
+            await cursor.close()
         if conn:
-            conn.close()
+            await release_async_db_connection(conn)
+
+
+async def get_all_breathing_rate_page(
+    user_id: int, start_date: datetime, end_date: datetime, page: PageRequest
+) -> Optional[Dict[str, Any]]:
+    """One keyset page of get_all_breathing_rate_data; None if the range is empty"""
+    if start_date.tzinfo is None:
+        start_date = GMT6.localize(start_date)
+    if end_date.tzinfo is None:
+        end_date = GMT6.localize(end_date)
+
+    return await fetch_page(
+        "breathing_rate",
+        [
+            "timestamp",
+            "deep_sleep_rate",
+            "rem_sleep_rate",
+            "light_sleep_rate",
+            "full_sleep_rate",
+        ],
+        user_id,
+        start_date,
+        end_date,
+        page,
+    )
@@ -1,13 +1,13 @@
 from typing import List, Dict, Any
 
-from app.db import get_db_connection
-from psycopg2.extras import RealDictCursor
+from app.db import async_db_connection
+from psycopg.rows import dict_row
 
 
-def get_all_devices() -> List[Dict[str, Any]]:
-    with get_db_connection() as conn:
-        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-            cursor.execute(
+async def get_all_devices() -> List[Dict[str, Any]]:
+    async with async_db_connection() as conn:
+        async with conn.cursor(row_factory=dict_row) as cursor:
+            await cursor.execute(
                 """
                 SELECT 
                     device_id,
@@ -19,13 +19,13 @@ def get_all_devices() -> List[Dict[str, Any]]:
                 ORDER BY registered_at
                 """
             )
-            return cursor.fetchall()
+            return await cursor.fetchall()
 
 
-def get_device_by_id(device_id: str) -> Dict[str, Any]:
-    with get_db_connection() as conn:
-        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-            cursor.execute(
+async def get_device_by_id(device_id: str) -> Dict[str, Any]:
+    async with async_db_connection() as conn:
+        async with conn.cursor(row_factory=dict_row) as cursor:
+            await cursor.execute(
                 """
                 SELECT 
                     device_id,
@@ -38,4 +38,4 @@ def get_device_by_id(device_id: str) -> Dict[str, Any]:
                 """,
                 (device_id,),
             )
-            return cursor.fetchone()
+            return await cursor.fetchone()
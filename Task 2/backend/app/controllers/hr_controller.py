@@ -1,31 +1,65 @@
 from datetime import datetime, timedelta
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import logging
 
+import psycopg
+
+from app.cache import response_cache
 from app.config.timezone import GMT6
-from app.db import get_db_connection
-from psycopg2.extras import RealDictCursor
+from app.db import get_async_db_connection, release_async_db_connection
+from app.utils.columnar import Columns, fetch_columns
+from app.utils.date_parser import bucket_count, whole_buckets
+from app.utils.pagination import PageRequest, fetch_page
+from app.utils.streaming import RowBatches, open_row_stream
+from psycopg.rows import dict_row
 
 logger = logging.getLogger("app")
 
-
-def get_all_heart_rate_data(
-    user_id: int, start_date: datetime, end_date: datetime
+# Heart rate aggregation hierarchy from Task 3, finest first:
+# (resolution, view, time_bucket width)
+HEART_RATE_LEVELS = [
+    ("1m", "heart_rate_1m", timedelta(minutes=1)),
+    ("1h", "heart_rate_1h", timedelta(hours=1)),
+    ("1d", "heart_rate_1d", timedelta(days=1)),
+    ("1w", "heart_rate_1w", timedelta(days=7)),
+    ("1mo", "heart_rate_1mo", timedelta(days=30)),
+]
+
+# Longest range served by each level when no max_points budget is given,
+# matching get_optimal_heart_rate_table() in Task 3
+HEART_RATE_LEVEL_MAX_RANGE = {
+    "1m": timedelta(days=1),
+    "1h": timedelta(days=7),
+    "1d": timedelta(days=30),
+    "1w": timedelta(days=90),
+}
+
+
+# Raw rows in the requested range, read by get_all_* and stream_all_*
+ALL_HEART_RATE_QUERY = """
+SELECT timestamp, value 
+FROM HEART_RATE 
+WHERE user_id = %s AND timestamp BETWEEN %s AND %s 
+ORDER BY timestamp
+"""
+
+
+async def get_all_heart_rate_data(
+    user_id: int,
+    start_date: datetime,
+    end_date: datetime,
+    fallback_limit: int = 100,
 ) -> List[Dict[str, Any]]:
+    conn = None
+    cursor = None
 
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
+        conn = await get_async_db_connection()
+        cursor = conn.cursor(row_factory=dict_row)
 
         # Try to get data for requested period
-        query = """
-        SELECT timestamp, value 
-        FROM HEART_RATE 
-        WHERE user_id = %s AND timestamp BETWEEN %s AND %s 
-        ORDER BY timestamp
-        """
-        cursor.execute(query, (user_id, start_date, end_date))
-        data = cursor.fetchall()
+        await cursor.execute(ALL_HEART_RATE_QUERY, (user_id, start_date, end_date))
+        data = await cursor.fetchall()
 
         # Fallback 1: If no data in requested range, try to get most recent data
         if not data:
@@ -37,16 +71,16 @@ def get_all_heart_rate_data(
             FROM HEART_RATE 
             WHERE user_id = %s AND timestamp <= %s 
             ORDER BY timestamp DESC 
-            LIMIT 100
+            LIMIT %s
             """
-            cursor.execute(fallback_query, (user_id, end_date))
-            data = cursor.fetchall()
+            await cursor.execute(fallback_query, (user_id, end_date, fallback_limit))
+            data = await cursor.fetchall()
 
             # Fallback 2: If still no data, check if user exists but has no heart rate data
             if not data:
                 user_check_query = "SELECT user_id FROM USERS WHERE user_id = %s"
-                cursor.execute(user_check_query, (user_id,))
-                user_exists = cursor.fetchone()
+                await cursor.execute(user_check_query, (user_id,))
+                user_exists = await cursor.fetchone()
 
                 if not user_exists:
                     raise ValueError(f"User {user_id} does not exist")
@@ -62,12 +96,52 @@ def get_all_heart_rate_data(
         return []
     finally:
         if cursor:
-            cursor.close()
+            await cursor.close()
         if conn:
-            conn.close()
+            await release_async_db_connection(conn)
+
+
+async def get_all_heart_rate_page(
+    user_id: int, start_date: datetime, end_date: datetime, page: PageRequest
+) -> Optional[Dict[str, Any]]:
+    """One keyset page of get_all_heart_rate_data; None if the range is empty"""
+    return await fetch_page(
+        "HEART_RATE",
+        [
+            "timestamp",
+            "value",
+        ],
+        user_id,
+        start_date,
+        end_date,
+        page,
+    )
+
+
+async def stream_all_heart_rate_data(
+    user_id: int, start_date: datetime, end_date: datetime
+) -> Optional[RowBatches]:
+    """Rows of get_all_heart_rate_data in batches from a server-side cursor.
 
+    Returns None when the range is empty so the caller can fall back to
+    get_all_heart_rate_data.
+    """
+    return await open_row_stream(ALL_HEART_RATE_QUERY, (user_id, start_date, end_date))
 
-def get_daily_avg_heart_rate_data(
+
+async def get_all_heart_rate_columns(
+    user_id: int, start_date: datetime, end_date: datetime
+) -> Optional[Columns]:
+    """Rows of get_all_heart_rate_data as one list per column, timestamps in epoch ms.
+
+    Returns None when the range is empty so the caller can fall back to
+    get_all_heart_rate_data.
+    """
+    return await fetch_columns(ALL_HEART_RATE_QUERY, (user_id, start_date, end_date))
+
+
+@response_cache.cached("heart_rate")
+async def get_daily_avg_heart_rate_data(
     user_id: int, start_date: datetime, end_date: datetime
 ) -> List[Dict[str, Any]]:
 
@@ -80,14 +154,10 @@ def get_daily_avg_heart_rate_data(
     cursor = None
 
     try:
-        conn = get_db_connection()
+        conn = await get_async_db_connection()
         cursor = None
 
-        # Set timezone for this connection
-        with conn.cursor() as tz_cursor:
-            tz_cursor.execute("SET TIME ZONE 'UTC'")
-
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        cursor = conn.cursor(row_factory=dict_row)
 
         # Try to get data for requested period
         query = """
@@ -100,8 +170,8 @@ def get_daily_avg_heart_rate_data(
         GROUP BY day
         ORDER BY day
         """
-        cursor.execute(query, (user_id, start_date, end_date))
-        results = cursor.fetchall()
+        await cursor.execute(query, (user_id, start_date, end_date))
+        results = await cursor.fetchall()
 
         # Fallback 1: If no data in requested range, try extending the date range by 7 days
         if not results:
@@ -111,14 +181,14 @@ def get_daily_avg_heart_rate_data(
             extended_start = start_date - timedelta(days=7)
             extended_end = end_date + timedelta(days=7)
 
-            cursor.execute(query, (user_id, extended_start, extended_end))
-            results = cursor.fetchall()
+            await cursor.execute(query, (user_id, extended_start, extended_end))
+            results = await cursor.fetchall()
 
             # Fallback 2: If still no data, check if user exists but has no heart rate data
             if not results:
                 user_check_query = "SELECT user_id FROM USERS WHERE user_id = %s"
-                cursor.execute(user_check_query, (user_id,))
-                user_exists = cursor.fetchone()
+                await cursor.execute(user_check_query, (user_id,))
+                user_exists = await cursor.fetchone()
 
                 if not user_exists:
                     raise ValueError(f"User {user_id} does not exist")
@@ -136,12 +206,12 @@ def get_daily_avg_heart_rate_data(
         return []
     finally:
         if cursor:
-            cursor.close()
+            await cursor.close()
         if conn:
-            conn.close()
+            await release_async_db_connection(conn)
 
 
-def get_heart_rate_zones_data(
+async def get_heart_rate_zones_data(
     user_id: int, start_date: datetime, end_date: datetime
 ) -> List[Dict[str, Any]]:
 
@@ -154,14 +224,10 @@ def get_heart_rate_zones_data(
     cursor = None
 
     try:
-        conn = get_db_connection()
+        conn = await get_async_db_connection()
         cursor = None
 
-        # Set timezone for this connection
-        with conn.cursor() as tz_cursor:
-            tz_cursor.execute("SET TIME ZONE 'UTC'")
-
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        cursor = conn.cursor(row_factory=dict_row)
 
         # Try to get data for requested period
         query = """
@@ -176,8 +242,8 @@ def get_heart_rate_zones_data(
         WHERE user_id = %s AND timestamp BETWEEN %s AND %s
         ORDER BY timestamp, zone_name
         """
-        cursor.execute(query, (user_id, start_date, end_date))
-        results = cursor.fetchall()
+        await cursor.execute(query, (user_id, start_date, end_date))
+        results = await cursor.fetchall()
 
         # Fallback 1: If no data in requested range, try most recent data
         if not results:
@@ -197,14 +263,14 @@ def get_heart_rate_zones_data(
             ORDER BY timestamp DESC, zone_name
             LIMIT 100
             """
-            cursor.execute(fallback_query, (user_id, end_date))
-            results = cursor.fetchall()
+            await cursor.execute(fallback_query, (user_id, end_date))
+            results = await cursor.fetchall()
 
             # Fallback 2: If still no data, check if user exists but has no heart rate zones data
             if not results:
                 user_check_query = "SELECT user_id FROM USERS WHERE user_id = %s"
-                cursor.execute(user_check_query, (user_id,))
-                user_exists = cursor.fetchone()
+                await cursor.execute(user_check_query, (user_id,))
+                user_exists = await cursor.fetchone()
 
                 if not user_exists:
                     raise ValueError(f"User {user_id} does not exist")
@@ -222,6 +288,159 @@ def get_heart_rate_zones_data(
         return []
     finally:
         if cursor:
-            cursor.close()
+            await cursor.close()
+        if conn:
+            await release_async_db_connection(conn)
+
+
+def select_heart_rate_level(
+    start_date: datetime, end_date: datetime, max_points: Optional[int] = None
+):
+    """Pick the aggregation level for a range.
+
+    With max_points, the finest level whose aligned buckets, partial ones at
+    either edge included, fit the budget is used. If even the monthly buckets
+    do not fit, they are merged into multiples of 30 days until they do.
+    Otherwise the coarsest level suited to the range length is used.
+    """
+    span = end_date - start_date
+    if max_points:
+        for level in HEART_RATE_LEVELS:
+            if bucket_count(start_date, end_date, level[2]) <= max_points:
+                return level
+        _, view, width = HEART_RATE_LEVELS[-1]
+        multiple = 2
+        while bucket_count(start_date, end_date, width * multiple) > max_points:
+            multiple += 1
+        return f"{(width * multiple).days}d", view, width * multiple
+
+    for level in HEART_RATE_LEVELS[:-1]:
+        if span <= HEART_RATE_LEVEL_MAX_RANGE[level[0]]:
+            return level
+    return HEART_RATE_LEVELS[-1]
+
+
+async def get_heart_rate_series(
+    user_id: int,
+    start_date: datetime,
+    end_date: datetime,
+    max_points: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Bucketed heart rate (avg/min/max/sample_count) from the aggregation hierarchy"""
+    if start_date.tzinfo is None:
+        start_date = GMT6.localize(start_date)
+    if end_date.tzinfo is None:
+        end_date = GMT6.localize(end_date)
+
+    resolution, view, width = select_heart_rate_level(start_date, end_date, max_points)
+    result = {"resolution": resolution, "source": view, "data": []}
+
+    conn = None
+    cursor = None
+
+    try:
+        conn = await get_async_db_connection()
+        cursor = conn.cursor(row_factory=dict_row)
+
+        # Whole buckets inside the range come from the view; the partial
+        # buckets at either edge are built from raw rows bounded by the range,
+        # like the raw fallback below. Devices are merged per bucket from the
+        # stored sum/count partial state.
+        view_query = f"""
+        SELECT
+            bucket,
+            SUM(sum_heart_rate)::DOUBLE PRECISION / NULLIF(SUM(value_count), 0) AS avg_heart_rate,
+            MIN(min_heart_rate) AS min_heart_rate,
+            MAX(max_heart_rate) AS max_heart_rate,
+            SUM(sample_count) AS sample_count
+        FROM (
+            SELECT
+                time_bucket(%(width)s, bucket) AS bucket,
+                sum_heart_rate,
+                value_count,
+                min_heart_rate,
+                max_heart_rate,
+                sample_count
+            FROM {view}
+            WHERE user_id = %(user_id)s
+              AND bucket >= %(first_bucket)s AND bucket < %(last_bucket)s
+            UNION ALL
+            SELECT
+                time_bucket(%(width)s, timestamp),
+                SUM(value),
+                COUNT(value),
+                MIN(value),
+                MAX(value),
+                COUNT(*)
+            FROM heart_rate
+            WHERE user_id = %(user_id)s
+              AND (
+                (timestamp >= %(start)s AND timestamp < %(first_bucket)s)
+                OR (timestamp >= %(last_bucket)s AND timestamp <= %(end)s)
+              )
+            GROUP BY 1
+        ) buckets
+        GROUP BY bucket
+        ORDER BY bucket
+        """
+        whole = whole_buckets(start_date, end_date, width)
+        try:
+            if whole:
+                await cursor.execute(
+                    view_query,
+                    {
+                        "user_id": user_id,
+                        "width": width,
+                        "start": start_date,
+                        "end": end_date,
+                        "first_bucket": whole[0],
+                        "last_bucket": whole[1],
+                    },
+                )
+                result["data"] = await cursor.fetchall()
+        except psycopg.Error as e:
+            # Missing or never-populated view
+            logger.warning(f"Could not read {view}, falling back to raw data: {e}")
+
+        # Fallback 1: Bucket the raw hypertable when the view has nothing for
+        # the range, or when the range holds no whole bucket
+        if not result["data"]:
+            raw_query = """
+            SELECT
+                time_bucket(%s, timestamp) AS bucket,
+                AVG(value) AS avg_heart_rate,
+                MIN(value) AS min_heart_rate,
+                MAX(value) AS max_heart_rate,
+                COUNT(*) AS sample_count
+            FROM heart_rate
+            WHERE user_id = %s AND timestamp BETWEEN %s AND %s
+            GROUP BY bucket
+            ORDER BY bucket
+            """
+            await cursor.execute(raw_query, (width, user_id, start_date, end_date))
+            result["data"] = await cursor.fetchall()
+            result["source"] = "heart_rate"
+
+            # Fallback 2: If still no data, check if user exists but has no heart rate data
+            if not result["data"]:
+                user_check_query = "SELECT user_id FROM USERS WHERE user_id = %s"
+                await cursor.execute(user_check_query, (user_id,))
+                user_exists = await cursor.fetchone()
+
+                if not user_exists:
+                    raise ValueError(f"User {user_id} does not exist")
+                else:
+                    logger.warning(f"User {user_id} exists but has no heart rate data")
+
+        return result
+
+    except Exception as e:
+        logger.error(f"Database error in get_heart_rate_series: {str(e)}")
+        # Fallback 3: Return empty series rather than crashing
+        result["data"] = []
+        return result
+    finally:
+        if cursor:
+            await cursor.close()
         if conn:
-            conn.close()
+            await release_async_db_connection(conn)
@@ -1,16 +1,37 @@
 from datetime import datetime, timedelta
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import logging
 
+import psycopg
+
+from app.cache import response_cache
 from app.config.timezone import GMT6
-from app.db import get_db_connection
-from psycopg2.extras import RealDictCursor
+from app.db import get_async_db_connection, release_async_db_connection
+from app.utils.columnar import Columns, fetch_columns
+from app.utils.date_parser import whole_utc_days
+from app.utils.pagination import PageRequest, fetch_page
+from app.utils.streaming import RowBatches, open_row_stream
+from psycopg.rows import dict_row
 
 logger = logging.getLogger("app")
 
 
-def get_all_spo2_data(
-    user_id: int, start_date: datetime, end_date: datetime
+# Raw rows in the requested range, read by get_all_* and stream_all_*
+ALL_SPO2_QUERY = """
+SELECT 
+    timestamp,
+    value
+FROM spo2
+WHERE user_id = %s AND timestamp BETWEEN %s AND %s
+ORDER BY timestamp
+"""
+
+
+async def get_all_spo2_data(
+    user_id: int,
+    start_date: datetime,
+    end_date: datetime,
+    fallback_limit: int = 100,
 ) -> List[Dict[str, Any]]:
     if start_date.tzinfo is None:
         start_date = GMT6.localize(start_date)
@@ -21,26 +42,14 @@ def get_all_spo2_data(
     cursor = None
 
     try:
-        conn = get_db_connection()
+        conn = await get_async_db_connection()
         cursor = None
 
-        # Set timezone for this connection
-        with conn.cursor() as tz_cursor:
-            tz_cursor.execute("SET TIME ZONE 'UTC'")
-
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        cursor = conn.cursor(row_factory=dict_row)
 
         # Try to get data for requested period
-        query = """
-        SELECT 
-            timestamp,
-            value
-        FROM spo2
-        WHERE user_id = %s AND timestamp BETWEEN %s AND %s
-        ORDER BY timestamp
-        """
-        cursor.execute(query, (user_id, start_date, end_date))
-        results = cursor.fetchall()
+        await cursor.execute(ALL_SPO2_QUERY, (user_id, start_date, end_date))
+        results = await cursor.fetchall()
 
         # Fallback mechanism starts here
         if not results:
@@ -54,15 +63,15 @@ def get_all_spo2_data(
             FROM spo2
             WHERE user_id = %s AND timestamp <= %s
             ORDER BY timestamp DESC
-            LIMIT 100
+            LIMIT %s
             """
-            cursor.execute(fallback_query, (user_id, end_date))
-            results = cursor.fetchall()
+            await cursor.execute(fallback_query, (user_id, end_date, fallback_limit))
+            results = await cursor.fetchall()
 
             if not results:
                 user_check_query = "SELECT user_id FROM USERS WHERE user_id = %s"
-                cursor.execute(user_check_query, (user_id,))
-                user_exists = cursor.fetchone()
+                await cursor.execute(user_check_query, (user_id,))
+                user_exists = await cursor.fetchone()
 
                 if not user_exists:
                     raise ValueError(f"User {user_id} does not exist")
@@ -77,12 +86,67 @@ def get_all_spo2_data(
         return []
     finally:
         if cursor:
-            cursor.close()
+            await cursor.close()
         if conn:
-            conn.close()
+            await release_async_db_connection(conn)
+
+
+async def get_all_spo2_page(
+    user_id: int, start_date: datetime, end_date: datetime, page: PageRequest
+) -> Optional[Dict[str, Any]]:
+    """One keyset page of get_all_spo2_data; None if the range is empty"""
+    if start_date.tzinfo is None:
+        start_date = GMT6.localize(start_date)
+    if end_date.tzinfo is None:
+        end_date = GMT6.localize(end_date)
+
+    return await fetch_page(
+        "spo2",
+        [
+            "timestamp",
+            "value",
+        ],
+        user_id,
+        start_date,
+        end_date,
+        page,
+    )
+
+
+async def stream_all_spo2_data(
+    user_id: int, start_date: datetime, end_date: datetime
+) -> Optional[RowBatches]:
+    """Rows of get_all_spo2_data in batches from a server-side cursor.
+
+    Returns None when the range is empty so the caller can fall back to
+    get_all_spo2_data.
+    """
+    if start_date.tzinfo is None:
+        start_date = GMT6.localize(start_date)
+    if end_date.tzinfo is None:
+        end_date = GMT6.localize(end_date)
+
+    return await open_row_stream(ALL_SPO2_QUERY, (user_id, start_date, end_date))
+
+
+async def get_all_spo2_columns(
+    user_id: int, start_date: datetime, end_date: datetime
+) -> Optional[Columns]:
+    """Rows of get_all_spo2_data as one list per column, timestamps in epoch ms.
+
+    Returns None when the range is empty so the caller can fall back to
+    get_all_spo2_data.
+    """
+    if start_date.tzinfo is None:
+        start_date = GMT6.localize(start_date)
+    if end_date.tzinfo is None:
+        end_date = GMT6.localize(end_date)
+
+    return await fetch_columns(ALL_SPO2_QUERY, (user_id, start_date, end_date))
 
 
-def get_daily_avg_spo2_data(
+@response_cache.cached("spo2")
+async def get_daily_avg_spo2_data(
     user_id: int, start_date: datetime, end_date: datetime
 ) -> List[Dict[str, Any]]:
     if start_date.tzinfo is None:
@@ -94,14 +158,10 @@ def get_daily_avg_spo2_data(
     cursor = None
 
     try:
-        conn = get_db_connection()
+        conn = await get_async_db_connection()
         cursor = None
 
-        # Set timezone for this connection
-        with conn.cursor() as tz_cursor:
-            tz_cursor.execute("SET TIME ZONE 'UTC'")
-
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        cursor = conn.cursor(row_factory=dict_row)
 
         # Try to get data for requested period
         query = """
@@ -113,8 +173,58 @@ def get_daily_avg_spo2_data(
         GROUP BY day
         ORDER BY day
         """
-        cursor.execute(query, (user_id, start_date, end_date))
-        results = cursor.fetchall()
+        # Whole UTC days from the Task 3 daily rollup, edge days from raw rows;
+        # sum/count keeps the average exact
+        rollup_query = """
+        SELECT
+            bucket AT TIME ZONE '+06:00' AS day,
+            SUM(value_sum) / NULLIF(SUM(value_count), 0) AS avg_spo2
+        FROM (
+            SELECT
+                bucket,
+                value_sum,
+                value_count
+            FROM spo2_1d
+            WHERE user_id = %(user_id)s
+              AND bucket >= %(first_day)s AND bucket < %(last_day)s
+            UNION ALL
+            -- Partial days at the edges of the range come from raw rows
+            SELECT
+                date_trunc('day', timestamp),
+                SUM(value),
+                COUNT(value)
+            FROM spo2
+            WHERE user_id = %(user_id)s
+              AND (
+                (timestamp >= %(start)s AND timestamp < %(first_day)s)
+                OR (timestamp >= %(last_day)s AND timestamp <= %(end)s)
+              )
+            GROUP BY 1
+        ) days
+        GROUP BY bucket
+        ORDER BY bucket
+        """
+        results = []
+        whole_days = whole_utc_days(start_date, end_date)
+        try:
+            if whole_days:
+                await cursor.execute(
+                    rollup_query,
+                    {
+                        "user_id": user_id,
+                        "start": start_date,
+                        "end": end_date,
+                        "first_day": whole_days[0],
+                        "last_day": whole_days[1],
+                    },
+                )
+                results = await cursor.fetchall()
+        except psycopg.Error as e:
+            logger.warning(f"spo2_1d rollup unavailable, using raw SpO2 data: {e}")
+
+        if not results:
+            await cursor.execute(query, (user_id, start_date, end_date))
+            results = await cursor.fetchall()
 
         # Fallback mechanism starts here
         if not results:
@@ -124,13 +234,13 @@ def get_daily_avg_spo2_data(
             extended_start = start_date - timedelta(days=7)
             extended_end = end_date + timedelta(days=7)
 
-            cursor.execute(query, (user_id, extended_start, extended_end))
-            results = cursor.fetchall()
+            await cursor.execute(query, (user_id, extended_start, extended_end))
+            results = await cursor.fetchall()
 
             if not results:
                 user_check_query = "SELECT user_id FROM USERS WHERE user_id = %s"
-                cursor.execute(user_check_query, (user_id,))
-                user_exists = cursor.fetchone()
+                await cursor.execute(user_check_query, (user_id,))
+                user_exists = await cursor.fetchone()
 
                 if not user_exists:
                     raise ValueError(f"User {user_id} does not exist")
@@ -147,6 +257,6 @@ def get_daily_avg_spo2_data(
         return []
     finally:
         if cursor:
-            cursor.close()
+            await cursor.close()
         if conn:
-            conn.close()
+            await release_async_db_connection(conn)
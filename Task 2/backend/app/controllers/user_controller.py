@@ -1,13 +1,13 @@
 from typing import List, Dict, Any
 
-from app.db import get_db_connection
-from psycopg2.extras import RealDictCursor
+from app.db import async_db_connection
+from psycopg.rows import dict_row
 
 
-def get_all_users() -> List[Dict[str, Any]]:
-    with get_db_connection() as conn:
-        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-            cursor.execute(
+async def get_all_users() -> List[Dict[str, Any]]:
+    async with async_db_connection() as conn:
+        async with conn.cursor(row_factory=dict_row) as cursor:
+            await cursor.execute(
                 """
                 SELECT 
                     user_id,
@@ -18,13 +18,13 @@ def get_all_users() -> List[Dict[str, Any]]:
                 ORDER BY user_id
                 """
             )
-            return cursor.fetchall()
+            return await cursor.fetchall()
 
 
-def get_user_by_id(user_id: int) -> Dict[str, Any]:
-    with get_db_connection() as conn:
-        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-            cursor.execute(
+async def get_user_by_id(user_id: int) -> Dict[str, Any]:
+    async with async_db_connection() as conn:
+        async with conn.cursor(row_factory=dict_row) as cursor:
+            await cursor.execute(
                 """
                 SELECT 
                     user_id,
@@ -36,13 +36,13 @@ def get_user_by_id(user_id: int) -> Dict[str, Any]:
                 """,
                 (user_id,),
             )
-            return cursor.fetchone()
+            return await cursor.fetchone()
 
 
-def get_user_devices(user_id: int) -> List[Dict[str, Any]]:
-    with get_db_connection() as conn:
-        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-            cursor.execute(
+async def get_user_devices(user_id: int) -> List[Dict[str, Any]]:
+    async with async_db_connection() as conn:
+        async with conn.cursor(row_factory=dict_row) as cursor:
+            await cursor.execute(
                 """
                 SELECT 
                     device_id,
@@ -55,4 +55,4 @@ def get_user_devices(user_id: int) -> List[Dict[str, Any]]:
                 """,
                 (user_id,),
             )
-            return cursor.fetchall()
+            return await cursor.fetchall()
@@ -1,8 +1,15 @@
 import os
-from datetime import datetime
-from typing import List, Dict, Any, Optional
-import psycopg2
-from psycopg2.extras import RealDictCursor
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import List
+from psycopg.conninfo import make_conninfo
+from psycopg_pool import AsyncConnectionPool
+
+from app.metrics import ProfiledAsyncCursor, add_to_request, metrics
+
+logger = logging.getLogger("app")
 
 DB_HOST = os.environ.get("DB_HOST", "localhost")
 DB_PORT = os.environ.get("DB_PORT", "5432")
@@ -10,25 +17,98 @@ DB_NAME = os.environ.get("DB_NAME", "fitbit_data")
 DB_USER = os.environ.get("DB_USER", "postgres")
 DB_PASSWORD = os.environ.get("DB_PASSWORD", "password")
 
+# Connection pool sizing (per uvicorn worker process)
+DB_POOL_MIN = int(os.environ.get("DB_POOL_MIN", "2"))
+DB_POOL_MAX = int(os.environ.get("DB_POOL_MAX", "10"))
+# Seconds to wait for a free connection before giving up
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "10"))
+
+_async_pool = None
+_async_pool_lock = None
+
+
+async def open_async_db_pool():
+    """Open the async pool used by the controllers (called on app startup)"""
+    global _async_pool, _async_pool_lock
+    if _async_pool_lock is None:
+        _async_pool_lock = asyncio.Lock()
+    async with _async_pool_lock:
+        if _async_pool is None:
+            db_pool = AsyncConnectionPool(
+                make_conninfo(
+                    host=DB_HOST,
+                    port=DB_PORT,
+                    dbname=DB_NAME,
+                    user=DB_USER,
+                    password=DB_PASSWORD,
+                ),
+                min_size=DB_POOL_MIN,
+                max_size=DB_POOL_MAX,
+                timeout=DB_POOL_TIMEOUT,
+                # Session settings are applied once when the connection opens
+                kwargs={
+                    "autocommit": True,
+                    "options": "-c timezone=UTC",
+                    # Times every query for /metrics and the slow-query log
+                    "cursor_factory": ProfiledAsyncCursor,
+                },
+                check=AsyncConnectionPool.check_connection,
+                open=False,
+            )
+            await db_pool.open()
+            _async_pool = db_pool
+            logger.info(
+                f"Async database pool opened (min={DB_POOL_MIN}, max={DB_POOL_MAX})"
+            )
+    return _async_pool
 
-def get_db_connection():
-    conn = psycopg2.connect(
-        host=DB_HOST, port=DB_PORT, dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD
-    )
-    conn.autocommit = True
-    return conn
 
+async def close_async_db_pool():
+    """Close the async pool (called on app shutdown)"""
+    global _async_pool
+    if _async_pool is not None:
+        await _async_pool.close()
+        _async_pool = None
 
-def get_users() -> List[int]:
+
+async def get_async_db_connection():
+    """Check an async connection out of the pool.
+
+    Waits up to DB_POOL_TIMEOUT seconds without blocking the event loop. Every
+    connection must be handed back with release_async_db_connection.
+    """
+    db_pool = _async_pool or await open_async_db_pool()
+    started = time.perf_counter()
     try:
-        conn = get_db_connection()
-        with conn.cursor() as cursor:
-            cursor.execute("SELECT DISTINCT USER_ID FROM USERS ORDER BY USER_ID")
-            users = [row[0] for row in cursor.fetchall()]
-            return users
+        return await db_pool.getconn()
     finally:
-        if conn:
-            conn.close()
+        waited = time.perf_counter() - started
+        metrics.observe("db_pool_wait_seconds", waited)
+        add_to_request("db_wait", waited)
+
+
+async def release_async_db_connection(conn):
+    """Return an async connection to the pool"""
+    if conn is not None and _async_pool is not None:
+        await _async_pool.putconn(conn)
+
+
+@asynccontextmanager
+async def async_db_connection():
+    """Async context manager around get/release_async_db_connection"""
+    conn = await get_async_db_connection()
+    try:
+        yield conn
+    finally:
+        await release_async_db_connection(conn)
+
+
+async def get_users() -> List[int]:
+    async with async_db_connection() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute("SELECT DISTINCT USER_ID FROM USERS ORDER BY USER_ID")
+            users = [row[0] for row in await cursor.fetchall()]
+            return users
 
 
 def get_available_metrics() -> List[str]:
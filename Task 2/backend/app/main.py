@@ -1,5 +1,10 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
+
+from app.cache import response_cache
+from app.db import open_async_db_pool, close_async_db_pool
+from app.metrics import MetricsMiddleware, TimedJSONResponse, metrics
 
 # Import all routers
 from app.routers.azm_router import router as azm_router
@@ -12,7 +17,7 @@ from app.routers.user_router import router as user_router
 from app.routers.device_router import router as device_router
 
 # Create FastAPI app
-app = FastAPI(title="Fitbit Data API")
+app = FastAPI(title="Fitbit Data API", default_response_class=TimedJSONResponse)
 
 # Add CORS middleware
 app.add_middleware(
@@ -22,6 +27,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Request latency, per-phase timings and response sizes for /metrics
+app.add_middleware(MetricsMiddleware)
 
 # Include routers
 app.include_router(azm_router)
@@ -34,6 +41,18 @@ app.include_router(user_router)
 app.include_router(device_router)
 
 
+@app.on_event("startup")
+async def startup_db_pool():
+    """Open the async connection pool before serving requests"""
+    await open_async_db_pool()
+
+
+@app.on_event("shutdown")
+async def shutdown_db_pool():
+    """Close pooled database connections when the worker stops"""
+    await close_async_db_pool()
+
+
 # Root route
 @app.get("/")
 def read_root():
@@ -44,3 +63,29 @@ def read_root():
 def health_check():
     """Health check endpoint for container monitoring"""
     return {"status": "healthy"}
+
+
+@app.get("/metrics", tags=["Health"], response_class=PlainTextResponse)
+def get_metrics():
+    """Prometheus metrics of this worker process"""
+    cache_stats = response_cache.stats()
+    counters = {
+        "response_cache_events_total": {
+            "help": "Response cache lookups and evictions",
+            "type": "counter",
+            "values": [
+                ({"event": event}, cache_stats[event])
+                for event in ("hits", "misses", "evictions", "invalidations")
+                if event in cache_stats
+            ],
+        },
+    }
+    return PlainTextResponse(
+        metrics.to_prometheus(counters), media_type="text/plain; version=0.0.4"
+    )
+
+
+@app.get("/metrics/queries", tags=["Health"])
+def get_metric_queries():
+    """SQL behind each query label used in /metrics"""
+    return metrics.queries
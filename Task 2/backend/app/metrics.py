@@ -0,0 +1,257 @@
+import os
+import re
+import time
+import hashlib
+import logging
+import threading
+from contextvars import ContextVar
+from typing import Any, Dict, Optional, Sequence
+
+from fastapi.responses import JSONResponse
+from psycopg import AsyncCursor
+
+logger = logging.getLogger("app")
+slow_query_logger = logging.getLogger("app.slow_query")
+
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "true").lower() == "true"
+# Queries taking longer than this (execute + fetch) are logged with their SQL
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", "200"))
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000, 1000000)
+SIZE_BUCKETS = (1024, 10240, 102400, 1048576, 10485760, 104857600)
+
+HISTOGRAMS = {
+    "http_request_duration_seconds": ("Request latency by endpoint", LATENCY_BUCKETS),
+    "http_request_phase_seconds": (
+        "Time a request spent waiting for a connection (db_wait), executing "
+        "queries (db_execute), building rows (db_fetch) and encoding JSON (encode)",
+        LATENCY_BUCKETS,
+    ),
+    "http_response_size_bytes": ("Response body size by endpoint", SIZE_BUCKETS),
+    "db_pool_wait_seconds": ("Time to check a connection out of the pool", LATENCY_BUCKETS),
+    "db_query_duration_seconds": ("Query latency by query and phase", LATENCY_BUCKETS),
+    "db_query_rows": ("Rows fetched per query execution", ROW_BUCKETS),
+}
+REQUEST_PHASES = ("db_wait", "db_execute", "db_fetch", "encode")
+
+# Per-request accumulators of the phases above, set by MetricsMiddleware
+_request_profile: ContextVar[Optional[Dict[str, float]]] = ContextVar(
+    "request_profile", default=None
+)
+
+
+def _labels_key(labels: Dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: tuple, extra: str = "") -> str:
+    parts = [f'{k}="{v}"' for k, v in key]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class MetricsRegistry:
+    """Histograms of this worker process, rendered in Prometheus text format"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (name, labels key) -> [bucket counts..., sum, count]
+        self.histograms: Dict[tuple, list] = {}
+        # query label -> normalized SQL
+        self.queries: Dict[str, str] = {}
+
+    def observe(self, name: str, value: float, **labels):
+        if not METRICS_ENABLED:
+            return
+        buckets = HISTOGRAMS[name][1]
+        key = (name, _labels_key(labels))
+        with self._lock:
+            state = self.histograms.get(key)
+            if state is None:
+                state = self.histograms[key] = [0] * len(buckets) + [0.0, 0]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    def to_prometheus(self, extra_counters: Optional[Dict[str, Dict]] = None) -> str:
+        with self._lock:
+            histograms = sorted((k, list(s)) for k, s in self.histograms.items())
+
+        lines = []
+        for name, (help_text, buckets) in HISTOGRAMS.items():
+            series = [(key, state) for (n, key), state in histograms if n == name]
+            if not series:
+                continue
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+            for key, state in series:
+                cumulative = 0
+                for bound, count in zip(buckets, state):
+                    cumulative += count
+                    le = 'le="%g"' % bound
+                    lines.append(f"{name}_bucket{_format_labels(key, le)} {cumulative}")
+                le = 'le="+Inf"'
+                lines.append(f"{name}_bucket{_format_labels(key, le)} {state[-1]}")
+                lines.append(f"{name}_sum{_format_labels(key)} {state[-2]:.6f}")
+                lines.append(f"{name}_count{_format_labels(key)} {state[-1]}")
+
+        for name, counter in (extra_counters or {}).items():
+            lines += [f"# HELP {name} {counter['help']}", f"# TYPE {name} {counter['type']}"]
+            for labels, value in counter["values"]:
+                lines.append(f"{name}{_format_labels(_labels_key(labels))} {value}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+
+def query_label(sql) -> str:
+    """Short, stable label for a statement: verb, first table and a hash of the SQL"""
+    text = sql.decode() if isinstance(sql, bytes) else str(sql)
+    normalized = " ".join(text.split())
+    verb = normalized.split(" ", 1)[0].lower() if normalized else "query"
+    table = re.search(r"\bFROM\s+([\w.]+)", normalized, re.IGNORECASE)
+    digest = hashlib.md5(normalized.encode()).hexdigest()[:8]
+    label = f"{verb} {table.group(1).lower() if table else '-'} {digest}"
+    if label not in metrics.queries:
+        metrics.queries[label] = normalized
+    return label
+
+
+def add_to_request(phase: str, seconds: float):
+    """Charge time to a phase of the current request, if any"""
+    profile = _request_profile.get()
+    if profile is not None:
+        profile[phase] += seconds
+
+
+class ProfiledAsyncCursor(AsyncCursor):
+    """AsyncCursor that times execution and row building per query.
+
+    Installed as the pool's cursor_factory, so every controller query is
+    measured without changes to the controllers. Queries slower than
+    SLOW_QUERY_MS are logged with their SQL and parameters.
+    """
+
+    _label = None
+    _sql = None
+    _params = None
+    _elapsed = 0.0
+    _rows = 0
+
+    async def execute(self, query, params=None, **kwargs):
+        self._finish_query()
+        self._label = query_label(query) if METRICS_ENABLED else None
+        self._sql, self._params = query, params
+        self._elapsed, self._rows = 0.0, 0
+        started = time.perf_counter()
+        try:
+            return await super().execute(query, params, **kwargs)
+        finally:
+            self._record("execute", time.perf_counter() - started)
+
+    async def fetchone(self):
+        started = time.perf_counter()
+        row = await super().fetchone()
+        self._record("fetch", time.perf_counter() - started, 0 if row is None else 1)
+        return row
+
+    async def fetchmany(self, size=0):
+        started = time.perf_counter()
+        rows = await super().fetchmany(size)
+        self._record("fetch", time.perf_counter() - started, len(rows))
+        return rows
+
+    async def fetchall(self):
+        started = time.perf_counter()
+        rows = await super().fetchall()
+        self._record("fetch", time.perf_counter() - started, len(rows))
+        return rows
+
+    async def close(self):
+        self._finish_query()
+        await super().close()
+
+    def _record(self, phase: str, seconds: float, rows: int = 0):
+        if self._label is None:
+            return
+        self._elapsed += seconds
+        self._rows += rows
+        metrics.observe("db_query_duration_seconds", seconds, query=self._label, phase=phase)
+        add_to_request(f"db_{phase}", seconds)
+
+    def _finish_query(self):
+        """Record rows and check the slow-query threshold for the last statement"""
+        if self._label is None:
+            return
+        metrics.observe("db_query_rows", self._rows, query=self._label)
+        if self._elapsed * 1000 >= SLOW_QUERY_MS:
+            slow_query_logger.warning(
+                f"Slow query ({self._elapsed * 1000:.1f} ms, {self._rows} rows) "
+                f"[{self._label}]: {' '.join(str(self._sql).split())} "
+                f"params={self._params!r}"
+            )
+        self._label = None
+
+
+class TimedJSONResponse(JSONResponse):
+    """JSONResponse that charges its encoding time to the request's encode phase"""
+
+    def render(self, content: Any) -> bytes:
+        started = time.perf_counter()
+        try:
+            return super().render(content)
+        finally:
+            add_to_request("encode", time.perf_counter() - started)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, phases and response size per endpoint"""
+
+    def __init__(self, app, skip_paths: Sequence[str] = ("/metrics",)):
+        self.app = app
+        self.skip_paths = set(skip_paths)
+
+    async def __call__(self, scope, receive, send):
+        if (
+            not METRICS_ENABLED
+            or scope["type"] != "http"
+            or scope["path"] in self.skip_paths
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        profile = {phase: 0.0 for phase in REQUEST_PHASES}
+        token = _request_profile.set(profile)
+        status = {"code": 500, "bytes": 0}
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            elif message["type"] == "http.response.body":
+                status["bytes"] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            _request_profile.reset(token)
+            # Routes here take no path parameters, so the path is the route;
+            # unmatched paths are folded into one label
+            endpoint = scope["path"] if "endpoint" in scope else "unmatched"
+            metrics.observe(
+                "http_request_duration_seconds",
+                elapsed,
+                endpoint=endpoint,
+                method=scope["method"],
+                status=status["code"],
+            )
+            metrics.observe("http_response_size_bytes", status["bytes"], endpoint=endpoint)
+            for phase, seconds in profile.items():
+                metrics.observe("http_request_phase_seconds", seconds, endpoint=endpoint, phase=phase)
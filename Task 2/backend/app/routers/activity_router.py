@@ -1,12 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException
-from typing import Tuple
+from typing import Optional, Tuple
 from datetime import datetime
 import logging
 
 from app.controllers.activity_controller import (
     get_all_activity_data,
+    get_all_activity_page,
 )
 from app.utils.date_parser import parse_date_parameters
+from app.utils.pagination import PageRequest, parse_page_parameters
 
 router = APIRouter(prefix="/api/activity", tags=["Activity"])
 logger = logging.getLogger("app")
@@ -15,13 +17,26 @@ logger = logging.getLogger("app")
 @router.get("/get_all_activity_data")
 async def api_get_all_activity_data(
     params: Tuple[int, datetime, datetime] = Depends(parse_date_parameters),
+    page: Optional[PageRequest] = Depends(parse_page_parameters),
 ):
     user_id, start_date, end_date = params
 
     try:
-        data = get_all_activity_data(user_id, start_date, end_date)
-
+        next_cursor = None
         fallback_used = False
+        if page is None:
+            data = await get_all_activity_data(user_id, start_date, end_date)
+        else:
+            result = await get_all_activity_page(user_id, start_date, end_date, page)
+            if result is None:
+                # Empty range: the page holds the most recent data instead
+                data = await get_all_activity_data(
+                    user_id, start_date, end_date, fallback_limit=page.limit
+                )
+                fallback_used = bool(data)
+            else:
+                data, next_cursor = result["data"], result["next_cursor"]
+
         warning_message = None
 
         if not data:
@@ -40,6 +55,10 @@ async def api_get_all_activity_data(
             "data": data,
         }
 
+        if page is not None:
+            response["parameters"]["limit"] = page.limit
+            response["next_cursor"] = next_cursor
+
         if warning_message:
             response["warning"] = warning_message
 
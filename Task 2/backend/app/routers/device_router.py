@@ -10,7 +10,7 @@ logger = logging.getLogger("app")
 @router.get("/get_all_devices")
 async def api_get_all_devices():
     try:
-        data = get_all_devices()
+        data = await get_all_devices()
 
         warning_message = None
         if not data:
@@ -39,7 +39,7 @@ async def api_get_all_devices():
 @router.get("/get_device_by_id")
 async def api_get_device_by_id(device_id: str = Query(..., description="Device ID")):
     try:
-        data = get_device_by_id(device_id)
+        data = await get_device_by_id(device_id)
         if not data:
             raise HTTPException(
                 status_code=404, detail=f"Device with ID {device_id} not found"
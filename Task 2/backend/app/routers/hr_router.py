@@ -1,14 +1,23 @@
+import asyncio
 from fastapi import APIRouter, Depends, HTTPException, Query
-from typing import Tuple, Optional
+from typing import Literal, Tuple, Optional
 from datetime import datetime
 import logging
 
 from app.controllers.hr_controller import (
+    get_all_heart_rate_columns,
     get_all_heart_rate_data,
+    get_all_heart_rate_page,
     get_daily_avg_heart_rate_data,
     get_heart_rate_zones_data,
+    get_heart_rate_series,
+    stream_all_heart_rate_data,
 )
+from app.utils.columnar import columnar_response, rows_to_columns
 from app.utils.date_parser import parse_date_parameters
+from app.utils.downsampling import downsample_columns, downsample_rows
+from app.utils.pagination import PageRequest, parse_page_parameters
+from app.utils.streaming import ndjson_response, rows_as_batches
 
 router = APIRouter(prefix="/api/heart_rate", tags=["Heart Rate"])
 
@@ -18,13 +27,81 @@ logger = logging.getLogger("app")
 @router.get("/get_all_heart_rate_data")
 async def api_get_all_heart_rate_data(
     params: Tuple[int, datetime, datetime] = Depends(parse_date_parameters),
+    page: Optional[PageRequest] = Depends(parse_page_parameters),
+    format: Literal["json", "ndjson", "columnar"] = Query(
+        "json",
+        description="ndjson streams one row per line; columnar returns one "
+        "array per column with epoch-ms timestamps",
+    ),
+    max_points: Optional[int] = Query(
+        None, ge=3, description="Downsample to at most this many points"
+    ),
+    downsample: Literal["lttb", "minmax"] = Query(
+        "lttb", description="Downsampling method used with max_points"
+    ),
 ):
     user_id, start_date, end_date = params
 
     try:
-        data = get_all_heart_rate_data(user_id, start_date, end_date)
-
+        if page is not None and format != "json":
+            raise ValueError("limit and cursor are only supported with format=json")
+        if max_points is not None and (page is not None or format == "ndjson"):
+            raise ValueError("max_points cannot be combined with paging or format=ndjson")
+
+        if format == "ndjson":
+            batches = await stream_all_heart_rate_data(user_id, start_date, end_date)
+            if batches is not None:
+                return ndjson_response(batches)
+            # Empty range: stream whatever the fallback queries return
+            data = await get_all_heart_rate_data(user_id, start_date, end_date)
+            return ndjson_response(rows_as_batches(data), fallback_used=bool(data))
+
+        if format == "columnar":
+            columns = await get_all_heart_rate_columns(user_id, start_date, end_date)
+            fallback_used = columns is None
+            if fallback_used:
+                data = await get_all_heart_rate_data(user_id, start_date, end_date)
+                columns = rows_to_columns(data)
+            parameters = {
+                "user_id": user_id,
+                "start_date": start_date.isoformat(),
+                "end_date": end_date.isoformat(),
+            }
+            if max_points is not None:
+                columns = await asyncio.to_thread(
+                    downsample_columns, columns, "value", max_points, downsample
+                )
+                parameters["max_points"] = max_points
+                parameters["downsample"] = downsample
+            return columnar_response(
+                columns,
+                parameters,
+                fallback_used,
+                f"No heart rate data found for user {user_id} in the specified time range",
+            )
+
+        next_cursor = None
         fallback_used = False
+        if page is None:
+            data = await get_all_heart_rate_data(user_id, start_date, end_date)
+        else:
+            result = await get_all_heart_rate_page(user_id, start_date, end_date, page)
+            if result is None:
+                # Empty range: the page holds the most recent data instead
+                data = await get_all_heart_rate_data(
+                    user_id, start_date, end_date, fallback_limit=page.limit
+                )
+                fallback_used = bool(data)
+            else:
+                data, next_cursor = result["data"], result["next_cursor"]
+
+        source_count = len(data)
+        if max_points is not None:
+            # Off the event loop: large ranges take a while to reduce
+            data = await asyncio.to_thread(
+                downsample_rows, data, "value", max_points, downsample
+            )
+
         warning_message = None
 
         if not data:
@@ -41,6 +118,15 @@ async def api_get_all_heart_rate_data(
             "data": data,
         }
 
+        if page is not None:
+            response["parameters"]["limit"] = page.limit
+            response["next_cursor"] = next_cursor
+
+        if max_points is not None:
+            response["parameters"]["max_points"] = max_points
+            response["parameters"]["downsample"] = downsample
+            response["source_count"] = source_count
+
         if warning_message:
             response["warning"] = warning_message
 
@@ -71,7 +157,7 @@ async def api_get_daily_avg_heart_rate_data(
     user_id, start_date, end_date = params
 
     try:
-        data = get_daily_avg_heart_rate_data(user_id, start_date, end_date)
+        data = await get_daily_avg_heart_rate_data(user_id, start_date, end_date)
 
         fallback_used = False
         warning_message = None
@@ -122,7 +208,7 @@ async def api_get_heart_rate_zones_data(
     user_id, start_date, end_date = params
 
     try:
-        data = get_heart_rate_zones_data(user_id, start_date, end_date)
+        data = await get_heart_rate_zones_data(user_id, start_date, end_date)
 
         fallback_used = False
         warning_message = None
@@ -164,3 +250,55 @@ async def api_get_heart_rate_zones_data(
             status_code=500,
             detail="An error occurred while fetching heart rate zones data. Please try again later.",
         )
+
+
+@router.get("/get_heart_rate_series")
+async def api_get_heart_rate_series(
+    params: Tuple[int, datetime, datetime] = Depends(parse_date_parameters),
+    max_points: Optional[int] = Query(
+        None, ge=1, description="Maximum number of buckets to return"
+    ),
+):
+    user_id, start_date, end_date = params
+
+    try:
+        series = await get_heart_rate_series(user_id, start_date, end_date, max_points)
+        data = series["data"]
+
+        warning_message = None
+
+        if not data:
+            warning_message = f"No heart rate data found for user {user_id} in the specified time range"
+
+        response = {
+            "success": True,
+            "parameters": {
+                "user_id": user_id,
+                "start_date": start_date.isoformat(),
+                "end_date": end_date.isoformat(),
+                "max_points": max_points,
+            },
+            "resolution": series["resolution"],
+            "source": series["source"],
+            "data_count": len(data),
+            "data": data,
+        }
+
+        if warning_message:
+            response["warning"] = warning_message
+
+        return response
+
+    except ValueError as e:
+        if "User" in str(e) and "does not exist" in str(e):
+            raise HTTPException(status_code=404, detail=str(e))
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        import traceback
+
+        logger.error(f"Error in api_get_heart_rate_series: {traceback.format_exc()}")
+
+        raise HTTPException(
+            status_code=500,
+            detail="An error occurred while fetching the heart rate series. Please try again later.",
+        )
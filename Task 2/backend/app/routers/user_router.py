@@ -14,7 +14,7 @@ logger = logging.getLogger("app")
 @router.get("/get_all_users")
 async def api_get_all_users():
     try:
-        data = get_all_users()
+        data = await get_all_users()
 
         warning_message = None
         if not data:
@@ -43,7 +43,7 @@ async def api_get_all_users():
 @router.get("/get_user_by_id")
 async def api_get_user_by_id(user_id: int = Query(..., description="User ID")):
     try:
-        data = get_user_by_id(user_id)
+        data = await get_user_by_id(user_id)
         if not data:
             raise HTTPException(
                 status_code=404, detail=f"User with ID {user_id} not found"
@@ -68,7 +68,7 @@ async def api_get_user_by_id(user_id: int = Query(..., description="User ID")):
 @router.get("/get_user_devices")
 async def api_get_user_devices(user_id: int = Query(..., description="User ID")):
     try:
-        data = get_user_devices(user_id)
+        data = await get_user_devices(user_id)
 
         warning_message = None
         if not data:
@@ -0,0 +1,124 @@
+import time
+import struct
+import logging
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Sequence
+
+import orjson
+from fastapi.responses import JSONResponse
+from psycopg.adapt import Loader
+from psycopg.pq import Format
+
+from app.db import get_async_db_connection, release_async_db_connection
+from app.metrics import add_to_request
+
+logger = logging.getLogger("app")
+
+# Binary timestamps are microseconds since 2000-01-01 00:00 UTC
+PG_EPOCH_MS = 946684800000
+_unpack_int8 = struct.Struct("!q").unpack
+
+Columns = Dict[str, Any]
+
+
+class EpochMsLoader(Loader):
+    """Load binary timestamp/timestamptz values as integer epoch milliseconds.
+
+    Skips building a datetime per row. Timestamps without time zone are
+    stored in UTC, so both types share the same conversion.
+    """
+
+    format = Format.BINARY
+
+    def load(self, data) -> int:
+        return _unpack_int8(data)[0] // 1000 + PG_EPOCH_MS
+
+
+def _to_epoch_ms(value):
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return int(value.timestamp() * 1000)
+    return value
+
+
+def _columns(names: List[str], column_values: Sequence[Sequence]) -> Columns:
+    return {
+        "columns": names,
+        "data": dict(zip(names, column_values)),
+        "count": len(column_values[0]) if column_values else 0,
+    }
+
+
+async def fetch_columns(query: str, params: Sequence) -> Optional[Columns]:
+    """Run query on a binary tuple cursor and return one list per column.
+
+    Timestamps come back as epoch milliseconds. Returns None when the query
+    has no rows so the caller can run its fallback.
+    """
+    conn = await get_async_db_connection()
+    try:
+        async with conn.cursor(binary=True) as cursor:
+            cursor.adapters.register_loader("timestamp", EpochMsLoader)
+            cursor.adapters.register_loader("timestamptz", EpochMsLoader)
+            await cursor.execute(query, params)
+            rows = await cursor.fetchall()
+            if not rows:
+                return None
+            names = [column.name for column in cursor.description]
+            return _columns(names, list(zip(*rows)))
+    finally:
+        await release_async_db_connection(conn)
+
+
+def rows_to_columns(rows: List[Dict[str, Any]]) -> Columns:
+    """Columnar form of rows already fetched as dicts, e.g. by a fallback query"""
+    if not rows:
+        return _columns([], [])
+    names = list(rows[0].keys())
+    return _columns(
+        names, [[_to_epoch_ms(row[name]) for row in rows] for name in names]
+    )
+
+
+def _orjson_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class ColumnarResponse(JSONResponse):
+    """JSON response encoded with orjson, which handles the long value arrays natively"""
+
+    def render(self, content: Any) -> bytes:
+        started = time.perf_counter()
+        try:
+            return orjson.dumps(content, default=_orjson_default)
+        finally:
+            add_to_request("encode", time.perf_counter() - started)
+
+
+def columnar_response(
+    columns: Columns,
+    parameters: Dict[str, Any],
+    fallback_used: bool,
+    warning_message: str,
+) -> ColumnarResponse:
+    """Wrap columns in the usual success/parameters/data_count envelope"""
+    response = {
+        "success": True,
+        "parameters": parameters,
+        "format": "columnar",
+        "data_count": columns["count"],
+        "columns": columns["columns"],
+        "data": columns["data"],
+    }
+
+    if not columns["count"]:
+        response["warning"] = warning_message
+
+    if fallback_used and columns["count"]:
+        response["fallback_used"] = True
+
+    return ColumnarResponse(response)
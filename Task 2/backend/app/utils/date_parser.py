@@ -1,5 +1,5 @@
 from fastapi import Query, HTTPException
-from datetime import datetime, time, timedelta
+from datetime import datetime, time, timedelta, timezone
 from typing import Optional, Tuple
 
 from app.config.timezone import GMT6
@@ -44,3 +44,63 @@ def parse_date_parameters(
             status_code=400,
             detail=f"Invalid date format. Please use YYYY-MM-DD: {str(e)}",
         )
+
+
+def whole_utc_days(
+    start_date: datetime, end_date: datetime
+) -> Optional[Tuple[datetime, datetime]]:
+    """UTC midnights bounding the whole days inside [start_date, end_date].
+
+    Returns (first, last) such that every day in [first, last) lies inside
+    the range, or None if no whole day fits. Daily rollup buckets are UTC
+    midnights, so only these days can be read from a rollup; the partial
+    days at either edge must come from raw rows.
+    """
+    start = start_date.astimezone(timezone.utc)
+    end = end_date.astimezone(timezone.utc)
+    first = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    if first < start:
+        first += timedelta(days=1)
+    last = end.replace(hour=0, minute=0, second=0, microsecond=0)
+    if last <= first:
+        return None
+    return first, last
+
+
+# time_bucket() aligns interval buckets to this origin, a Monday, so daily
+# buckets start at UTC midnight and weekly buckets on Mondays
+TIME_BUCKET_ORIGIN = datetime(2000, 1, 3, tzinfo=timezone.utc)
+
+
+def _as_utc(timestamp: datetime) -> datetime:
+    # Naive timestamps are UTC, like the stored ones
+    if timestamp.tzinfo is None:
+        return timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.astimezone(timezone.utc)
+
+
+def bucket_floor(timestamp: datetime, width: timedelta) -> datetime:
+    """Start of the time_bucket(width, ...) bucket holding timestamp, in UTC"""
+    return TIME_BUCKET_ORIGIN + (_as_utc(timestamp) - TIME_BUCKET_ORIGIN) // width * width
+
+
+def bucket_count(start_date: datetime, end_date: datetime, width: timedelta) -> int:
+    """Number of time_bucket(width, ...) buckets [start_date, end_date] touches"""
+    return (bucket_floor(end_date, width) - bucket_floor(start_date, width)) // width + 1
+
+
+def whole_buckets(
+    start_date: datetime, end_date: datetime, width: timedelta
+) -> Optional[Tuple[datetime, datetime]]:
+    """whole_utc_days for any time_bucket width.
+
+    Returns (first, last) such that every bucket in [first, last) lies
+    inside [start_date, end_date], or None if no whole bucket fits.
+    """
+    first = bucket_floor(start_date, width)
+    if first < _as_utc(start_date):
+        first += width
+    last = bucket_floor(end_date, width)
+    if last <= first:
+        return None
+    return first, last
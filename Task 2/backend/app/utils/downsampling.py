@@ -0,0 +1,123 @@
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+
+DOWNSAMPLING_METHODS = ("lttb", "minmax")
+
+
+def _values(values: Sequence) -> np.ndarray:
+    return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, max_points: int) -> np.ndarray:
+    """Indices kept by Largest-Triangle-Three-Buckets.
+
+    The first and last points are always kept. The points in between are
+    split into max_points - 2 buckets and from each the point forming the
+    largest triangle with the previously kept point and the mean of the next
+    bucket is kept, which preserves peaks and the overall shape.
+    """
+    n = len(x)
+    if max_points >= n or max_points < 3:
+        return np.arange(n)
+
+    # Missing values never win a bucket unless the whole bucket is missing
+    y = np.where(np.isnan(y), np.nanmean(y) if not np.isnan(y).all() else 0.0, y)
+    edges = np.linspace(1, n - 1, max_points - 1).astype(np.int64)
+    kept = np.empty(max_points, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+
+    previous = 0
+    for i in range(max_points - 2):
+        start, end = edges[i], edges[i + 1]
+        next_start, next_end = end, edges[i + 2] if i + 2 < len(edges) else n
+        if next_end <= next_start:
+            next_end = next_start + 1
+        mean_x = x[next_start:next_end].mean()
+        mean_y = y[next_start:next_end].mean()
+
+        # Twice the triangle area, for every candidate of the bucket at once
+        areas = np.abs(
+            (x[previous] - mean_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (mean_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        kept[i + 1] = previous
+    return kept
+
+
+def minmax_indices(y: np.ndarray, max_points: int) -> np.ndarray:
+    """Indices of the minimum and maximum of max_points // 2 equal buckets, in order"""
+    n = len(y)
+    buckets = max_points // 2
+    if max_points >= n or buckets < 1:
+        return np.arange(n)
+
+    edges = np.linspace(0, n, buckets + 1).astype(np.int64)
+    kept = []
+    for start, end in zip(edges[:-1], edges[1:]):
+        bucket = y[start:end]
+        if np.isnan(bucket).all():
+            kept.append(start)
+            continue
+        kept.append(start + int(np.nanargmin(bucket)))
+        kept.append(start + int(np.nanargmax(bucket)))
+    return np.unique(kept)
+
+
+def downsample_indices(
+    x: Sequence, y: Sequence, max_points: int, method: str = "lttb"
+) -> np.ndarray:
+    """Indices of at most max_points points that keep the shape of y over x"""
+    if method not in DOWNSAMPLING_METHODS:
+        raise ValueError(f"Unknown downsampling method: {method}")
+    y_values = _values(y)
+    if method == "minmax":
+        return minmax_indices(y_values, max_points)
+    return lttb_indices(_values(x), y_values, max_points)
+
+
+def _seconds(timestamps: Sequence) -> List[float]:
+    first = timestamps[0]
+    return [(t - first).total_seconds() for t in timestamps]
+
+
+def _is_ascending(values: Sequence) -> bool:
+    return all(a <= b for a, b in zip(values, values[1:]))
+
+
+def downsample_rows(
+    rows: List[Dict[str, Any]], value_key: str, max_points: int, method: str = "lttb"
+) -> List[Dict[str, Any]]:
+    """Keep whole rows at the points chosen on rows[value_key] over time.
+
+    Kept rows are original measurements, not averages. Rows that are not in
+    ascending timestamp order (e.g. the most-recent-first fallback queries)
+    are sorted first, since both methods walk the series left to right.
+    """
+    if not _is_ascending([row["timestamp"] for row in rows]):
+        rows = sorted(rows, key=lambda row: row["timestamp"])
+    if len(rows) <= max_points:
+        return rows
+    x = _seconds([row["timestamp"] for row in rows])
+    indices = downsample_indices(x, [row[value_key] for row in rows], max_points, method)
+    return [rows[i] for i in indices]
+
+
+def downsample_columns(
+    columns: Dict[str, Any], value_key: str, max_points: int, method: str = "lttb"
+) -> Dict[str, Any]:
+    """downsample_rows for the columnar format (epoch-ms timestamps)"""
+    data = columns["data"]
+    if columns["count"] and not _is_ascending(data["timestamp"]):
+        order = np.argsort(data["timestamp"], kind="stable")
+        data = {name: [values[i] for i in order] for name, values in data.items()}
+        columns = {**columns, "data": data}
+    if columns["count"] <= max_points:
+        return columns
+    indices = downsample_indices(data["timestamp"], data[value_key], max_points, method)
+    return {
+        "columns": columns["columns"],
+        "data": {name: [values[i] for i in indices] for name, values in data.items()},
+        "count": len(indices),
+    }
@@ -0,0 +1,130 @@
+import os
+import base64
+import binascii
+from datetime import datetime, timezone
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from fastapi import HTTPException, Query
+from psycopg.rows import dict_row
+
+from app.db import get_async_db_connection, release_async_db_connection
+
+# Largest page a client may request with limit
+PAGE_LIMIT_MAX = int(os.environ.get("PAGE_LIMIT_MAX", "10000"))
+
+
+class PageRequest(NamedTuple):
+    limit: int
+    # (timestamp, id) of the last row of the previous page
+    after: Optional[Tuple[datetime, int]]
+
+
+def encode_cursor(timestamp: datetime, row_id: int) -> str:
+    raw = f"{timestamp.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Inverse of encode_cursor; raises ValueError for anything else"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        timestamp, row_id = raw.split("|")
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+
+def parse_page_parameters(
+    limit: Optional[int] = Query(
+        None, ge=1, le=PAGE_LIMIT_MAX, description="Page size (default: no paging)"
+    ),
+    cursor: Optional[str] = Query(
+        None, description="next_cursor of the previous page"
+    ),
+) -> Optional[PageRequest]:
+    """Parse and validate paging parameters for the raw get_all_* endpoints"""
+
+    if limit is None:
+        if cursor is not None:
+            raise HTTPException(
+                status_code=400, detail="cursor requires a page limit"
+            )
+        return None
+
+    try:
+        after = decode_cursor(cursor) if cursor is not None else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return PageRequest(limit, after)
+
+
+def _as_utc(timestamp: datetime) -> datetime:
+    # Raw timestamps are stored without time zone, in UTC
+    if timestamp.tzinfo is None:
+        return timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.astimezone(timezone.utc)
+
+
+def page_lower_bound(page: PageRequest, start_date: datetime) -> datetime:
+    """First timestamp a page may read: after the cursor, never before start_date"""
+    if page.after is None:
+        return _as_utc(start_date)
+    return max(_as_utc(page.after[0]), _as_utc(start_date))
+
+
+async def fetch_page(
+    table: str,
+    columns: List[str],
+    user_id: int,
+    start_date: datetime,
+    end_date: datetime,
+    page: PageRequest,
+) -> Optional[Dict[str, Any]]:
+    """One page of a raw table in (timestamp, id) order.
+
+    The lower bound is an index condition on (user_id, timestamp), so every
+    page is a range scan starting at the previous page's last row instead of
+    an OFFSET that rereads all earlier rows. id only breaks ties between rows
+    with the same timestamp. Returns None when the first page is empty so
+    the caller can fall back to the most recent data.
+    """
+    after_timestamp, after_id = page.after or (start_date, -1)
+    query = f"""
+    SELECT id, {", ".join(columns)}
+    FROM {table}
+    WHERE user_id = %s
+      AND timestamp >= %s AND timestamp <= %s
+      AND (timestamp > %s OR id > %s)
+    ORDER BY timestamp, id
+    LIMIT %s
+    """
+
+    conn = await get_async_db_connection()
+    try:
+        async with conn.cursor(row_factory=dict_row) as cursor:
+            # One extra row tells whether there is a next page
+            await cursor.execute(
+                query,
+                (
+                    user_id,
+                    page_lower_bound(page, start_date),
+                    end_date,
+                    after_timestamp,
+                    after_id,
+                    page.limit + 1,
+                ),
+            )
+            rows = await cursor.fetchall()
+    finally:
+        await release_async_db_connection(conn)
+
+    if not rows and page.after is None:
+        return None
+
+    next_cursor = None
+    if len(rows) > page.limit:
+        rows = rows[: page.limit]
+        next_cursor = encode_cursor(rows[-1]["timestamp"], rows[-1]["id"])
+    for row in rows:
+        del row["id"]
+    return {"data": rows, "next_cursor": next_cursor}
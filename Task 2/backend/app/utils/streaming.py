@@ -0,0 +1,106 @@
+import os
+import json
+import time
+import logging
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence
+
+from fastapi.responses import StreamingResponse
+from psycopg.rows import dict_row
+
+from app.db import get_async_db_connection, release_async_db_connection
+from app.metrics import add_to_request, metrics, query_label
+
+logger = logging.getLogger("app")
+
+# Rows fetched from the server-side cursor per round trip and per response chunk
+STREAM_ITERSIZE = int(os.environ.get("STREAM_ITERSIZE", "5000"))
+
+RowBatches = AsyncIterator[List[Dict[str, Any]]]
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+async def _fetch_batches(query: str, params: Sequence) -> RowBatches:
+    conn = await get_async_db_connection()
+    label = query_label(query)
+    try:
+        # Server-side cursors only live inside a transaction; the pool's
+        # connections are in autocommit mode otherwise
+        async with conn.transaction():
+            async with conn.cursor(name="row_stream", row_factory=dict_row) as cursor:
+                cursor.itersize = STREAM_ITERSIZE
+                await cursor.execute(query, params)
+                while True:
+                    started = time.perf_counter()
+                    rows = await cursor.fetchmany(cursor.itersize)
+                    elapsed = time.perf_counter() - started
+                    metrics.observe("db_query_duration_seconds", elapsed, query=label, phase="fetch")
+                    add_to_request("db_fetch", elapsed)
+                    if not rows:
+                        break
+                    yield rows
+    finally:
+        await release_async_db_connection(conn)
+
+
+async def open_row_stream(query: str, params: Sequence) -> Optional[RowBatches]:
+    """Run query through a server-side cursor and return its rows in batches.
+
+    The first batch is read before returning, so an empty result is reported
+    as None while the response status can still change. The connection is
+    held until the batches are exhausted or the iterator is closed.
+    """
+    batches = _fetch_batches(query, params)
+    try:
+        first = await batches.__anext__()
+    except StopAsyncIteration:
+        return None
+
+    async def chained():
+        try:
+            yield first
+            async for rows in batches:
+                yield rows
+        finally:
+            await batches.aclose()
+
+    return chained()
+
+
+async def rows_as_batches(rows: List[Dict[str, Any]]) -> RowBatches:
+    """Batches of an already fetched result, e.g. from a fallback query"""
+    for i in range(0, len(rows), STREAM_ITERSIZE):
+        yield rows[i : i + STREAM_ITERSIZE]
+
+
+async def _ndjson_chunks(batches: RowBatches) -> AsyncIterator[bytes]:
+    rows_sent = 0
+    try:
+        async for rows in batches:
+            rows_sent += len(rows)
+            yield "".join(
+                json.dumps(row, default=_json_default, separators=(",", ":")) + "\n"
+                for row in rows
+            ).encode()
+    except Exception:
+        import traceback
+
+        # Headers are already sent, so the client sees a truncated stream
+        logger.error(f"Error streaming rows after {rows_sent} rows: {traceback.format_exc()}")
+        raise
+
+
+def ndjson_response(batches: RowBatches, fallback_used: bool = False) -> StreamingResponse:
+    """Stream rows as newline-delimited JSON, one object per line"""
+    headers = {"X-Fallback-Used": "true"} if fallback_used else None
+    return StreamingResponse(
+        _ndjson_chunks(batches), media_type="application/x-ndjson", headers=headers
+    )
@@ -0,0 +1,645 @@
+"""Load test for the Fitbit Data API.
+
+Boots app.main:app with uvicorn (or targets a running server), optionally
+seeds synthetic users into the database, and replays the dashboard: every
+virtual user keeps selecting a user and date range and issues the seven calls
+App.js makes for a selection concurrently. Reports latency percentiles,
+throughput and error rates per endpoint plus database connection counts
+sampled from pg_stat_activity.
+
+    python loadtest.py --seed-db --boot --virtual-users 20 --duration 60
+    python loadtest.py --url http://127.0.0.1:8000 --json loadtest.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from collections import defaultdict
+from datetime import datetime, timedelta
+from urllib.parse import urlencode, urlsplit
+
+import psycopg
+
+from app.db import DB_HOST, DB_PORT, DB_NAME, DB_USER, DB_PASSWORD
+
+# The calls App.js issues concurrently whenever the user or date range changes
+DASHBOARD_ENDPOINTS = [
+    "/api/heart_rate/get_daily_avg_heart_rate_data",
+    "/api/heart_rate/get_heart_rate_zones_data",
+    "/api/spo2/get_daily_avg_spo2_data",
+    "/api/hrv/get_daily_avg_hrv_data",
+    "/api/breathing_rate/get_all_breathing_rate_data",
+    "/api/azm/get_daily_avg_azm_data",
+    "/api/activity/get_all_activity_data",
+]
+# Issued once per page load
+PAGE_LOAD_ENDPOINT = "/api/users/get_all_users"
+# Other routes, mixed in after a share of the selections (--extra-ratio)
+EXTRA_ENDPOINTS = [
+    ("/api/users/get_user_devices", "user"),
+    ("/api/devices/get_all_devices", None),
+    ("/api/heart_rate/get_all_heart_rate_data", "range"),
+    ("/api/spo2/get_all_spo2_data", "range"),
+    ("/api/hrv/get_all_hrv_data", "range"),
+    ("/api/azm/get_all_azm_data", "range"),
+]
+# Length in days of the ranges users select
+RANGE_DAYS = [1, 7, 14, 30]
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(pct / 100 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def latency_summary(latencies):
+    values = sorted(latencies)
+    if not values:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None, "mean_ms": None, "max_ms": None}
+    return {
+        "p50_ms": round(percentile(values, 50) * 1000, 2),
+        "p95_ms": round(percentile(values, 95) * 1000, 2),
+        "p99_ms": round(percentile(values, 99) * 1000, 2),
+        "mean_ms": round(sum(values) / len(values) * 1000, 2),
+        "max_ms": round(values[-1] * 1000, 2),
+    }
+
+
+def get_db_connection():
+    """Connection for seeding and pg_stat_activity sampling"""
+    return psycopg.connect(
+        host=DB_HOST,
+        port=DB_PORT,
+        dbname=DB_NAME,
+        user=DB_USER,
+        password=DB_PASSWORD,
+        autocommit=True,
+        application_name="loadtest",
+    )
+
+
+# ---------------------------------------------------------------------------
+# Seeding
+
+
+def seed_database(user_ids, start, days, hr_interval, seed):
+    """Replace the given users' rows with synthetic data for every metric"""
+    rng = random.Random(seed)
+    cleanup_database(user_ids)
+    rows = 0
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            for user_id in user_ids:
+                device_id = f"fitbit-device-{user_id}"
+                cursor.execute(
+                    "INSERT INTO users (user_id, name, email) VALUES (%s, %s, %s) "
+                    "ON CONFLICT (user_id) DO NOTHING",
+                    (user_id, f"Load Test User {user_id}", f"loadtest{user_id}@example.com"),
+                )
+                cursor.execute(
+                    "INSERT INTO devices (device_id, user_id, device_type, model) "
+                    "VALUES (%s, %s, 'Fitbit', 'Synthetic') ON CONFLICT (device_id) DO NOTHING",
+                    (device_id, user_id),
+                )
+                for table, columns, generate in SEED_TABLES:
+                    with cursor.copy(
+                        f"COPY {table} (user_id, device_id, timestamp, {', '.join(columns)}) "
+                        f"FROM STDIN"
+                    ) as copy:
+                        for offset in range(days):
+                            day = start + timedelta(days=offset)
+                            for timestamp, *values in generate(day, rng, hr_interval):
+                                copy.write_row((user_id, device_id, timestamp, *values))
+                                rows += 1
+                print(f"Seeded user {user_id}")
+    print(f"Seeded {rows} rows for {len(user_ids)} users over {days} days")
+
+
+def _heart_rate(day, rng, interval):
+    resting = rng.randint(55, 75)
+    for second in range(0, 86400, interval):
+        yield day + timedelta(seconds=second), resting + rng.randint(0, 60), resting
+
+
+def _heart_rate_zones(day, rng, interval):
+    for name, low, high in (
+        ("Out of Range", 30, 98),
+        ("Fat Burn", 98, 137),
+        ("Cardio", 137, 167),
+        ("Peak", 167, 220),
+    ):
+        yield day, name, low, high, rng.randint(0, 600), round(rng.uniform(0, 1500), 2)
+
+
+def _spo2(day, rng, interval):
+    for minute in range(0, 480):
+        yield day + timedelta(minutes=minute), round(rng.uniform(92, 100), 1)
+
+
+def _hrv(day, rng, interval):
+    for minute in range(0, 420, 5):
+        yield (
+            day + timedelta(minutes=minute),
+            round(rng.uniform(20, 90), 3),
+            round(rng.uniform(0.8, 1.0), 3),
+            round(rng.uniform(100, 1500), 3),
+            round(rng.uniform(100, 1500), 3),
+        )
+
+
+def _breathing_rate(day, rng, interval):
+    yield (day, *(round(rng.uniform(12, 18), 1) for _ in range(4)))
+
+
+def _active_zone_minutes(day, rng, interval):
+    for minute in range(1440):
+        if rng.random() < 0.1:
+            zone = rng.randrange(3)
+            yield (
+                day + timedelta(minutes=minute),
+                int(zone == 0),
+                int(zone == 1),
+                int(zone == 2),
+                1,
+            )
+
+
+def _activity(day, rng, interval):
+    yield day, rng.randint(2000, 15000)
+
+
+# (table, value columns, generator of (timestamp, *values) per day)
+SEED_TABLES = [
+    ("heart_rate", ["value", "resting_heart_rate"], _heart_rate),
+    (
+        "heart_rate_zones",
+        ["zone_name", "min_hr", "max_hr", "minutes", "calories_out"],
+        _heart_rate_zones,
+    ),
+    ("spo2", ["value"], _spo2),
+    ("hrv", ["rmssd", "coverage", "hf", "lf"], _hrv),
+    (
+        "breathing_rate",
+        ["deep_sleep_rate", "rem_sleep_rate", "light_sleep_rate", "full_sleep_rate"],
+        _breathing_rate,
+    ),
+    (
+        "active_zone_minutes",
+        ["fat_burn_minutes", "cardio_minutes", "peak_minutes", "active_zone_minutes"],
+        _active_zone_minutes,
+    ),
+    ("activity", ["value"], _activity),
+]
+
+
+def cleanup_database(user_ids):
+    """Delete the seeded users and all of their rows"""
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            for table, _, _ in SEED_TABLES:
+                cursor.execute(
+                    f"DELETE FROM {table} WHERE user_id = ANY(%s)", (list(user_ids),)
+                )
+            cursor.execute("DELETE FROM devices WHERE user_id = ANY(%s)", (list(user_ids),))
+            cursor.execute("DELETE FROM users WHERE user_id = ANY(%s)", (list(user_ids),))
+
+
+# ---------------------------------------------------------------------------
+# Server
+
+
+def boot_server(args):
+    """Start uvicorn with app.main:app and wait until /health answers"""
+    env = dict(os.environ)
+    if args.no_response_cache:
+        env["RESPONSE_CACHE_ENABLED"] = "false"
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "app.main:app",
+            "--host",
+            "127.0.0.1",
+            "--port",
+            str(args.port),
+            "--workers",
+            str(args.workers),
+            "--log-level",
+            "warning",
+        ],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+    )
+    url = f"http://127.0.0.1:{args.port}"
+    deadline = time.monotonic() + args.boot_timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"uvicorn exited with code {process.returncode}")
+        try:
+            with urllib.request.urlopen(f"{url}/health", timeout=1):
+                return process, url
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise SystemExit(f"Server did not become healthy within {args.boot_timeout}s")
+
+
+# ---------------------------------------------------------------------------
+# Load
+
+
+class HTTPConnection:
+    """Minimal keep-alive HTTP/1.1 client for GET requests.
+
+    One per concurrent request slot, like the connections a browser keeps
+    open to a host; reconnects when the server closes the connection.
+    """
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+        self.reader = self.writer = None
+
+    async def get(self, path):
+        """Return (status, body bytes) of a GET request"""
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.writer.write(
+            f"GET {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n"
+            f"Accept: application/json\r\n\r\n".encode()
+        )
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("Server closed the connection")
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            parts = []
+            while True:
+                size = int((await self.reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    await self.reader.readline()
+                    break
+                parts.append(await self.reader.readexactly(size))
+                await self.reader.readline()
+            body = b"".join(parts)
+        elif "content-length" in headers:
+            body = await self.reader.readexactly(int(headers["content-length"]))
+        else:
+            body = await self.reader.read()
+            await self.close()
+
+        if headers.get("connection", "").lower() == "close":
+            await self.close()
+        return status, body
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.errors = defaultdict(int)
+        self.bytes = defaultdict(int)
+        self.fallbacks = defaultdict(int)
+        self.error_samples = []
+        self.dashboard = []
+
+    def record(self, endpoint, latency, status=None, body=b"", error=None):
+        self.latencies[endpoint].append(latency)
+        self.bytes[endpoint] += len(body)
+        if error is not None:
+            self.errors[endpoint] += 1
+            self.statuses[endpoint]["error"] += 1
+            if len(self.error_samples) < 10:
+                self.error_samples.append(f"{endpoint}: {error}")
+            return
+        self.statuses[endpoint][str(status)] += 1
+        if status >= 400:
+            self.errors[endpoint] += 1
+            if len(self.error_samples) < 10:
+                self.error_samples.append(f"{endpoint}: HTTP {status} {body[:200]!r}")
+        elif b'"fallback_used":true' in body:
+            self.fallbacks[endpoint] += 1
+
+
+async def timed_get(conn, endpoint, query, stats, timeout):
+    path = f"{endpoint}?{urlencode(query)}" if query else endpoint
+    started = time.perf_counter()
+    try:
+        status, body = await asyncio.wait_for(conn.get(path), timeout)
+    except Exception as e:
+        await conn.close()
+        stats.record(endpoint, time.perf_counter() - started, error=type(e).__name__)
+        return
+    stats.record(endpoint, time.perf_counter() - started, status, body)
+
+
+def pick_selection(rng, args, user_ids):
+    """A user and date range as the dashboard's pickers would send them"""
+    days = rng.choice([d for d in RANGE_DAYS if d <= args.days] or [args.days])
+    first = args.start + timedelta(days=rng.randint(0, args.days - days))
+    if rng.random() < args.empty_ratio:
+        # A range without data, which sends the endpoints down their fallback queries
+        first -= timedelta(days=365)
+    return {
+        "user_id": rng.choice(user_ids),
+        "start_date": first.strftime("%Y-%m-%d"),
+        "end_date": (first + timedelta(days=days - 1)).strftime("%Y-%m-%d"),
+    }
+
+
+async def virtual_user(index, args, host, port, user_ids, stats, stop_at):
+    rng = random.Random(args.random_seed + index)
+    conns = [HTTPConnection(host, port) for _ in DASHBOARD_ENDPOINTS]
+    selections = 0
+    try:
+        while time.monotonic() < stop_at:
+            if args.selections and selections >= args.selections:
+                break
+            if selections % args.reload_every == 0:
+                await timed_get(conns[0], PAGE_LOAD_ENDPOINT, None, stats, args.timeout)
+
+            query = pick_selection(rng, args, user_ids)
+            started = time.perf_counter()
+            await asyncio.gather(
+                *(
+                    timed_get(conn, endpoint, query, stats, args.timeout)
+                    for conn, endpoint in zip(conns, DASHBOARD_ENDPOINTS)
+                )
+            )
+            stats.dashboard.append(time.perf_counter() - started)
+
+            if rng.random() < args.extra_ratio:
+                endpoint, params = rng.choice(EXTRA_ENDPOINTS)
+                extra_query = (
+                    query
+                    if params == "range"
+                    else {"user_id": query["user_id"]} if params == "user" else None
+                )
+                await timed_get(conns[0], endpoint, extra_query, stats, args.timeout)
+
+            selections += 1
+            if args.think_time > 0:
+                await asyncio.sleep(rng.expovariate(1 / args.think_time))
+    finally:
+        for conn in conns:
+            await conn.close()
+
+
+async def run_load(args, url, user_ids):
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+    stats = Stats()
+    started = time.perf_counter()
+    stop_at = time.monotonic() + args.duration
+    await asyncio.gather(
+        *(
+            virtual_user(i, args, host, port, user_ids, stats, stop_at)
+            for i in range(args.virtual_users)
+        )
+    )
+    return stats, time.perf_counter() - started
+
+
+class ConnectionSampler(threading.Thread):
+    """Samples pg_stat_activity for the application database in the background"""
+
+    QUERY = """
+        SELECT COALESCE(state, 'unknown'), COUNT(*)
+        FROM pg_stat_activity
+        WHERE datname = current_database()
+          AND backend_type = 'client backend'
+          AND pid <> pg_backend_pid()
+        GROUP BY 1
+    """
+
+    def __init__(self, interval):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.samples = []
+        self.error = None
+        self._stop_event = threading.Event()
+
+    def run(self):
+        try:
+            with get_db_connection() as conn:
+                while not self._stop_event.is_set():
+                    rows = conn.execute(self.QUERY).fetchall()
+                    self.samples.append(dict(rows))
+                    self._stop_event.wait(self.interval)
+        except Exception as e:
+            self.error = str(e)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def summary(self):
+        if not self.samples:
+            return {"samples": 0, "error": self.error}
+        totals = [sum(sample.values()) for sample in self.samples]
+        states = sorted({state for sample in self.samples for state in sample})
+        return {
+            "samples": len(self.samples),
+            "max_total": max(totals),
+            "mean_total": round(sum(totals) / len(totals), 2),
+            "max_by_state": {
+                state: max(sample.get(state, 0) for sample in self.samples)
+                for state in states
+            },
+            "mean_by_state": {
+                state: round(
+                    sum(sample.get(state, 0) for sample in self.samples)
+                    / len(self.samples),
+                    2,
+                )
+                for state in states
+            },
+            "error": self.error,
+        }
+
+
+def build_report(args, stats, elapsed, connections):
+    endpoints = {}
+    for endpoint in sorted(stats.latencies):
+        requests = len(stats.latencies[endpoint])
+        endpoints[endpoint] = {
+            "requests": requests,
+            "errors": stats.errors[endpoint],
+            "error_rate": round(stats.errors[endpoint] / requests, 4),
+            "fallback_responses": stats.fallbacks[endpoint],
+            "statuses": dict(stats.statuses[endpoint]),
+            "throughput_rps": round(requests / elapsed, 2),
+            "mean_bytes": round(stats.bytes[endpoint] / requests),
+            **latency_summary(stats.latencies[endpoint]),
+        }
+    all_latencies = [value for values in stats.latencies.values() for value in values]
+    total_requests = len(all_latencies)
+    total_errors = sum(stats.errors.values())
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "config": {
+            "virtual_users": args.virtual_users,
+            "duration_s": args.duration,
+            "selections_per_user": args.selections,
+            "think_time_s": args.think_time,
+            "workers": args.workers if args.boot else None,
+            "response_cache": not args.no_response_cache if args.boot else None,
+            "empty_ratio": args.empty_ratio,
+            "extra_ratio": args.extra_ratio,
+            "date_range": [args.start.strftime("%Y-%m-%d"), args.days],
+        },
+        "elapsed_s": round(elapsed, 3),
+        "overall": {
+            "requests": total_requests,
+            "errors": total_errors,
+            "error_rate": round(total_errors / total_requests, 4) if total_requests else None,
+            "throughput_rps": round(total_requests / elapsed, 2),
+            **latency_summary(all_latencies),
+        },
+        "dashboard": {
+            "loads": len(stats.dashboard),
+            "loads_per_sec": round(len(stats.dashboard) / elapsed, 2),
+            **latency_summary(stats.dashboard),
+        },
+        "endpoints": endpoints,
+        "db_connections": connections,
+        "error_samples": stats.error_samples,
+    }
+
+
+def print_report(report):
+    def fmt(value):
+        return "-" if value is None else f"{value:.1f}"
+
+    print(f"\n{'Endpoint':<50} {'Reqs':>6} {'Err%':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'Req/s':>8}")
+    print("-" * 100)
+    rows = list(report["endpoints"].items()) + [
+        ("all requests", report["overall"]),
+        ("dashboard (7 concurrent calls)", {**report["dashboard"], "requests": report["dashboard"]["loads"], "error_rate": None, "throughput_rps": report["dashboard"]["loads_per_sec"]}),
+    ]
+    for name, r in rows:
+        error_rate = "-" if r.get("error_rate") is None else f"{r['error_rate'] * 100:.1f}"
+        print(
+            f"{name:<50} {r['requests']:>6} {error_rate:>6} {fmt(r['p50_ms']):>8} "
+            f"{fmt(r['p95_ms']):>8} {fmt(r['p99_ms']):>8} {r['throughput_rps']:>8.1f}"
+        )
+    connections = report["db_connections"]
+    if connections.get("samples"):
+        print(
+            f"\nDB connections: max {connections['max_total']}, "
+            f"mean {connections['mean_total']} over {connections['samples']} samples "
+            f"(max by state: {connections['max_by_state']})"
+        )
+    elif connections.get("error"):
+        print(f"\nDB connections not sampled: {connections['error']}")
+    for sample in report["error_samples"]:
+        print(f"error: {sample}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the Fitbit Data API")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--url", default="http://127.0.0.1:8000", help="Running server to test")
+    target.add_argument("--boot", action="store_true", help="Start uvicorn app.main:app for the run")
+    parser.add_argument("--port", type=int, default=8100, help="Port for --boot")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for --boot")
+    parser.add_argument("--boot-timeout", type=float, default=30)
+    parser.add_argument(
+        "--no-response-cache",
+        action="store_true",
+        help="Boot with RESPONSE_CACHE_ENABLED=false to measure uncached queries",
+    )
+
+    parser.add_argument("--seed-db", action="store_true", help="Seed synthetic users before the run")
+    parser.add_argument("--cleanup", action="store_true", help="Delete the seeded users afterwards")
+    parser.add_argument("--seed-users", type=int, default=20)
+    parser.add_argument("--first-user-id", type=int, default=9001)
+    parser.add_argument("--hr-interval", type=int, default=60, help="Seconds between seeded heart rate rows")
+    parser.add_argument("--start", default="2024-01-01", help="First day of data (YYYY-MM-DD)")
+    parser.add_argument("--days", type=int, default=30, help="Days of data to seed and select from")
+
+    parser.add_argument("--virtual-users", type=int, default=10, help="Concurrent dashboard users")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to run")
+    parser.add_argument("--selections", type=int, default=0, help="Stop each user after N selections (0: run for --duration)")
+    parser.add_argument("--think-time", type=float, default=0, help="Mean seconds between selections")
+    parser.add_argument("--reload-every", type=int, default=10, help="Selections per page load (get_all_users)")
+    parser.add_argument("--empty-ratio", type=float, default=0.1, help="Share of ranges without data")
+    parser.add_argument("--extra-ratio", type=float, default=0.1, help="Share of selections followed by a non-dashboard call")
+    parser.add_argument("--timeout", type=float, default=30, help="Per-request timeout in seconds")
+    parser.add_argument("--sample-interval", type=float, default=0.5, help="Seconds between pg_stat_activity samples")
+    parser.add_argument("--random-seed", type=int, default=42)
+    parser.add_argument("--json", type=str, help="Also write the report to this file")
+    args = parser.parse_args()
+    args.start = datetime.strptime(args.start, "%Y-%m-%d")
+    seeded_ids = list(range(args.first_user_id, args.first_user_id + args.seed_users))
+
+    if args.seed_db:
+        seed_database(seeded_ids, args.start, args.days, args.hr_interval, args.random_seed)
+
+    server = None
+    url = args.url
+    if args.boot:
+        server, url = boot_server(args)
+    sampler = ConnectionSampler(args.sample_interval)
+    sampler.start()
+    try:
+        if args.seed_db:
+            user_ids = seeded_ids
+        else:
+            with urllib.request.urlopen(f"{url}{PAGE_LOAD_ENDPOINT}", timeout=args.timeout) as response:
+                user_ids = [user["user_id"] for user in json.load(response)["data"]]
+        if not user_ids:
+            raise SystemExit("No users to select; run with --seed-db")
+
+        stats, elapsed = asyncio.run(run_load(args, url, user_ids))
+    finally:
+        sampler.stop()
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    report = build_report(args, stats, elapsed, sampler.summary())
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.json}")
+
+    if args.cleanup:
+        cleanup_database(seeded_ids)
+        print(f"Removed seeded users {seeded_ids[0]}-{seeded_ids[-1]}")
+
+
+if __name__ == "__main__":
+    main()
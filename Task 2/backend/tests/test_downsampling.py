@@ -0,0 +1,163 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from app.utils.downsampling import (
+    downsample_columns,
+    downsample_indices,
+    downsample_rows,
+    lttb_indices,
+    minmax_indices,
+)
+
+START = datetime(2024, 1, 1)
+
+
+def series(n, seed=0):
+    rng = np.random.default_rng(seed)
+    x = np.arange(n, dtype=np.float64) * 5.0
+    y = 70 + 10 * np.sin(x / 300) + rng.normal(0, 3, n)
+    return x, y
+
+
+def rows(n, seed=0):
+    _, y = series(n, seed)
+    return [
+        {"timestamp": START + timedelta(seconds=5 * i), "value": float(v)}
+        for i, v in enumerate(y)
+    ]
+
+
+@pytest.mark.parametrize("n, max_points", [(10, 3), (1000, 3), (1000, 50), (1001, 999)])
+def test_lttb_keeps_first_and_last_points(n, max_points):
+    x, y = series(n)
+
+    kept = lttb_indices(x, y, max_points)
+
+    assert len(kept) == max_points
+    assert kept[0] == 0
+    assert kept[-1] == n - 1
+    assert np.all(np.diff(kept) > 0)
+
+
+def test_lttb_keeps_a_spike():
+    x, y = series(1000)
+    y[437] = 200.0
+
+    assert 437 in lttb_indices(x, y, 20)
+
+
+def test_lttb_ignores_missing_values():
+    x, y = series(100)
+    y[10:20] = np.nan
+
+    kept = lttb_indices(x, y, 10)
+
+    assert len(kept) == 10
+    assert kept[0] == 0 and kept[-1] == 99
+
+
+@pytest.mark.parametrize("n, max_points", [(1000, 2), (1000, 3), (1000, 50), (1000, 51), (7, 6)])
+def test_minmax_is_ordered_and_within_max_points(n, max_points):
+    _, y = series(n)
+
+    kept = minmax_indices(y, max_points)
+
+    assert 0 < len(kept) <= max_points
+    assert np.all(np.diff(kept) > 0)
+
+
+def test_minmax_keeps_bucket_extremes():
+    _, y = series(1000)
+    y[100], y[900] = 10.0, 300.0
+
+    kept = minmax_indices(y, 10)
+
+    assert 100 in kept and 900 in kept
+
+
+def test_minmax_keeps_all_missing_buckets():
+    _, y = series(100)
+    y[:50] = np.nan
+
+    kept = minmax_indices(y, 10)
+
+    assert 0 in kept
+    assert len(kept) <= 10
+
+
+@pytest.mark.parametrize("method", ["lttb", "minmax"])
+@pytest.mark.parametrize("max_points", [100, 101, 500])
+def test_max_points_at_least_n_passes_through(method, max_points):
+    x, y = series(100)
+
+    assert list(downsample_indices(x, y, max_points, method)) == list(range(100))
+
+    data = rows(100)
+    assert downsample_rows(data, "value", max_points, method) == data
+
+
+def test_unknown_method_is_rejected():
+    x, y = series(10)
+
+    with pytest.raises(ValueError, match="Unknown downsampling method"):
+        downsample_indices(x, y, 5, "average")
+
+
+@pytest.mark.parametrize("method", ["lttb", "minmax"])
+def test_downsample_rows_returns_original_rows_in_order(method):
+    data = rows(1000)
+
+    kept = downsample_rows(data, "value", 40, method)
+
+    assert len(kept) <= 40
+    assert all(row in data for row in kept)
+    assert [row["timestamp"] for row in kept] == sorted(row["timestamp"] for row in kept)
+
+
+@pytest.mark.parametrize("method", ["lttb", "minmax"])
+def test_downsample_rows_sorts_most_recent_first_input(method):
+    data = rows(1000)
+
+    kept = downsample_rows(list(reversed(data)), "value", 40, method)
+
+    assert kept == downsample_rows(data, "value", 40, method)
+    if method == "lttb":
+        assert kept[0] is data[0] and kept[-1] is data[-1]
+
+
+def test_downsample_rows_sorts_short_input():
+    data = rows(10)
+
+    assert downsample_rows(list(reversed(data)), "value", 40) == data
+
+
+@pytest.mark.parametrize("method", ["lttb", "minmax"])
+def test_downsample_columns_matches_rows(method):
+    data = rows(1000)
+    columns = {
+        "columns": ["timestamp", "value"],
+        "data": {
+            "timestamp": [int(row["timestamp"].timestamp() * 1000) for row in data][::-1],
+            "value": [row["value"] for row in data][::-1],
+        },
+        "count": len(data),
+    }
+
+    kept_columns = downsample_columns(columns, "value", 40, method)
+    kept_rows = downsample_rows(data, "value", 40, method)
+
+    assert kept_columns["count"] == len(kept_rows)
+    assert kept_columns["data"]["value"] == [row["value"] for row in kept_rows]
+    assert kept_columns["data"]["timestamp"] == sorted(kept_columns["data"]["timestamp"])
+
+
+def test_downsample_columns_passes_small_input_through():
+    columns = {
+        "columns": ["timestamp", "value"],
+        "data": {"timestamp": [1000, 2000, 3000], "value": [60, 61, 62]},
+        "count": 3,
+    }
+
+    assert downsample_columns(columns, "value", 10) == columns
@@ -0,0 +1,163 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.controllers import hr_controller
+from app.controllers.hr_controller import HEART_RATE_LEVELS, select_heart_rate_level
+from app.utils.date_parser import bucket_count, bucket_floor, whole_buckets
+
+# Default dashboard range: 2024-01-01 00:00 to 2024-01-30 23:59:59 at GMT+6
+START = datetime(2023, 12, 31, 18, tzinfo=timezone.utc)
+END = datetime(2024, 1, 30, 17, 59, 59, tzinfo=timezone.utc)
+DAY = timedelta(days=1)
+WEEK = timedelta(days=7)
+MONTH = timedelta(days=30)
+
+
+class FakeCursor:
+    """Records every query and answers from a queue of canned results"""
+
+    def __init__(self, results):
+        self.results = results
+        self.executed = []
+
+    async def execute(self, query, params):
+        self.executed.append((query, params))
+
+    async def fetchall(self):
+        return self.results.pop(0) if self.results else []
+
+    async def fetchone(self):
+        return {"user_id": 1}
+
+    async def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, results):
+        self.cursor_ = FakeCursor(results)
+
+    def cursor(self, row_factory=None):
+        return self.cursor_
+
+
+@pytest.fixture
+def connect(monkeypatch):
+    def connect(results):
+        connection = FakeConnection(results)
+
+        async def get_connection():
+            return connection
+
+        async def release_connection(conn):
+            pass
+
+        monkeypatch.setattr(hr_controller, "get_async_db_connection", get_connection)
+        monkeypatch.setattr(
+            hr_controller, "release_async_db_connection", release_connection
+        )
+        return connection.cursor_
+
+    return connect
+
+
+def test_bucket_floor_matches_time_bucket_origin():
+    assert bucket_floor(START, MONTH) == datetime(2023, 12, 28, tzinfo=timezone.utc)
+    assert bucket_floor(START, WEEK) == datetime(2023, 12, 25, tzinfo=timezone.utc)
+    assert bucket_floor(START, DAY) == datetime(2023, 12, 31, tzinfo=timezone.utc)
+    assert bucket_floor(datetime(2023, 12, 31, 18), DAY) == bucket_floor(START, DAY)
+
+
+def test_bucket_count_includes_partial_edge_buckets():
+    assert bucket_count(START, END, MONTH) == 2
+    assert bucket_count(START, END, WEEK) == 6
+    assert bucket_count(START, END, DAY) == 31
+    assert bucket_count(START, START, MONTH) == 1
+
+
+def test_whole_buckets_exclude_partial_edges():
+    assert whole_buckets(START, END, DAY) == (
+        datetime(2024, 1, 1, tzinfo=timezone.utc),
+        datetime(2024, 1, 30, tzinfo=timezone.utc),
+    )
+    assert whole_buckets(START, END, WEEK) == (
+        datetime(2024, 1, 1, tzinfo=timezone.utc),
+        datetime(2024, 1, 29, tzinfo=timezone.utc),
+    )
+    # January straddles the 2023-12-28 and 2024-01-27 monthly buckets
+    assert whole_buckets(START, END, MONTH) is None
+
+
+def test_whole_buckets_keep_aligned_start():
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+    assert whole_buckets(start, start + 2 * DAY, DAY) == (start, start + 2 * DAY)
+
+
+@pytest.mark.parametrize("max_points", [1, 2, 3, 6, 7, 31, 100, 1000, 50000])
+def test_selected_level_fits_max_points(max_points):
+    resolution, view, width = select_heart_rate_level(START, END, max_points)
+
+    assert bucket_count(START, END, width) <= max_points
+    assert view in [level[1] for level in HEART_RATE_LEVELS]
+
+
+def test_selected_level_is_the_finest_that_fits():
+    assert select_heart_rate_level(START, END, 31)[0] == "1d"
+    assert select_heart_rate_level(START, END, 30)[0] == "1w"
+    assert select_heart_rate_level(START, END, 2)[0] == "1mo"
+
+
+def test_monthly_buckets_are_merged_when_they_do_not_fit():
+    resolution, view, width = select_heart_rate_level(START, END, 1)
+
+    assert view == "heart_rate_1mo"
+    assert width % MONTH == timedelta(0)
+    assert resolution == f"{width.days}d"
+    assert bucket_count(START, END, width) == 1
+
+
+def test_series_reads_whole_buckets_from_view_and_edges_from_raw(connect):
+    rows = [{"bucket": datetime(2023, 12, 25), "avg_heart_rate": 70.0}]
+    cursor = connect([rows])
+
+    series = asyncio.run(hr_controller.get_heart_rate_series(1, START, END, 6))
+
+    assert series["resolution"] == "1w"
+    assert series["source"] == "heart_rate_1w"
+    assert series["data"] == rows
+    assert len(cursor.executed) == 1
+    query, params = cursor.executed[0]
+    assert "FROM heart_rate_1w" in query and "FROM heart_rate\n" in query
+    assert params["first_bucket"] == datetime(2024, 1, 1, tzinfo=timezone.utc)
+    assert params["last_bucket"] == datetime(2024, 1, 29, tzinfo=timezone.utc)
+    # Raw edge rows stay inside the requested range
+    assert params["start"] == START and params["end"] == END
+    assert params["width"] == WEEK
+
+
+def test_series_without_whole_buckets_uses_raw_rows(connect):
+    rows = [{"bucket": datetime(2023, 12, 28), "avg_heart_rate": 70.0}]
+    cursor = connect([rows])
+
+    series = asyncio.run(hr_controller.get_heart_rate_series(1, START, END, 2))
+
+    assert series["resolution"] == "1mo"
+    assert series["source"] == "heart_rate"
+    assert series["data"] == rows
+    query, params = cursor.executed[0]
+    assert "FROM heart_rate\n" in query
+    assert params == (MONTH, 1, START, END)
+
+
+def test_series_falls_back_to_raw_rows_when_view_is_empty(connect):
+    rows = [{"bucket": datetime(2024, 1, 1), "avg_heart_rate": 70.0}]
+    cursor = connect([[], rows])
+
+    series = asyncio.run(hr_controller.get_heart_rate_series(1, START, END, 31))
+
+    assert series["source"] == "heart_rate"
+    assert series["data"] == rows
+    assert len(cursor.executed) == 2
@@ -0,0 +1,192 @@
+import asyncio
+import base64
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException
+
+from app.utils import pagination
+from app.utils.pagination import (
+    PageRequest,
+    decode_cursor,
+    encode_cursor,
+    page_lower_bound,
+    parse_page_parameters,
+)
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+END = datetime(2024, 1, 2, tzinfo=timezone.utc)
+
+
+class FakeCursor:
+    """Evaluates fetch_page's WHERE/ORDER BY/LIMIT on rows held in memory"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.result = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, query, params):
+        user_id, lower, upper, after_timestamp, after_id, limit = params
+        matches = [
+            row
+            for row in self.rows
+            if row["user_id"] == user_id
+            and lower <= row["timestamp"] <= upper
+            and (row["timestamp"] > after_timestamp or row["id"] > after_id)
+        ]
+        matches.sort(key=lambda row: (row["timestamp"], row["id"]))
+        self.result = [
+            {"id": row["id"], "timestamp": row["timestamp"], "value": row["value"]}
+            for row in matches[:limit]
+        ]
+
+    async def fetchall(self):
+        return self.result
+
+
+class FakeConnection:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def cursor(self, row_factory=None):
+        return FakeCursor(self.rows)
+
+
+@pytest.fixture
+def table(monkeypatch):
+    rows = []
+    connection = FakeConnection(rows)
+
+    async def get_connection():
+        return connection
+
+    async def release_connection(conn):
+        pass
+
+    monkeypatch.setattr(pagination, "get_async_db_connection", get_connection)
+    monkeypatch.setattr(pagination, "release_async_db_connection", release_connection)
+    return rows
+
+
+def read_all_pages(limit, start_date=START, end_date=END):
+    pages = []
+    page = PageRequest(limit, None)
+    while True:
+        result = asyncio.run(
+            pagination.fetch_page(
+                "heart_rate", ["timestamp", "value"], 1, start_date, end_date, page
+            )
+        )
+        if result is None:
+            return pages
+        pages.append(result["data"])
+        if result["next_cursor"] is None:
+            return pages
+        page = PageRequest(limit, decode_cursor(result["next_cursor"]))
+
+
+def test_cursor_round_trip():
+    timestamp = datetime(2024, 1, 1, 12, 30, 15, 250000, tzinfo=timezone.utc)
+    cursor = encode_cursor(timestamp, 42)
+
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (timestamp, 42)
+
+
+def test_cursor_round_trip_naive_timestamp():
+    timestamp = datetime(2024, 1, 1, 12, 30)
+
+    assert decode_cursor(encode_cursor(timestamp, 7)) == (timestamp, 7)
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "not base64!",
+        "@@@@",
+        base64.urlsafe_b64encode(b"\xff\xfe").decode(),
+        base64.urlsafe_b64encode(b"2024-01-01T00:00:00").decode(),
+        base64.urlsafe_b64encode(b"2024-01-01T00:00:00|abc").decode(),
+        base64.urlsafe_b64encode(b"yesterday|1").decode(),
+        base64.urlsafe_b64encode(b"2024-01-01|1|2").decode(),
+    ],
+)
+def test_decode_cursor_rejects_malformed(cursor):
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        decode_cursor(cursor)
+
+
+def test_parse_page_parameters_rejects_malformed_cursor():
+    with pytest.raises(HTTPException) as error:
+        parse_page_parameters(limit=10, cursor="not base64!")
+    assert error.value.status_code == 400
+
+
+def test_parse_page_parameters_requires_limit_for_cursor():
+    with pytest.raises(HTTPException) as error:
+        parse_page_parameters(limit=None, cursor=encode_cursor(START, 1))
+    assert error.value.status_code == 400
+
+
+def test_parse_page_parameters_without_limit():
+    assert parse_page_parameters(limit=None, cursor=None) is None
+
+
+def test_page_lower_bound_clamps_to_start_date():
+    before_start = PageRequest(10, (START - timedelta(days=1), 5))
+    after_start = PageRequest(10, (START + timedelta(hours=1), 5))
+
+    assert page_lower_bound(PageRequest(10, None), START) == START
+    assert page_lower_bound(before_start, START) == START
+    assert page_lower_bound(after_start, START) == START + timedelta(hours=1)
+
+
+def test_page_lower_bound_treats_naive_timestamps_as_utc():
+    page = PageRequest(10, (datetime(2024, 1, 1, 6), 5))
+
+    assert page_lower_bound(page, START) == START + timedelta(hours=6)
+
+
+def test_pages_break_ties_on_equal_timestamps(table):
+    # Five rows share each timestamp, so every page boundary splits a tie
+    for i in range(20):
+        table.append(
+            {
+                "id": 100 - i,
+                "user_id": 1,
+                "timestamp": START + timedelta(minutes=i // 5),
+                "value": i,
+            }
+        )
+
+    pages = read_all_pages(limit=3)
+    rows = [row for page in pages for row in page]
+
+    assert [len(page) for page in pages] == [3, 3, 3, 3, 3, 3, 2]
+    assert sorted(row["value"] for row in rows) == list(range(20))
+    assert [row["timestamp"] for row in rows] == sorted(row["timestamp"] for row in rows)
+    assert all("id" not in row for row in rows)
+
+
+def test_last_page_has_no_cursor(table):
+    for i in range(4):
+        table.append(
+            {"id": i, "user_id": 1, "timestamp": START + timedelta(minutes=i), "value": i}
+        )
+
+    pages = read_all_pages(limit=4)
+
+    assert len(pages) == 1
+    assert len(pages[0]) == 4
+
+
+def test_empty_first_page_returns_none(table):
+    table.append({"id": 1, "user_id": 2, "timestamp": START, "value": 1})
+
+    assert read_all_pages(limit=10) == []
@@ -0,0 +1,288 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+# Native compression settings per hypertable. Rows are segmented per user and
+# device so a user's long-range scan only decompresses that user's segments,
+# and ordered by ascending time inside each segment, the order the dashboard
+# and the paged endpoints read rows in.
+#   compress_after: age at which the policy compresses a chunk
+#   probe_column:   column aggregated by the latency probe
+COMPRESSION_SETTINGS = {
+    "heart_rate": {"compress_after": "7 days", "probe_column": "value"},
+    "spo2": {"compress_after": "7 days", "probe_column": "value"},
+    "hrv": {"compress_after": "7 days", "probe_column": "rmssd"},
+    "active_zone_minutes": {
+        "compress_after": "7 days",
+        "probe_column": "active_zone_minutes",
+    },
+    "heart_rate_zones": {"compress_after": "30 days", "probe_column": "minutes"},
+    "breathing_rate": {"compress_after": "30 days", "probe_column": "full_sleep_rate"},
+    "activity": {"compress_after": "30 days", "probe_column": "value"},
+}
+
+SEGMENT_BY = "user_id, device_id"
+ORDER_BY = "timestamp"
+
+
+def get_db_connection():
+    """Create a connection to the TimescaleDB database"""
+    try:
+        conn = psycopg2.connect(
+            host=os.environ.get("DB_HOST", "localhost"),
+            port=os.environ.get("DB_PORT", "5432"),
+            dbname=os.environ.get("DB_NAME", "fitbit_data"),
+            user=os.environ.get("DB_USER", "postgres"),
+            password=os.environ.get("DB_PASSWORD", "password"),
+        )
+        conn.autocommit = True
+        return conn
+    except Exception as e:
+        print(f"Database connection error: {e}")
+        sys.exit(1)
+
+
+def generate_sql(tables):
+    """Compression settings and policies for the given tables"""
+    statements = []
+    for table in tables:
+        statements.append(
+            f"-- {table}\n"
+            f"ALTER TABLE {table} SET (\n"
+            f"    timescaledb.compress,\n"
+            f"    timescaledb.compress_segmentby = '{SEGMENT_BY}',\n"
+            f"    timescaledb.compress_orderby = '{ORDER_BY}'\n"
+            f");\n"
+            f"SELECT add_compression_policy('{table}', "
+            f"INTERVAL '{COMPRESSION_SETTINGS[table]['compress_after']}', "
+            f"if_not_exists => true);"
+        )
+    return "\n\n".join(statements) + "\n"
+
+
+def setup_compression(conn, tables):
+    """Enable compression and add the age-based policies"""
+    try:
+        with conn.cursor() as cursor:
+            for table in tables:
+                cursor.execute(generate_sql([table]))
+                print(
+                    f"Enabled compression on {table} "
+                    f"(policy after {COMPRESSION_SETTINGS[table]['compress_after']})"
+                )
+    except Exception as e:
+        print(f"Error setting up compression: {e}")
+        sys.exit(1)
+
+
+def compress_chunks(conn, tables, older_than=None):
+    """Compress chunks now instead of waiting for the policy"""
+    try:
+        with conn.cursor() as cursor:
+            for table in tables:
+                if older_than:
+                    cursor.execute(
+                        "SELECT show_chunks(%s, older_than => %s::interval)",
+                        (table, older_than),
+                    )
+                else:
+                    cursor.execute("SELECT show_chunks(%s)", (table,))
+                chunks = [row[0] for row in cursor.fetchall()]
+                for chunk in chunks:
+                    cursor.execute(
+                        "SELECT compress_chunk(%s, if_not_compressed => true)",
+                        (chunk,),
+                    )
+                print(f"Compressed {len(chunks)} chunks of {table}")
+    except Exception as e:
+        print(f"Error compressing chunks: {e}")
+        sys.exit(1)
+
+
+def decompress_chunks(conn, tables):
+    """Decompress every chunk, e.g. to take a new baseline"""
+    try:
+        with conn.cursor() as cursor:
+            for table in tables:
+                cursor.execute("SELECT show_chunks(%s)", (table,))
+                chunks = [row[0] for row in cursor.fetchall()]
+                for chunk in chunks:
+                    cursor.execute(
+                        "SELECT decompress_chunk(%s, if_compressed => true)", (chunk,)
+                    )
+                print(f"Decompressed {len(chunks)} chunks of {table}")
+    except Exception as e:
+        print(f"Error decompressing chunks: {e}")
+        sys.exit(1)
+
+
+def measure_sizes(conn, tables):
+    """Total on-disk size and compressed chunk count per table"""
+    sizes = {}
+    with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+        for table in tables:
+            cursor.execute(
+                "SELECT hypertable_size(%s) AS total_bytes", (table,)
+            )
+            total_bytes = cursor.fetchone()["total_bytes"] or 0
+            cursor.execute(
+                """
+                SELECT
+                    COUNT(*) AS chunks,
+                    COUNT(*) FILTER (WHERE is_compressed) AS compressed_chunks
+                FROM timescaledb_information.chunks
+                WHERE hypertable_name = %s
+                """,
+                (table,),
+            )
+            chunk_info = cursor.fetchone()
+            sizes[table] = {
+                "total_bytes": total_bytes,
+                "chunks": chunk_info["chunks"],
+                "compressed_chunks": chunk_info["compressed_chunks"],
+            }
+    return sizes
+
+
+def measure_latency(conn, tables, user_id, repeats):
+    """Median latency of a full-range scan of one user's rows per table"""
+    latencies = {}
+    with conn.cursor() as cursor:
+        for table in tables:
+            column = COMPRESSION_SETTINGS[table]["probe_column"]
+            cursor.execute(
+                f"SELECT MIN(timestamp), MAX(timestamp) FROM {table} WHERE user_id = %s",
+                (user_id,),
+            )
+            start, end = cursor.fetchone()
+            if start is None:
+                latencies[table] = None
+                continue
+
+            query = (
+                f"SELECT COUNT(*), AVG({column}), MIN({column}), MAX({column}) "
+                f"FROM {table} WHERE user_id = %s AND timestamp BETWEEN %s AND %s"
+            )
+            timings = []
+            for _ in range(repeats):
+                started = time.perf_counter()
+                cursor.execute(query, (user_id, start, end))
+                cursor.fetchall()
+                timings.append((time.perf_counter() - started) * 1000)
+            latencies[table] = round(statistics.median(timings), 3)
+    return latencies
+
+
+def take_snapshot(conn, tables, user_id, repeats):
+    return {
+        "sizes": measure_sizes(conn, tables),
+        "latency_ms": measure_latency(conn, tables, user_id, repeats),
+    }
+
+
+def print_snapshot(title, snapshot):
+    print(f"\n{title}")
+    print("-" * 80)
+    print(f"{'Table':<22} {'Size':<12} {'Chunks':<14} {'Scan latency':<12}")
+    print("-" * 80)
+    for table, size in snapshot["sizes"].items():
+        latency = snapshot["latency_ms"].get(table)
+        print(
+            f"{table:<22} {size['total_bytes'] / (1024 * 1024):>8.2f} MB "
+            f"{size['compressed_chunks']:>4}/{size['chunks']:<4} compr. "
+            f"{'-' if latency is None else f'{latency:.1f} ms':>12}"
+        )
+
+
+def print_comparison(before, after):
+    print("\nBefore/after")
+    print("-" * 80)
+    print(f"{'Table':<22} {'Size ratio':<14} {'Latency ratio':<14}")
+    print("-" * 80)
+    for table in before["sizes"]:
+        size_before = before["sizes"][table]["total_bytes"]
+        size_after = after["sizes"][table]["total_bytes"]
+        latency_before = before["latency_ms"].get(table)
+        latency_after = after["latency_ms"].get(table)
+        size_ratio = f"{size_after / size_before:.2f}x" if size_before else "-"
+        latency_ratio = (
+            f"{latency_after / latency_before:.2f}x"
+            if latency_before and latency_after is not None
+            else "-"
+        )
+        print(f"{table:<22} {size_ratio:<14} {latency_ratio:<14}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Manage TimescaleDB native compression on the Fitbit hypertables"
+    )
+    parser.add_argument(
+        "--table",
+        action="append",
+        choices=sorted(COMPRESSION_SETTINGS),
+        help="Limit the command to one table (repeatable, default: all)",
+    )
+
+    subparsers = parser.add_subparsers(dest="command", help="Command to execute")
+    subparsers.add_parser("sql", help="Print the compression SQL without executing it")
+    subparsers.add_parser("setup", help="Enable compression and add policies")
+    compress_parser = subparsers.add_parser("compress", help="Compress chunks now")
+    compress_parser.add_argument(
+        "--older-than", type=str, help="Only chunks older than this interval, e.g. '7 days'"
+    )
+    subparsers.add_parser("decompress", help="Decompress all chunks")
+    for name, help_text in (
+        ("report", "Report current sizes and scan latency"),
+        ("benchmark", "Report, compress every chunk, then report again"),
+    ):
+        sub = subparsers.add_parser(name, help=help_text)
+        sub.add_argument("--user-id", type=int, default=1, help="User to scan")
+        sub.add_argument("--repeats", type=int, default=5, help="Runs per query")
+        sub.add_argument("--json", type=str, help="Also write the results to this file")
+
+    args = parser.parse_args()
+    tables = args.table or list(COMPRESSION_SETTINGS)
+
+    if args.command == "sql":
+        print(generate_sql(tables))
+        return
+    if args.command is None:
+        parser.print_help()
+        return
+
+    conn = get_db_connection()
+    try:
+        if args.command == "setup":
+            setup_compression(conn, tables)
+        elif args.command == "compress":
+            compress_chunks(conn, tables, args.older_than)
+        elif args.command == "decompress":
+            decompress_chunks(conn, tables)
+        elif args.command in ("report", "benchmark"):
+            results = {"before": take_snapshot(conn, tables, args.user_id, args.repeats)}
+            print_snapshot("Current state", results["before"])
+
+            if args.command == "benchmark":
+                compress_chunks(conn, tables)
+                results["after"] = take_snapshot(
+                    conn, tables, args.user_id, args.repeats
+                )
+                print_snapshot("After compression", results["after"])
+                print_comparison(results["before"], results["after"])
+
+            if args.json:
+                with open(args.json, "w") as f:
+                    json.dump(results, f, indent=2)
+                print(f"\nResults written to {args.json}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
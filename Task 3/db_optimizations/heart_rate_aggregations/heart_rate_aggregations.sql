@@ -21,7 +21,8 @@ BEGIN
             FOR view_name IN (
                 SELECT view_name 
                 FROM timescaledb_information.continuous_aggregate_policies
-                WHERE view_name LIKE 'heart_rate_%'
+                WHERE view_name IN ('heart_rate_1m', 'heart_rate_1h', 'heart_rate_1d',
+                                    'heart_rate_1w', 'heart_rate_1mo')
             ) LOOP
                 BEGIN
                     EXECUTE FORMAT('SELECT remove_continuous_aggregate_policy(%L, if_exists => true)', view_name);
@@ -55,79 +56,114 @@ END $$;
 -- Create heart rate aggregation views
 CREATE OR REPLACE FUNCTION create_heart_rate_aggregations() RETURNS VOID AS $$
 BEGIN
-    -- Minutely: continuous aggregate (from hypertable)
-CREATE MATERIALIZED VIEW IF NOT EXISTS heart_rate_1m WITH (timescaledb.continuous) AS
+    -- Minutely: continuous aggregate (from hypertable). Every level stores
+    -- mergeable partial state (sum, count, sum of squares, min, max) so upper
+    -- levels and arbitrary ranges combine exactly; averages are derived from it.
+    -- sample_count counts rows as before; value_count counts non-null values
+    -- and is the denominator of every average.
+CREATE MATERIALIZED VIEW IF NOT EXISTS heart_rate_1m
+WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
 SELECT
     time_bucket('1 minute', timestamp) AS bucket,
     user_id,
     device_id,
-    AVG(value) AS avg_heart_rate,
+    SUM(value) AS sum_heart_rate,
+    COUNT(*) AS sample_count,
+    COUNT(value) AS value_count,
+    SUM(value::DOUBLE PRECISION * value) AS sumsq_heart_rate,
     MIN(value) AS min_heart_rate,
     MAX(value) AS max_heart_rate,
-    COUNT(*) AS sample_count,
-    AVG(resting_heart_rate) AS avg_resting_heart_rate
+    SUM(value)::DOUBLE PRECISION / NULLIF(COUNT(value), 0) AS avg_heart_rate,
+    SUM(resting_heart_rate) AS sum_resting_heart_rate,
+    COUNT(resting_heart_rate) AS resting_sample_count,
+    SUM(resting_heart_rate)::DOUBLE PRECISION / NULLIF(COUNT(resting_heart_rate), 0) AS avg_resting_heart_rate
 FROM heart_rate
-GROUP BY bucket, user_id, device_id
+GROUP BY time_bucket('1 minute', timestamp), user_id, device_id
 WITH NO DATA;
 
--- Hourly: regular materialized view (from minutely)
-CREATE MATERIALIZED VIEW IF NOT EXISTS heart_rate_1h AS
+-- Hourly: hierarchical continuous aggregate (from minutely)
+CREATE MATERIALIZED VIEW IF NOT EXISTS heart_rate_1h
+WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
 SELECT
     time_bucket('1 hour', bucket) AS bucket,
     user_id,
     device_id,
-    AVG(avg_heart_rate) AS avg_heart_rate,
+    SUM(sum_heart_rate) AS sum_heart_rate,
+    SUM(sample_count) AS sample_count,
+    SUM(value_count) AS value_count,
+    SUM(sumsq_heart_rate) AS sumsq_heart_rate,
     MIN(min_heart_rate) AS min_heart_rate,
     MAX(max_heart_rate) AS max_heart_rate,
-    SUM(sample_count) AS sample_count,
-    AVG(avg_resting_heart_rate) AS avg_resting_heart_rate
+    SUM(sum_heart_rate)::DOUBLE PRECISION / NULLIF(SUM(value_count), 0) AS avg_heart_rate,
+    SUM(sum_resting_heart_rate) AS sum_resting_heart_rate,
+    SUM(resting_sample_count) AS resting_sample_count,
+    SUM(sum_resting_heart_rate)::DOUBLE PRECISION / NULLIF(SUM(resting_sample_count), 0) AS avg_resting_heart_rate
 FROM heart_rate_1m
-GROUP BY bucket, user_id, device_id
+GROUP BY time_bucket('1 hour', bucket), user_id, device_id
 WITH NO DATA;
 
--- Daily: regular materialized view (from hourly)
-CREATE MATERIALIZED VIEW IF NOT EXISTS heart_rate_1d AS
+-- Daily: hierarchical continuous aggregate (from hourly)
+CREATE MATERIALIZED VIEW IF NOT EXISTS heart_rate_1d
+WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
 SELECT
     time_bucket('1 day', bucket) AS bucket,
     user_id,
     device_id,
-    AVG(avg_heart_rate) AS avg_heart_rate,
+    SUM(sum_heart_rate) AS sum_heart_rate,
+    SUM(sample_count) AS sample_count,
+    SUM(value_count) AS value_count,
+    SUM(sumsq_heart_rate) AS sumsq_heart_rate,
     MIN(min_heart_rate) AS min_heart_rate,
     MAX(max_heart_rate) AS max_heart_rate,
-    SUM(sample_count) AS sample_count,
-    AVG(avg_resting_heart_rate) AS avg_resting_heart_rate
+    SUM(sum_heart_rate)::DOUBLE PRECISION / NULLIF(SUM(value_count), 0) AS avg_heart_rate,
+    SUM(sum_resting_heart_rate) AS sum_resting_heart_rate,
+    SUM(resting_sample_count) AS resting_sample_count,
+    SUM(sum_resting_heart_rate)::DOUBLE PRECISION / NULLIF(SUM(resting_sample_count), 0) AS avg_resting_heart_rate
 FROM heart_rate_1h
-GROUP BY bucket, user_id, device_id
+GROUP BY time_bucket('1 day', bucket), user_id, device_id
 WITH NO DATA;
 
--- Weekly: regular materialized view (from daily)
-CREATE MATERIALIZED VIEW IF NOT EXISTS heart_rate_1w AS
+-- Weekly: hierarchical continuous aggregate (from daily)
+CREATE MATERIALIZED VIEW IF NOT EXISTS heart_rate_1w
+WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
 SELECT
     time_bucket('7 days', bucket) AS bucket,
     user_id,
     device_id,
-    AVG(avg_heart_rate) AS avg_heart_rate,
+    SUM(sum_heart_rate) AS sum_heart_rate,
+    SUM(sample_count) AS sample_count,
+    SUM(value_count) AS value_count,
+    SUM(sumsq_heart_rate) AS sumsq_heart_rate,
     MIN(min_heart_rate) AS min_heart_rate,
     MAX(max_heart_rate) AS max_heart_rate,
-    SUM(sample_count) AS sample_count,
-    AVG(avg_resting_heart_rate) AS avg_resting_heart_rate
+    SUM(sum_heart_rate)::DOUBLE PRECISION / NULLIF(SUM(value_count), 0) AS avg_heart_rate,
+    SUM(sum_resting_heart_rate) AS sum_resting_heart_rate,
+    SUM(resting_sample_count) AS resting_sample_count,
+    SUM(sum_resting_heart_rate)::DOUBLE PRECISION / NULLIF(SUM(resting_sample_count), 0) AS avg_resting_heart_rate
 FROM heart_rate_1d
-GROUP BY bucket, user_id, device_id
+GROUP BY time_bucket('7 days', bucket), user_id, device_id
 WITH NO DATA;
 
--- Monthly: regular materialized view (from weekly)
-CREATE MATERIALIZED VIEW IF NOT EXISTS heart_rate_1mo AS
+-- Monthly: hierarchical continuous aggregate (from daily; 30 days is not a
+-- multiple of the weekly bucket, so it cannot be built on heart_rate_1w)
+CREATE MATERIALIZED VIEW IF NOT EXISTS heart_rate_1mo
+WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
 SELECT
     time_bucket('30 days', bucket) AS bucket,
     user_id,
     device_id,
-    AVG(avg_heart_rate) AS avg_heart_rate,
+    SUM(sum_heart_rate) AS sum_heart_rate,
+    SUM(sample_count) AS sample_count,
+    SUM(value_count) AS value_count,
+    SUM(sumsq_heart_rate) AS sumsq_heart_rate,
     MIN(min_heart_rate) AS min_heart_rate,
     MAX(max_heart_rate) AS max_heart_rate,
-    SUM(sample_count) AS sample_count,
-    AVG(avg_resting_heart_rate) AS avg_resting_heart_rate
-FROM heart_rate_1w
-GROUP BY bucket, user_id, device_id
+    SUM(sum_heart_rate)::DOUBLE PRECISION / NULLIF(SUM(value_count), 0) AS avg_heart_rate,
+    SUM(sum_resting_heart_rate) AS sum_resting_heart_rate,
+    SUM(resting_sample_count) AS resting_sample_count,
+    SUM(sum_resting_heart_rate)::DOUBLE PRECISION / NULLIF(SUM(resting_sample_count), 0) AS avg_resting_heart_rate
+FROM heart_rate_1d
+GROUP BY time_bucket('30 days', bucket), user_id, device_id
 WITH NO DATA;
 
     -- Set up refresh policies
@@ -199,7 +235,10 @@ BEGIN
 END;
 $$ LANGUAGE PLPGSQL;
 
--- Function to refresh a specific aggregation level with intelligent dependency management
+-- Function to refresh a specific aggregation level with intelligent dependency management.
+-- Every level is a continuous aggregate, so a refresh only recomputes the buckets
+-- inside the window. The window is widened to whole buckets of each level and the
+-- levels below the requested one are refreshed first, since each level reads its parent.
 CREATE OR REPLACE FUNCTION refresh_heart_rate_aggregation(
     level TEXT,
     start_date TIMESTAMP DEFAULT NULL,
@@ -209,6 +248,12 @@ DECLARE
     start_ts TIMESTAMP;
     end_ts TIMESTAMP;
     result_message TEXT;
+    levels TEXT[] := ARRAY['1m', '1h', '1d', '1w', '1mo'];
+    widths INTERVAL[] := ARRAY[INTERVAL '1 minute', INTERVAL '1 hour', INTERVAL '1 day',
+                               INTERVAL '7 days', INTERVAL '30 days'];
+    target INTEGER;
+    window_start TIMESTAMP;
+    window_end TIMESTAMP;
 BEGIN
     -- Default date range if not provided
     IF start_date IS NULL THEN
@@ -223,23 +268,26 @@ BEGIN
         end_ts := end_date;
     END IF;
 
+    target := array_position(levels, level);
+    IF target IS NULL THEN
+        RETURN 'Invalid aggregation level. Use 1m, 1h, 1d, 1w, or 1mo.';
+    END IF;
+
     result_message := 'To refresh heart_rate_' || level || ' from ' || start_ts || ' to ' || end_ts || ', run these commands in sequence:';
 
-    -- Build refresh commands based on level with dependencies
-    CASE level
-        WHEN '1m' THEN
-            result_message := result_message || E'\n1. CALL refresh_continuous_aggregate(''heart_rate_1m'', ''' || start_ts || ''', ''' || end_ts || ''');';
-        WHEN '1h' THEN
-            result_message := result_message || E'\nREFRESH MATERIALIZED VIEW heart_rate_1h;';
-        WHEN '1d' THEN
-            result_message := result_message || E'\nREFRESH MATERIALIZED VIEW heart_rate_1d;';
-        WHEN '1w' THEN
-            result_message := result_message || E'\nREFRESH MATERIALIZED VIEW heart_rate_1w;';
-        WHEN '1mo' THEN
-            result_message := result_message || E'\nREFRESH MATERIALIZED VIEW heart_rate_1mo;';
-        ELSE
-            RETURN 'Invalid aggregation level. Use 1m, 1h, 1d, 1w, or 1mo.';
-    END CASE;
+    FOR i IN 1..target LOOP
+        -- 1mo is built from 1d, so 1w is not on its path
+        CONTINUE WHEN levels[i] = '1w' AND level = '1mo';
+
+        window_start := time_bucket(widths[i], start_ts);
+        window_end := time_bucket(widths[i], end_ts);
+        IF window_end < end_ts THEN
+            window_end := window_end + widths[i];
+        END IF;
+
+        result_message := result_message || E'\nCALL refresh_continuous_aggregate(''heart_rate_' || levels[i]
+            || ''', ''' || window_start || ''', ''' || window_end || ''');';
+    END LOOP;
 
     RETURN result_message;
 END;
@@ -272,6 +320,129 @@ BEGIN
 END;
 $$ LANGUAGE PLPGSQL;
 
+-- Function to get exact heart rate statistics for an arbitrary range [start_date, end_date).
+-- The range is covered with the coarsest whole buckets available (1mo, then 1w, 1d,
+-- 1h, 1m); only the leftover sub-minute edges are read from the raw hypertable.
+-- The partial states of all pieces are merged, so mean, stddev, min and max match
+-- a scan of the raw rows. sample_count counts rows, value_count the non-null
+-- values behind the mean and standard deviation.
+DROP FUNCTION IF EXISTS get_heart_rate_range_stats(INT, TIMESTAMP, TIMESTAMP);
+CREATE OR REPLACE FUNCTION get_heart_rate_range_stats(
+    p_user_id INT,
+    start_date TIMESTAMP,
+    end_date TIMESTAMP
+) RETURNS TABLE (
+    mean_heart_rate DOUBLE PRECISION,
+    stddev_heart_rate DOUBLE PRECISION,
+    min_heart_rate INT,
+    max_heart_rate INT,
+    sample_count BIGINT,
+    value_count BIGINT
+) AS $$
+DECLARE
+    levels TEXT[] := ARRAY['1mo', '1w', '1d', '1h', '1m'];
+    widths INTERVAL[] := ARRAY[INTERVAL '30 days', INTERVAL '7 days', INTERVAL '1 day',
+                               INTERVAL '1 hour', INTERVAL '1 minute'];
+    pending TSRANGE[] := ARRAY[tsrange(start_date, end_date, '[)')];
+    remaining TSRANGE[];
+    segment TSRANGE;
+    inner_start TIMESTAMP;
+    inner_end TIMESTAMP;
+    part_sum NUMERIC;
+    part_rows NUMERIC;
+    part_count NUMERIC;
+    part_sumsq DOUBLE PRECISION;
+    part_min INT;
+    part_max INT;
+    total_sum NUMERIC := 0;
+    total_rows NUMERIC := 0;
+    total_count NUMERIC := 0;
+    total_sumsq DOUBLE PRECISION := 0;
+    total_min INT;
+    total_max INT;
+BEGIN
+    IF start_date >= end_date THEN
+        RETURN QUERY SELECT NULL::DOUBLE PRECISION, NULL::DOUBLE PRECISION, NULL::INT, NULL::INT, 0::BIGINT, 0::BIGINT;
+        RETURN;
+    END IF;
+
+    FOR i IN 1..array_length(levels, 1) LOOP
+        remaining := ARRAY[]::TSRANGE[];
+
+        FOREACH segment IN ARRAY pending LOOP
+            -- Whole buckets of this level inside the segment
+            inner_start := time_bucket(widths[i], lower(segment));
+            IF inner_start < lower(segment) THEN
+                inner_start := inner_start + widths[i];
+            END IF;
+            inner_end := time_bucket(widths[i], upper(segment));
+
+            IF inner_start < inner_end THEN
+                EXECUTE format(
+                    'SELECT SUM(sum_heart_rate), SUM(sample_count), SUM(value_count), SUM(sumsq_heart_rate),
+                            MIN(min_heart_rate), MAX(max_heart_rate)
+                     FROM %I
+                     WHERE user_id = $1 AND bucket >= $2 AND bucket < $3',
+                    'heart_rate_' || levels[i]
+                )
+                INTO part_sum, part_rows, part_count, part_sumsq, part_min, part_max
+                USING p_user_id, inner_start, inner_end;
+
+                total_sum := total_sum + COALESCE(part_sum, 0);
+                total_rows := total_rows + COALESCE(part_rows, 0);
+                total_count := total_count + COALESCE(part_count, 0);
+                total_sumsq := total_sumsq + COALESCE(part_sumsq, 0);
+                total_min := LEAST(total_min, part_min);
+                total_max := GREATEST(total_max, part_max);
+
+                -- Edges left over for the finer levels
+                IF lower(segment) < inner_start THEN
+                    remaining := remaining || tsrange(lower(segment), inner_start, '[)');
+                END IF;
+                IF inner_end < upper(segment) THEN
+                    remaining := remaining || tsrange(inner_end, upper(segment), '[)');
+                END IF;
+            ELSE
+                remaining := remaining || segment;
+            END IF;
+        END LOOP;
+
+        pending := remaining;
+        EXIT WHEN array_length(pending, 1) IS NULL;
+    END LOOP;
+
+    -- Sub-minute edges come from the raw rows
+    FOREACH segment IN ARRAY pending LOOP
+        SELECT SUM(value), COUNT(*), COUNT(value), SUM(value::DOUBLE PRECISION * value), MIN(value), MAX(value)
+        INTO part_sum, part_rows, part_count, part_sumsq, part_min, part_max
+        FROM heart_rate
+        WHERE user_id = p_user_id AND timestamp >= lower(segment) AND timestamp < upper(segment);
+
+        total_sum := total_sum + COALESCE(part_sum, 0);
+        total_rows := total_rows + COALESCE(part_rows, 0);
+        total_count := total_count + COALESCE(part_count, 0);
+        total_sumsq := total_sumsq + COALESCE(part_sumsq, 0);
+        total_min := LEAST(total_min, part_min);
+        total_max := GREATEST(total_max, part_max);
+    END LOOP;
+
+    RETURN QUERY SELECT
+        CASE WHEN total_count > 0 THEN (total_sum / total_count)::DOUBLE PRECISION END,
+        -- Sample standard deviation, as stddev() over the raw values
+        CASE WHEN total_count > 1 THEN
+            sqrt(GREATEST(
+                (total_sumsq - (total_sum * total_sum / total_count)::DOUBLE PRECISION)
+                    / (total_count - 1)::DOUBLE PRECISION,
+                0
+            ))
+        END,
+        total_min,
+        total_max,
+        total_rows::BIGINT,
+        total_count::BIGINT;
+END;
+$$ LANGUAGE PLPGSQL;
+
 -- Function to get statistics about heart rate aggregations
 CREATE OR REPLACE FUNCTION get_heart_rate_aggregation_stats() RETURNS TABLE (
     level TEXT,
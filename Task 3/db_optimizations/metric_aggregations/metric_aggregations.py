@@ -0,0 +1,272 @@
+import argparse
+import datetime
+import os
+import sys
+import psycopg2
+
+# Rollup hierarchy for every hypertable except heart_rate, which has its own
+# in heart_rate_aggregations.sql. Each column is stored as sum/count/min/max so
+# averages stay exact when higher levels are built from lower ones.
+#   columns:  numeric columns to roll up
+#   group_by: extra grouping columns besides user_id and device_id
+#   levels:   rollup levels to create, finest first; metrics with one record
+#             per day only get a daily rollup
+METRIC_AGGREGATIONS = {
+    "spo2": {
+        "columns": ["value"],
+        "group_by": [],
+        "levels": ["1m", "1h", "1d"],
+    },
+    "hrv": {
+        "columns": ["rmssd", "coverage", "hf", "lf"],
+        "group_by": [],
+        "levels": ["1m", "1h", "1d"],
+    },
+    "active_zone_minutes": {
+        "columns": [
+            "fat_burn_minutes",
+            "cardio_minutes",
+            "peak_minutes",
+            "active_zone_minutes",
+        ],
+        "group_by": [],
+        "levels": ["1m", "1h", "1d"],
+    },
+    "breathing_rate": {
+        "columns": [
+            "deep_sleep_rate",
+            "rem_sleep_rate",
+            "light_sleep_rate",
+            "full_sleep_rate",
+        ],
+        "group_by": [],
+        "levels": ["1d"],
+    },
+    "activity": {
+        "columns": ["value"],
+        "group_by": [],
+        "levels": ["1d"],
+    },
+    "heart_rate_zones": {
+        "columns": ["min_hr", "max_hr", "minutes", "calories_out"],
+        "group_by": ["zone_name"],
+        "levels": ["1d"],
+    },
+}
+
+# Bucket width of each level
+LEVEL_INTERVALS = {
+    "1m": "1 minute",
+    "1h": "1 hour",
+    "1d": "1 day",
+}
+
+# Refresh policy per level: (start_offset, end_offset, schedule_interval)
+LEVEL_POLICIES = {
+    "1m": ("2 days", "1 hour", "1 hour"),
+    "1h": ("7 days", "1 hour", "6 hours"),
+    "1d": ("30 days", "1 day", "1 day"),
+}
+
+
+def get_db_connection():
+    """Create a connection to the TimescaleDB database"""
+    try:
+        conn = psycopg2.connect(
+            host=os.environ.get("DB_HOST", "localhost"),
+            port=os.environ.get("DB_PORT", "5432"),
+            dbname=os.environ.get("DB_NAME", "fitbit_data"),
+            user=os.environ.get("DB_USER", "postgres"),
+            password=os.environ.get("DB_PASSWORD", "password"),
+        )
+        # Continuous aggregates cannot be created or refreshed inside a transaction
+        conn.autocommit = True
+        return conn
+    except Exception as e:
+        print(f"Database connection error: {e}")
+        sys.exit(1)
+
+
+def view_name(table, level):
+    return f"{table}_{level}"
+
+
+def create_view_sql(table, level, parent_level=None):
+    """CREATE statement for one rollup; levels above the first read their parent rollup"""
+    spec = METRIC_AGGREGATIONS[table]
+    keys = ["user_id", "device_id"] + spec["group_by"]
+
+    if parent_level is None:
+        source = table
+        time_column = "timestamp"
+        aggregates = ["COUNT(*) AS row_count"]
+        for column in spec["columns"]:
+            aggregates += [
+                f"SUM({column}) AS {column}_sum",
+                f"COUNT({column}) AS {column}_count",
+                f"MIN({column}) AS {column}_min",
+                f"MAX({column}) AS {column}_max",
+            ]
+    else:
+        source = view_name(table, parent_level)
+        time_column = "bucket"
+        aggregates = ["SUM(row_count) AS row_count"]
+        for column in spec["columns"]:
+            aggregates += [
+                f"SUM({column}_sum) AS {column}_sum",
+                f"SUM({column}_count) AS {column}_count",
+                f"MIN({column}_min) AS {column}_min",
+                f"MAX({column}_max) AS {column}_max",
+            ]
+
+    # Group by the expression: in upper levels "bucket" would name the parent's column
+    bucket_expr = f"time_bucket('{LEVEL_INTERVALS[level]}', {time_column})"
+    select_list = ",\n    ".join([f"{bucket_expr} AS bucket"] + keys + aggregates)
+    return (
+        f"CREATE MATERIALIZED VIEW IF NOT EXISTS {view_name(table, level)}\n"
+        f"WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS\n"
+        f"SELECT\n    {select_list}\n"
+        f"FROM {source}\n"
+        f"GROUP BY {bucket_expr}, {', '.join(keys)}\n"
+        f"WITH NO DATA;"
+    )
+
+
+def create_policy_sql(table, level):
+    start_offset, end_offset, schedule_interval = LEVEL_POLICIES[level]
+    return (
+        f"SELECT add_continuous_aggregate_policy('{view_name(table, level)}',\n"
+        f"    start_offset => INTERVAL '{start_offset}',\n"
+        f"    end_offset => INTERVAL '{end_offset}',\n"
+        f"    schedule_interval => INTERVAL '{schedule_interval}',\n"
+        f"    if_not_exists => true);"
+    )
+
+
+def generate_sql(tables):
+    """Setup SQL for the given tables, each hierarchy created finest level first"""
+    statements = []
+    for table in tables:
+        parent_level = None
+        for level in METRIC_AGGREGATIONS[table]["levels"]:
+            statements.append(
+                f"-- {table}: {level} rollup\n"
+                + create_view_sql(table, level, parent_level)
+            )
+            statements.append(create_policy_sql(table, level))
+            parent_level = level
+    return "\n\n".join(statements) + "\n"
+
+
+def drop_sql(tables):
+    """Drop statements for the given tables, coarsest level first"""
+    statements = []
+    for table in tables:
+        for level in reversed(METRIC_AGGREGATIONS[table]["levels"]):
+            statements.append(
+                f"DROP MATERIALIZED VIEW IF EXISTS {view_name(table, level)} CASCADE;"
+            )
+    return "\n".join(statements) + "\n"
+
+
+def setup_aggregations(conn, tables):
+    """Create the rollups and refresh policies"""
+    try:
+        with conn.cursor() as cursor:
+            for table in tables:
+                parent_level = None
+                for level in METRIC_AGGREGATIONS[table]["levels"]:
+                    cursor.execute(create_view_sql(table, level, parent_level))
+                    cursor.execute(create_policy_sql(table, level))
+                    parent_level = level
+                print(
+                    f"Created {table} rollups: "
+                    f"{', '.join(METRIC_AGGREGATIONS[table]['levels'])}"
+                )
+    except Exception as e:
+        print(f"Error setting up aggregations: {e}")
+        sys.exit(1)
+
+
+def refresh_aggregations(conn, tables, start_date=None, end_date=None):
+    """Refresh every level of the given tables in dependency order"""
+    try:
+        with conn.cursor() as cursor:
+            for table in tables:
+                for level in METRIC_AGGREGATIONS[table]["levels"]:
+                    name = view_name(table, level)
+                    print(f"Refreshing {name}")
+                    cursor.execute(
+                        "CALL refresh_continuous_aggregate(%s, %s, %s)",
+                        (name, start_date, end_date),
+                    )
+        print("Refresh complete")
+    except Exception as e:
+        print(f"Error refreshing aggregations: {e}")
+        sys.exit(1)
+
+
+def drop_aggregations(conn, tables):
+    """Remove the rollups (and with them their policies)"""
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(drop_sql(tables))
+        print(f"Dropped rollups for {', '.join(tables)}")
+    except Exception as e:
+        print(f"Error dropping aggregations: {e}")
+        sys.exit(1)
+
+
+def parse_date(value, label):
+    try:
+        return datetime.datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        print(f"Error: {label} date must be in format YYYY-MM-DD")
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Manage TimescaleDB rollups for the non heart rate metrics"
+    )
+    parser.add_argument(
+        "--table",
+        action="append",
+        choices=sorted(METRIC_AGGREGATIONS),
+        help="Limit the command to one table (repeatable, default: all)",
+    )
+
+    subparsers = parser.add_subparsers(dest="command", help="Command to execute")
+    subparsers.add_parser("sql", help="Print the setup SQL without executing it")
+    subparsers.add_parser("setup", help="Create rollups and refresh policies")
+    refresh_parser = subparsers.add_parser("refresh", help="Refresh rollups")
+    refresh_parser.add_argument("--start", type=str, help="Start date (YYYY-MM-DD)")
+    refresh_parser.add_argument("--end", type=str, help="End date (YYYY-MM-DD)")
+    subparsers.add_parser("drop", help="Drop rollups")
+
+    args = parser.parse_args()
+    tables = args.table or list(METRIC_AGGREGATIONS)
+
+    if args.command == "sql":
+        print(generate_sql(tables))
+        return
+    if args.command is None:
+        parser.print_help()
+        return
+
+    conn = get_db_connection()
+    try:
+        if args.command == "setup":
+            setup_aggregations(conn, tables)
+        elif args.command == "refresh":
+            start_date = parse_date(args.start, "Start") if args.start else None
+            end_date = parse_date(args.end, "End") if args.end else None
+            refresh_aggregations(conn, tables, start_date, end_date)
+        elif args.command == "drop":
+            drop_aggregations(conn, tables)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
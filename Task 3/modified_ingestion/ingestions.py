@@ -83,49 +83,123 @@ def initialize_database(db_conn):
         db_conn.conn.rollback()
         return False
 
+# Bucket width of each heart rate continuous aggregate level
+HEART_RATE_LEVEL_WIDTHS = {
+    "1m": timedelta(minutes=1),
+    "1h": timedelta(hours=1),
+    "1d": timedelta(days=1),
+    "1w": timedelta(days=7),
+    "1mo": timedelta(days=30),
+}
+# Default origin of time_bucket for timestamps (a Monday)
+TIME_BUCKET_ORIGIN = datetime(2000, 1, 3)
+
+# Continuous aggregate rollups created by db_optimizations/metric_aggregations,
+# as (table, levels finest first) per ingested metric type
+METRIC_ROLLUPS = {
+    "heart_rate": [("heart_rate_zones", ["1d"])],
+    "spo2": [("spo2", ["1m", "1h", "1d"])],
+    "hrv": [("hrv", ["1m", "1h", "1d"])],
+    "active_zone_minutes": [("active_zone_minutes", ["1m", "1h", "1d"])],
+    "breathing_rate": [("breathing_rate", ["1d"])],
+    "activity": [("activity", ["1d"])],
+}
+
+
+def refresh_metric_rollups(db, metric_type, start_date, end_date):
+    """Refresh the metric_aggregations rollups covering the ingested days"""
+    rollups = METRIC_ROLLUPS.get(metric_type, [])
+    if not rollups:
+        return
+
+    # Whole days, so the window lines up with every 1m/1h/1d bucket
+    window_start = convert_to_utc(start_date).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+    window_end = convert_to_utc(end_date).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    ) + timedelta(days=1)
+
+    # refresh_continuous_aggregate cannot run inside a transaction
+    db.conn.commit()
+    db.conn.autocommit = True
+    try:
+        with db.conn.cursor() as cursor:
+            for table, levels in rollups:
+                for level in levels:
+                    view = f"{table}_{level}"
+                    try:
+                        cursor.execute(
+                            "CALL refresh_continuous_aggregate(%s, %s, %s)",
+                            (view, window_start, window_end),
+                        )
+                        logger.info(
+                            f"Refreshed {view} for {window_start} to {window_end}"
+                        )
+                    except psycopg2.Error as e:
+                        # Rollups are optional; skip the rest of this hierarchy
+                        logger.warning(f"Could not refresh {view}: {e}")
+                        break
+    finally:
+        db.conn.autocommit = False
+
+
+def bucket_aligned_window(start, end, width):
+    """Widen [start, end) outward to whole time_bucket buckets of the given width"""
+    window_start = start - (start - TIME_BUCKET_ORIGIN) % width
+    end_remainder = (end - TIME_BUCKET_ORIGIN) % width
+    window_end = end - end_remainder + width if end_remainder else end
+    return window_start, window_end
+
+
 def refresh_aggregates_for_metric(db, metric_type, start_date, end_date, levels=None):
-    """Refresh aggregates with special handling for continuous aggregates"""
+    """Refresh the heart rate continuous aggregates for the ingested days.
+
+    Each level only recomputes the buckets overlapping the ingested range, so the
+    cost follows the size of the ingest rather than the total history.
+    """
     if not db or not hasattr(db, 'conn'):
         logger.error("Invalid DB connection")
         raise ValueError("Valid DB connection required")
 
-    start_dt = convert_to_utc(start_date)
-    end_dt = convert_to_utc(end_date)
-    
     metric_levels = {
         "heart_rate": ["1m", "1h", "1d", "1w", "1mo"],
-        # ... other metrics ...
     }
     levels = levels or metric_levels.get(metric_type, [])
 
-    try:
-        # Handle continuous aggregate separately (needs autocommit)
-        if "1m" in levels and metric_type == "heart_rate":
-            logger.debug("Refreshing continuous aggregate (special handling)")
-            with db.conn.cursor() as cursor:
-                # Ensure autocommit is enabled for this operation
-                db.conn.autocommit = True
-                cursor.execute(
-                    "CALL refresh_continuous_aggregate('heart_rate_1m', %s, %s)",
-                    (start_dt, end_dt)
-                )
-                logger.info("Successfully refreshed heart_rate_1m")
-                db.conn.autocommit = False  # Reset to original state
+    if levels:
+        # Whole ingested days, widened per level to whole buckets below
+        day_start = convert_to_utc(start_date).replace(
+            hour=0, minute=0, second=0, microsecond=0
+        )
+        day_end = convert_to_utc(end_date).replace(
+            hour=0, minute=0, second=0, microsecond=0
+        ) + timedelta(days=1)
 
-        # Handle materialized views in a transaction
-        other_levels = [l for l in levels if l != "1m"]
-        if other_levels:
+        # refresh_continuous_aggregate cannot run inside a transaction
+        db.conn.commit()
+        db.conn.autocommit = True
+        try:
             with db.conn.cursor() as cursor:
-                for level in other_levels:
-                    logger.debug(f"Refreshing materialized view heart_rate_{level}")
-                    cursor.execute(f"REFRESH MATERIALIZED VIEW heart_rate_{level}")
-                db.conn.commit()
-                logger.info(f"Refreshed materialized views: {other_levels}")
+                # Levels are refreshed finest first since each one reads the level below
+                for level in levels:
+                    window_start, window_end = bucket_aligned_window(
+                        day_start, day_end, HEART_RATE_LEVEL_WIDTHS[level]
+                    )
+                    cursor.execute(
+                        "CALL refresh_continuous_aggregate(%s, %s, %s)",
+                        (f"heart_rate_{level}", window_start, window_end),
+                    )
+                    logger.info(
+                        f"Refreshed heart_rate_{level} for {window_start} to {window_end}"
+                    )
+        except Exception as e:
+            logger.error(f"Refresh failed: {e}")
+            raise
+        finally:
+            db.conn.autocommit = False
 
-    except Exception as e:
-        logger.error(f"Refresh failed: {e}")
-        db.conn.rollback()
-        raise
+    refresh_metric_rollups(db, metric_type, start_date, end_date)
 
 # Add UTC conversion utilities
 def convert_to_utc(timestamp_input) -> datetime: